@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from models import IndexedFile
+from frecency import bump_frecency
+
+# ---------------------------------------------------------------------------
+# Buffered file-access log
+# ---------------------------------------------------------------------------
+#
+# Opening a file used to cost a lookup and a commit on the request path.
+# Opens are now only appended to an in-process buffer; a scheduler job
+# (file_search.flush_file_access, every ACCESS_FLUSH_SECONDS) writes them in
+# one transaction: one SELECT per user and key kind, then last_accessed and
+# frecency for every touched row.  Each Gunicorn worker has its own buffer,
+# so "recently accessed" may lag an open by up to one flush interval.
+
+ACCESS_FLUSH_SECONDS = 5
+
+# Opens of the same file kept per interval; more only add to the same score.
+MAX_EVENTS_PER_FILE = 32
+
+# Past this many buffered files, new opens are dropped until the next flush.
+MAX_BUFFERED_FILES = 10000
+
+_KEY_COLUMNS = {
+    "filepath": IndexedFile.filepath,
+    "cloud_file_id": IndexedFile.cloud_file_id,
+    "id": IndexedFile.id,
+}
+
+_lock = threading.Lock()
+_pending = defaultdict(list)   # (user_id, kind, value) -> [epoch seconds]
+
+
+def record_access(user_id, data):
+    """Buffer one open described by a /file/access body.  Returns False
+    when the body names no file."""
+    for kind in ("filepath", "cloud_file_id", "id"):
+        if data.get(kind):
+            value = data[kind]
+            break
+    else:
+        return False
+    if kind == "id":
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return False
+    key = (user_id, kind, value)
+    with _lock:
+        if key in _pending or len(_pending) < MAX_BUFFERED_FILES:
+            events = _pending[key]
+            if len(events) < MAX_EVENTS_PER_FILE:
+                events.append(time.time())
+        else:
+            logging.warning("Access log buffer full — dropping an access event")
+    return True
+
+
+def flush_access_events(session):
+    """Write buffered opens and return {user_id: {filepath: frecency}} for
+    the rows that changed, so the caller can update the search index."""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, defaultdict(list)
+    if not pending:
+        return {}
+
+    grouped = defaultdict(dict)   # (user_id, kind) -> {value: [times]}
+    for (user_id, kind, value), events in pending.items():
+        grouped[(user_id, kind)][value] = events
+
+    updated = defaultdict(dict)
+    try:
+        for (user_id, kind), by_value in grouped.items():
+            column = _KEY_COLUMNS[kind]
+            rows = session.query(IndexedFile).filter(
+                IndexedFile.user_id == user_id, column.in_(list(by_value))
+            ).all()
+            for row in rows:
+                events = by_value.get(getattr(row, kind))
+                if not events:
+                    continue
+                frecency = row.frecency
+                for ts in events:
+                    frecency = bump_frecency(frecency, ts)
+                row.frecency = frecency
+                row.last_accessed = datetime.utcfromtimestamp(max(events))
+                updated[user_id][row.filepath] = frecency
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logging.error(f"Access log flush failed, {len(pending)} files dropped: {e}")
+        return {}
+    return updated
@@ -111,7 +111,15 @@ def create_es_index():
                             "storage_type": {"type": "keyword"},
                             "user_id": {"type": "integer"},
                             "is_folder": {"type": "boolean"},
-                            "is_favorite": {"type": "boolean"}
+                            "is_favorite": {"type": "boolean"},
+                            "file_content": {"type": "text"},
+                            "width": {"type": "integer"},
+                            "height": {"type": "integer"},
+                            "taken_at": {"type": "date"},
+                            "camera": {"type": "text"},
+                            "has_gps": {"type": "boolean"},
+                            "duration": {"type": "float"},
+                            "frecency": {"type": "double"}
                         }
                     }
                 }
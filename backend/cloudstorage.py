@@ -8,6 +8,7 @@ from datetime import datetime
 from flask import Blueprint, request, jsonify, redirect, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
 from models import db, CloudStorageAccount, IndexedFile
+from oauth_tokens import expires_soon, refresh_in_background, token_expiry
 from elasticsearch import Elasticsearch, helpers
 from flask_cors import CORS
 from sqlalchemy.orm import scoped_session, sessionmaker
@@ -42,46 +43,6 @@ DROPBOX_TOKEN_URL = "https://api.dropbox.com/oauth2/token"
 
 AUTO_SYNC_INTERVAL = 600  # seconds
 
-# --------------------------
-# Helper Functions for Token Refresh
-# --------------------------
-
-def refresh_access_token(refresh_token):
-    """Refresh Google OAuth Access Token using the stored refresh token."""
-    data = {
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
-        "refresh_token": refresh_token,
-        "grant_type": "refresh_token",
-    }
-    try:
-        response = requests.post(TOKEN_URL, data=data)
-        response_data = response.json()
-        if "access_token" in response_data:
-            return response_data["access_token"]
-        return None
-    except Exception as e:
-        print(f"Error refreshing Google token: {e}")
-        return None
-
-def refresh_dropbox_access_token(refresh_token):
-    """Refresh Dropbox Access Token using the stored refresh token."""
-    data = {
-        "client_id": DROPBOX_CLIENT_ID,
-        "client_secret": DROPBOX_CLIENT_SECRET,
-        "refresh_token": refresh_token,
-        "grant_type": "refresh_token",
-    }
-    try:
-        response = requests.post(DROPBOX_TOKEN_URL, data=data)
-        response_data = response.json()
-        if "access_token" in response_data:
-            return response_data["access_token"]
-        return None
-    except Exception as e:
-        print(f"Error refreshing Dropbox token: {e}")
-        return None
-
 # --------------------------
 # Callback Endpoints
 # --------------------------
@@ -162,6 +123,9 @@ def google_callback():
     if existing_account:
         existing_account.access_token = tokens["access_token"]
         existing_account.refresh_token = tokens["refresh_token"]
+        existing_account.token_expires_at = token_expiry("Google Drive", tokens)
+        existing_account.token_retry_at = None
+        existing_account.needs_reauth = False
         existing_account.last_synced = datetime.utcnow()
     else:
         new_account = CloudStorageAccount(
@@ -171,6 +135,7 @@ def google_callback():
             permissions="Read files, Search files, Access metadata",
             access_token=tokens["access_token"],
             refresh_token=tokens["refresh_token"],
+            token_expires_at=token_expiry("Google Drive", tokens),
             last_synced=datetime.utcnow()
         )
         db.session.add(new_account)
@@ -229,6 +194,12 @@ def dropbox_callback():
     existing_account = CloudStorageAccount.query.filter_by(user_id=user_id, email=email, provider="Dropbox").first()
     if existing_account:
         existing_account.access_token = tokens["access_token"]
+        # Only issued for token_access_type=offline; keep the old one otherwise.
+        if tokens.get("refresh_token"):
+            existing_account.refresh_token = tokens["refresh_token"]
+        existing_account.token_expires_at = token_expiry("Dropbox", tokens)
+        existing_account.token_retry_at = None
+        existing_account.needs_reauth = False
         existing_account.last_synced = datetime.utcnow()
     else:
         new_account = CloudStorageAccount(
@@ -237,6 +208,8 @@ def dropbox_callback():
             email=email,
             permissions="Read files, Search files",
             access_token=tokens["access_token"],
+            refresh_token=tokens.get("refresh_token"),
+            token_expires_at=token_expiry("Dropbox", tokens),
             last_synced=datetime.utcnow()
         )
         db.session.add(new_account)
@@ -248,7 +221,7 @@ def dropbox_callback():
 
 
 # --------------------------
-# Fetch Connected Cloud Storage Accounts & Refresh Tokens
+# Fetch Connected Cloud Storage Accounts
 # --------------------------
 @cloud_storage_bp.route("/cloud-accounts/<user_id>", methods=["GET"])
 def get_cloud_accounts(user_id):
@@ -257,25 +230,13 @@ def get_cloud_accounts(user_id):
         if not accounts:
             return jsonify({"message": "No cloud accounts found"}), 404
 
-        updated_accounts = []
-        for account in accounts:
-            if account.provider == "Google Drive":
-                new_access_token = refresh_access_token(account.refresh_token)
-                if new_access_token:
-                    account.access_token = new_access_token
-                    account.last_synced = datetime.utcnow()
-                    db.session.commit()
-            elif account.provider == "Dropbox":
-                new_access_token = refresh_dropbox_access_token(account.refresh_token)
-                if new_access_token:
-                    account.access_token = new_access_token
-                    account.last_synced = datetime.utcnow()
-                    db.session.commit()
-            # OneDrive removed
-
-            updated_accounts.append(account.to_dict())
-
-        return jsonify(updated_accounts), 200
+        # Tokens close to expiry are refreshed in the background; the
+        # listing itself never waits on the providers.
+        expiring = [account.id for account in accounts if expires_soon(account)]
+        if expiring:
+            refresh_in_background(current_app._get_current_object(), expiring)
+
+        return jsonify([account.to_dict() for account in accounts]), 200
 
     except Exception as e:
         print(f"Error fetching cloud accounts: {e}")
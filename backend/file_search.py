@@ -1,10 +1,10 @@
-import os, io, logging, threading, time, psutil, urllib.parse
-from flask import Blueprint, request, jsonify, current_app, send_file, request as flask_request
+import os, io, json, atexit, logging, threading, time, psutil, urllib.parse
+import requests
+from flask import Blueprint, Response, request, jsonify, current_app, send_file, stream_with_context, request as flask_request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, IndexedFile, CloudStorageAccount, User
+from models import db, IndexedFile, CloudStorageAccount, StorageUsage, User
 from elasticsearch import Elasticsearch, helpers
 from flask_cors import CORS
-from googleapiclient.http import MediaIoBaseDownload
 from googleapiclient.discovery import build, build_from_document
 from google.oauth2.credentials import Credentials
 from datetime import datetime, timezone
@@ -14,6 +14,11 @@ from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy import or_
 from sqlalchemy.dialects.postgresql import insert
 from werkzeug.utils import secure_filename
+from access_log import ACCESS_FLUSH_SECONDS, flush_access_events, record_access
+from frecency import frecency_function_score
+import provider_clients
+from oauth_tokens import TOKEN_REFRESH_SECONDS, fresh_access_token, refresh_expiring_tokens
+from provider_clients import DRIVE_FILES_URL
 
 # Elasticsearch Setup
 ELASTICSEARCH_URL = os.getenv("ELASTICSEARCH_URL", "http://localhost:9200")
@@ -100,6 +105,11 @@ def start_auto_sync_threads(app):
     scheduler.add_job(func=auto_index_local_storage, args=[app], trigger="interval", minutes=10, id="local_sync", replace_existing=True, next_run_time=now)
     scheduler.add_job(func=auto_index_google_drive, args=[app], trigger="interval", minutes=10, id="gdrive_sync", replace_existing=True, next_run_time=now)
     scheduler.add_job(func=auto_index_dropbox, args=[app], trigger="interval", minutes=10, id="dropbox_sync", replace_existing=True, next_run_time=now)
+    scheduler.add_job(func=flush_file_access, args=[app], trigger="interval", seconds=ACCESS_FLUSH_SECONDS, id="access_flush", replace_existing=True, max_instances=1, coalesce=True)
+    scheduler.add_job(func=refresh_expiring_tokens, args=[app], trigger="interval", seconds=TOKEN_REFRESH_SECONDS, id="token_refresh", replace_existing=True, max_instances=1, coalesce=True, next_run_time=now)
+    scheduler.add_job(func=reconcile_storage_usage, args=[app], trigger="interval", hours=1, id="storage_usage_reconcile", replace_existing=True, max_instances=1, coalesce=True)
+    # Opens still buffered at shutdown are written on the way out.
+    atexit.register(flush_file_access, app)
     
     scheduler.start()
     print("📂 Local storage, ☁️ Google Drive, and 📦 Dropbox auto-sync scheduled (every 10m).")
@@ -290,9 +300,8 @@ def auto_index_dropbox(app):
         db.session.remove()  # ✅ Prevent memory leaks
 
 def get_dropbox_access_token(account_id):
-    """Fetch the access token for a specific Dropbox account."""
-    account = CloudStorageAccount.query.filter_by(id=account_id, provider="Dropbox").first()
-    return account.access_token if account else None
+    """Fetch the access token for a specific Dropbox account, refreshed first if it is about to expire."""
+    return fresh_access_token(db.session, account_id, "Dropbox")
 
 def fetch_dropbox_files(dbx, path=""):
     """Recursively fetch files from Dropbox."""
@@ -371,7 +380,6 @@ def sync_dropbox(account_id, user_id):
                         "mime_type": file.content_hash,
                         "filetype": file_type,  # Update filetype based on file extension
                         "last_modified": last_modified,
-                        "is_favorite": False  # Default to False for updated entries
                     }
                 )
 
@@ -392,6 +400,7 @@ def sync_dropbox(account_id, user_id):
 
         finally:
             session.remove()
+            provider_clients.invalidate_account(account_id)
 
 
 def run_with_app_context(app, func, *args):
@@ -471,6 +480,135 @@ def extract_text_from_file(file_obj, filetype: str) -> str:
     return ""
 
 
+# ---------------------------------------------------------------------------
+# Content-addressed extraction cache
+# ---------------------------------------------------------------------------
+
+# Bump when extract_text_from_file output changes so cached text is re-parsed.
+EXTRACTOR_VERSION = 1
+
+# Upper bound on the text held in the extraction_cache table.
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def compute_content_hash(file_obj) -> str:
+    """Stream a file object through SHA-256 and rewind it."""
+    import hashlib
+    digest = hashlib.sha256()
+    while True:
+        chunk = file_obj.read(HASH_CHUNK_BYTES)
+        if not chunk:
+            break
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def extract_text_cached(session, file_obj, filetype: str):
+    """
+    Return (content_hash, text) for a file object, parsing it only if the
+    same bytes have not been extracted before by any ingest path.
+    """
+    from models import ExtractionCache
+
+    content_hash = compute_content_hash(file_obj)
+    cached = session.get(ExtractionCache, content_hash)
+    if cached and cached.extractor_version == EXTRACTOR_VERSION:
+        cached.last_used = datetime.utcnow()
+        return content_hash, cached.text
+
+    text = extract_text_from_file(file_obj, filetype)
+    file_obj.seek(0)
+    stmt = insert(ExtractionCache).values(
+        content_hash=content_hash,
+        extractor_version=EXTRACTOR_VERSION,
+        text=text,
+        nbytes=len(text.encode("utf-8")),
+        last_used=datetime.utcnow(),
+    ).on_conflict_do_update(
+        index_elements=["content_hash"],
+        set_={
+            "extractor_version": EXTRACTOR_VERSION,
+            "text": text,
+            "nbytes": len(text.encode("utf-8")),
+            "last_used": datetime.utcnow(),
+        },
+    )
+    session.execute(stmt)
+    return content_hash, text
+
+
+def evict_extraction_cache(session):
+    """Delete least-recently-used cache rows beyond EXTRACTION_CACHE_MAX_BYTES."""
+    from sqlalchemy import text as sql_text
+    session.execute(sql_text("""
+        DELETE FROM extraction_cache WHERE content_hash IN (
+            SELECT content_hash FROM (
+                SELECT content_hash,
+                       SUM(nbytes) OVER (ORDER BY last_used DESC) AS running_bytes
+                FROM extraction_cache
+            ) ranked
+            WHERE running_bytes > :cap
+        )
+    """), {"cap": EXTRACTION_CACHE_MAX_BYTES})
+
+
+def keep_user_state(session, user_id, es_docs):
+    """Copy is_favorite and frecency from PostgreSQL into ES docs about to
+    be re-indexed; a full re-index replaces the whole doc and would
+    otherwise reset them."""
+    paths = [doc["filepath"] for doc in es_docs]
+    if not paths:
+        return
+    state = {
+        filepath: (is_favorite, frecency)
+        for filepath, is_favorite, frecency in session.query(
+            IndexedFile.filepath, IndexedFile.is_favorite, IndexedFile.frecency
+        ).filter(
+            IndexedFile.user_id == user_id,
+            IndexedFile.filepath.in_(paths),
+            or_(IndexedFile.is_favorite.is_(True), IndexedFile.frecency.isnot(None)),
+        )
+    }
+    for doc in es_docs:
+        if doc["filepath"] in state:
+            is_favorite, frecency = state[doc["filepath"]]
+            doc["is_favorite"] = bool(is_favorite)
+            if frecency is not None:
+                doc["frecency"] = frecency
+
+
+def update_es_docs(user_id, fields_by_path):
+    """Partially update ES docs by filepath with bulk ``update`` actions.
+
+    Most docs use the filepath as their _id; the rest (older id schemes)
+    are caught with one update_by_query."""
+    if not fields_by_path or not es or not check_elasticsearch():
+        return
+    actions = [
+        {"_op_type": "update", "_index": "file_index", "_id": path, "doc": fields}
+        for path, fields in fields_by_path.items()
+    ]
+    _, errors = helpers.bulk(es, actions, raise_on_error=False, stats_only=False)
+    missed = [e["update"]["_id"] for e in errors if e.get("update", {}).get("status") == 404]
+    if len(errors) > len(missed):
+        logging.warning(f"ES partial update: {len(errors) - len(missed)} docs failed")
+    if missed:
+        es.update_by_query(index="file_index", body={
+            "query": {"bool": {"filter": [
+                {"term": {"user_id": user_id}},
+                {"terms": {"filepath": missed}},
+            ]}},
+            "script": {
+                "source": "for (e in params.fields[ctx._source.filepath].entrySet()) "
+                          "{ ctx._source[e.getKey()] = e.getValue(); }",
+                "params": {"fields": {path: fields_by_path[path] for path in missed}},
+            },
+        })
+
+
 def index_files_worker(user_id, base_directory):
     """Index all folders and files recursively in a given drive/directory with prefix search support."""
     from app import app
@@ -509,6 +647,7 @@ def index_files_worker(user_id, base_directory):
 
                 # Bulk index in Elasticsearch
                 if es_batch and es and check_elasticsearch():
+                    keep_user_state(session, user_id, es_batch)
                     for doc in es_batch:
                         if "_id" in doc:
                             del doc["_id"]
@@ -610,9 +749,8 @@ from sqlalchemy.dialects.postgresql import insert
 
 
 def get_access_token(account_id):
-    """Fetch the access token for a specific Google Drive account."""
-    account = CloudStorageAccount.query.filter_by(id=account_id, provider="Google Drive").first()
-    return account.access_token if account else None
+    """Fetch the access token for a specific Google Drive account, refreshed first if it is about to expire."""
+    return fresh_access_token(db.session, account_id, "Google Drive")
 
 def get_file_type_from_mime(mime_type):
     """Map MIME type to a simplified file type (e.g., 'pdf', 'image', 'docx', etc.)"""
@@ -713,7 +851,6 @@ def sync_google_drive(account_id, user_id):
                         "mime_type": mime_type,
                         "filetype": file_type,  # Correct column name
                         "last_modified": last_modified,
-                        "is_favorite": False  # Default to False for updated entries
                     }
                 )
                 
@@ -735,6 +872,7 @@ def sync_google_drive(account_id, user_id):
 
         finally:
             session.remove()
+            provider_clients.invalidate_account(account_id)
 
 
 def sync_gmail_attachments(account_id, user_id):
@@ -926,6 +1064,11 @@ def sync_agent_files():
 
     # Upsert into PostgreSQL
             filesize = file.get("filesize")
+            # Text snippet extracted by the agent (documents and code only)
+            file_content = (file.get("file_content") or "")[:MAX_CONTENT_SNIPPET]
+            content_hash = (file.get("content_hash") or None)
+            if content_hash:
+                content_hash = content_hash[:64]
 
             # Upsert into PostgreSQL
             stmt = insert(IndexedFile).values(
@@ -937,6 +1080,7 @@ def sync_agent_files():
                 storage_type="local",
                 is_favorite=False,
                 filesize=filesize,
+                content_hash=content_hash,
                 last_modified=last_modified
             ).on_conflict_do_update(
                 index_elements=["filepath"],
@@ -945,13 +1089,14 @@ def sync_agent_files():
                     "filename": filename,
                     "filetype": filetype,
                     "filesize": filesize,
+                    "content_hash": content_hash,
                     "last_modified": last_modified,
                 }
             )
             session.execute(stmt)
 
             # Prepare Elasticsearch Payload
-            es_docs.append({
+            es_doc = {
                 "id": filepath,
                 "user_id": user_id,
                 "filename": filename,
@@ -963,7 +1108,14 @@ def sync_agent_files():
                 "is_favorite": False,
                 "filesize": filesize,
                 "last_modified": last_modified.isoformat() if last_modified else None
-            })
+            }
+            if file_content:
+                es_doc["file_content"] = file_content
+            media = file.get("media") or {}
+            for key in ("width", "height", "taken_at", "camera", "has_gps", "duration"):
+                if media.get(key) is not None:
+                    es_doc[key] = media[key]
+            es_docs.append(es_doc)
 
         # Commit all records to PostgreSQL
         try:
@@ -977,6 +1129,7 @@ def sync_agent_files():
         # Push to Elasticsearch
         if es_docs and es and check_elasticsearch():
             try:
+                keep_user_state(session, user_id, es_docs)
                 for doc in es_docs:
                     if "_id" in doc:
                         del doc["_id"]
@@ -1066,7 +1219,7 @@ def upload_and_index():
             if len(filepath) > 512:
                 filepath = f"upload://{user_id}/{filename}"
 
-            content_snippet = extract_text_from_file(f.stream, filetype)
+            content_hash, content_snippet = extract_text_cached(session, f.stream, filetype)
             mime_type = f.mimetype or None
 
             db_rows.append({
@@ -1077,6 +1230,7 @@ def upload_and_index():
                 "filetype": filetype[:500],
                 "storage_type": "local_upload",
                 "mime_type": (mime_type[:1024] if mime_type else None),
+                "content_hash": content_hash,
                 "last_modified": datetime.now(timezone.utc),
                 "is_favorite": False,
             })
@@ -1105,14 +1259,17 @@ def upload_and_index():
                     "filetype": row["filetype"],
                     "storage_type": row["storage_type"],
                     "mime_type": row["mime_type"],
+                    "content_hash": row["content_hash"],
                     "last_modified": row["last_modified"],
                 },
             )
             session.execute(stmt)
 
+        evict_extraction_cache(session)
         session.commit()
 
         if es and check_elasticsearch():
+            keep_user_state(session, user_id, es_docs)
             helpers.bulk(
                 es,
                 [
@@ -1298,6 +1455,15 @@ def search_files():
                             "boost": 0.5
                         }
                     }
+                },
+                # 6. Camera (from photo EXIF)
+                {
+                    "match": {
+                        "camera": {
+                            "query": query,
+                            "boost": 0.5
+                        }
+                    }
                 }
             ]
 
@@ -1351,6 +1517,9 @@ def search_files():
                 "range": {"filesize": size_range}
             })
 
+        # Often-opened files rank higher (see frecency.py).
+        es_query["query"] = frecency_function_score(es_query["query"])
+
         es_results = es.search(index="file_index", body=es_query)
         for hit in es_results["hits"]["hits"]:
             doc = hit["_source"]
@@ -1406,7 +1575,8 @@ def search_files():
             if size_max is not None:
                 filters.append(IndexedFile.filesize <= size_max)
 
-            db_files = session.query(IndexedFile).filter(*filters).all()
+            db_files = session.query(IndexedFile).filter(*filters)\
+                .order_by(IndexedFile.frecency.desc().nullslast()).all()
             session.remove()
 
             for file in db_files:
@@ -1483,23 +1653,14 @@ def open_file():
 
         elif storage_type == "dropbox":
             # Use Dropbox preview link or create a shared link
-            account = CloudStorageAccount.query.filter_by(user_id=user_id, provider="Dropbox").first()
+            account = file_account(file_record, user_id, "Dropbox")
             if not account or not account.access_token:
                 return jsonify({"error": "No linked Dropbox account"}), 400
             
             try:
-                dbx = dropbox.Dropbox(account.access_token)
                 db_path = file_record.filepath.replace("dropbox://", "")
-                
-                # Try to get existing shared link first to avoid creating many links
-                shared_links = dbx.sharing_list_shared_links(path=db_path, direct_only=True).links
-                if shared_links:
-                    dropbox_url = shared_links[0].url
-                else:
-                    # Create a new shared link
-                    res = dbx.sharing_create_shared_link_with_settings(db_path)
-                    dropbox_url = res.url
-                
+                # Reuses an existing shared link rather than creating many.
+                dropbox_url = provider_clients.dropbox_shared_link(account, db_path)
                 return jsonify({"url": dropbox_url})
             except Exception as e:
                 # Fallback to simple preview URL if sharing fails
@@ -1613,6 +1774,85 @@ def sync_dropbox_account():
         logging.error(f"Error starting Dropbox sync (Account {account_id}): {str(e)}")
         return jsonify({"error": "Failed to start Dropbox sync"}), 500
 
+# ---------------------------------------------------------------------------
+# Streaming proxy for cloud downloads
+# ---------------------------------------------------------------------------
+#
+# Cloud files are relayed chunk by chunk as the provider sends them, so a
+# download holds one PROXY_CHUNK_BYTES buffer in the worker, never the file.
+# A client Range header is forwarded and the provider's 206 / Content-Range
+# passed back, so players can seek and browsers can resume.
+
+DROPBOX_DOWNLOAD_URL = "https://content.dropboxapi.com/2/files/download"
+
+PROXY_CHUNK_BYTES = 256 * 1024
+PROXY_CONNECT_TIMEOUT = (10, 60)   # (connect, between bytes) seconds
+
+DRIVE_PERMISSION_DENIED = {
+    "error": "Google Drive permission denied. Please re-connect your Google account in Settings and ensure you grant 'Full Drive' or 'Read-only' access to allow downloads.",
+    "code": "permission_denied"
+}
+
+_PASSTHROUGH_HEADERS = ("Content-Length", "Content-Range", "Accept-Ranges", "ETag", "Last-Modified")
+
+
+def file_account(file_record, user_id, provider):
+    """The account a cloud file was synced from, else the user's first
+    account with that provider."""
+    account = None
+    if file_record.account_id:
+        account = CloudStorageAccount.query.get(file_record.account_id)
+    if not account:
+        account = CloudStorageAccount.query.filter_by(user_id=user_id, provider=provider).first()
+    return account
+
+
+def _upstream_headers(headers):
+    # Raw bytes only, so the relayed Content-Length stays right.
+    headers["Accept-Encoding"] = "identity"
+    client_range = flask_request.headers.get("Range")
+    if client_range:
+        headers["Range"] = client_range
+    return headers
+
+
+def proxy_download(upstream, download_name, mimetype, provider, denied=None):
+    """Relay a streamed provider response to the client as an attachment.
+    denied is the error body for a 401/403 from the provider."""
+    if upstream.status_code not in (200, 206):
+        status = upstream.status_code
+        upstream.close()
+        if status == 416:
+            return jsonify({"error": "Requested range not satisfiable"}), 416
+        if status in (401, 403):
+            return jsonify(denied or {"error": f"{provider} refused the download; re-connect the account in Settings"}), 403
+        if status == 404:
+            return jsonify({"error": f"File no longer exists in {provider}"}), 404
+        return jsonify({"error": f"{provider} download failed ({status})"}), 502
+
+    headers = {name: upstream.headers[name] for name in _PASSTHROUGH_HEADERS if name in upstream.headers}
+    headers["Content-Disposition"] = (
+        f"attachment; filename*=UTF-8''{urllib.parse.quote(download_name)}"
+    )
+
+    def relay():
+        # Closing the upstream also runs when the client disconnects.
+        try:
+            for chunk in upstream.iter_content(chunk_size=PROXY_CHUNK_BYTES):
+                if chunk:
+                    yield chunk
+        finally:
+            upstream.close()
+
+    return Response(
+        stream_with_context(relay()),
+        status=upstream.status_code,
+        headers=headers,
+        mimetype=mimetype,
+        direct_passthrough=True,
+    )
+
+
 @search_bp.route("/download-file", methods=["GET"])
 @jwt_required()
 def download_file():
@@ -1650,49 +1890,33 @@ def download_file():
 
     # For Dropbox
     if file_record.storage_type == "dropbox":
-        account = None
-        if file_record.account_id:
-            account = CloudStorageAccount.query.get(file_record.account_id)
-        if not account:
-            account = CloudStorageAccount.query.filter_by(user_id=user_id, provider="Dropbox").first()
-            
+        account = file_account(file_record, user_id, "Dropbox")
         if not account or not account.access_token:
             return jsonify({"error": "No linked Dropbox account"}), 400
         
         try:
-            dbx = dropbox.Dropbox(account.access_token)
             db_path = file_record.filepath.replace("dropbox://", "")
-            metadata, res = dbx.files_download(db_path)
-            file_stream = io.BytesIO(res.content)
-            return send_file(
-                file_stream,
-                as_attachment=True,
-                download_name=file_record.filename,
-                mimetype=file_record.mime_type or "application/octet-stream"
+            upstream = requests.post(
+                DROPBOX_DOWNLOAD_URL,
+                headers=_upstream_headers({
+                    "Authorization": f"Bearer {account.access_token}",
+                    "Dropbox-API-Arg": json.dumps({"path": db_path}),
+                }),
+                stream=True,
+                timeout=PROXY_CONNECT_TIMEOUT,
             )
+            # mime_type holds Dropbox's content hash, not a MIME type.
+            return proxy_download(upstream, file_record.filename, "application/octet-stream", "Dropbox")
         except Exception as e:
             logging.error(f"Failed to download file from Dropbox: {str(e)}")
             return jsonify({"error": f"Failed to download file from Dropbox: {str(e)}"}), 500
 
     # For Google Drive files, download from Google Drive
     if file_record.storage_type == "google_drive":
-        account = None
-        if file_record.account_id:
-            account = CloudStorageAccount.query.get(file_record.account_id)
-        if not account:
-            account = CloudStorageAccount.query.filter_by(user_id=user_id, provider="Google Drive").first()
-
+        account = file_account(file_record, user_id, "Google Drive")
         if not account:
             return jsonify({"error": "No linked Google Drive account"}), 400
 
-        creds = Credentials(
-            token=account.access_token,
-            refresh_token=account.refresh_token,
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=os.getenv("CLIENT_ID"),
-            client_secret=os.getenv("CLIENT_SECRET")
-        )
-        drive_service = build("drive", "v3", credentials=creds)
         file_id = file_record.cloud_file_id
         mime_type = file_record.mime_type
 
@@ -1712,34 +1936,31 @@ def download_file():
                 else:
                     ext = ".pdf"
                 
-                drive_request = drive_service.files().export_media(fileId=file_id, mimeType=export_mime)
+                # Exports are generated on the fly and cannot be ranged.
+                url = f"{DRIVE_FILES_URL}/{file_id}/export"
+                params = {"mimeType": export_mime}
+                headers = {"Accept-Encoding": "identity"}
                 download_name = file_record.filename
                 if not download_name.lower().endswith(ext):
                     download_name += ext
+                mime_type = export_mime
             else:
-                drive_request = drive_service.files().get_media(fileId=file_id)
+                url = f"{DRIVE_FILES_URL}/{file_id}"
+                params = {"alt": "media"}
+                headers = _upstream_headers({})
                 download_name = file_record.filename
 
-            file_stream = io.BytesIO()
-            downloader = MediaIoBaseDownload(file_stream, drive_request)
-            done = False
-            while not done:
-                _, done = downloader.next_chunk()
-            file_stream.seek(0)
-            return send_file(
-                file_stream,
-                as_attachment=True,
-                download_name=download_name,
-                mimetype=mime_type or "application/octet-stream"
+            # Refreshes an expired access token on its own.
+            upstream = provider_clients.drive_session(account).get(
+                url, params=params, headers=headers, stream=True, timeout=PROXY_CONNECT_TIMEOUT
             )
+            return proxy_download(upstream, download_name, mime_type or "application/octet-stream",
+                                  "Google Drive", denied=DRIVE_PERMISSION_DENIED)
         except Exception as e:
             msg = str(e)
             # Specifically check for permission errors (scope issues)
             if "appNotAuthorizedToFile" in msg or "403" in msg:
-                return jsonify({
-                    "error": "Google Drive permission denied. Please re-connect your Google account in Settings and ensure you grant 'Full Drive' or 'Read-only' access to allow downloads.",
-                    "code": "permission_denied"
-                }), 403
+                return jsonify(DRIVE_PERMISSION_DENIED), 403
                 
             logging.error(f"Failed to download file from Google Drive: {msg}")
             return jsonify({"error": f"Failed to download file from Google Drive: {msg}"}), 500
@@ -1780,27 +2001,37 @@ def preview_file():
                    "sh", "bat", "log", "env", "toml", "ini", "cfg"}
 
     if storage_type in ("local", "local_browser") and filetype in IMAGE_TYPES:
+        if not os.path.isfile(filepath):
+            return jsonify({"preview_type": "none", "filename": filename})
+        # "data" stays an inline data URL: the JWT is a cookie, which an
+        # <img> on another site would not send.  It is built from the cached
+        # thumbnail, not a fresh decode; "thumbnail_url" is the binary copy.
+        from thumbnails import THUMBNAIL_TYPES, get_thumbnail
+        import base64
+        if filetype == "svg":
+            image_path, mimetype = filepath, "image/svg+xml"
+        else:
+            thumb = get_thumbnail(filepath, 800) if filetype in THUMBNAIL_TYPES else None
+            if thumb is None:
+                return jsonify({"preview_type": "none", "filename": filename})
+            image_path, mimetype, _ = thumb
         try:
-            from PIL import Image
-            import base64
-            with Image.open(filepath) as img:
-                img.thumbnail((800, 800))
-                buf = io.BytesIO()
-                fmt = "PNG" if filetype == "png" else "JPEG"
-                img.save(buf, format=fmt)
-                b64 = base64.b64encode(buf.getvalue()).decode()
-                return jsonify({
-                    "preview_type": "image",
-                    "data": f"data:image/{filetype};base64,{b64}",
-                    "filename": filename,
-                    "filetype": filetype,
-                    "filesize": file_record.filesize,
-                    "last_modified": str(file_record.last_modified),
-                    "storage_type": storage_type,
-                })
-        except Exception as e:
+            with open(image_path, "rb") as f:
+                b64 = base64.b64encode(f.read()).decode()
+        except OSError as e:
             logging.error(f"Image preview failed: {e}")
             return jsonify({"preview_type": "none", "filename": filename})
+        encoded_path = urllib.parse.quote(filepath)
+        return jsonify({
+            "preview_type": "image",
+            "data": f"data:{mimetype};base64,{b64}",
+            "thumbnail_url": f"{request.host_url.rstrip('/')}/search/thumbnail?filepath={encoded_path}&size=800",
+            "filename": filename,
+            "filetype": filetype,
+            "filesize": file_record.filesize,
+            "last_modified": str(file_record.last_modified),
+            "storage_type": storage_type,
+        })
 
     # --- Text preview (local files only) ---
     if storage_type in ("local", "local_browser") and filetype in TEXT_TYPES:
@@ -1882,27 +2113,137 @@ def preview_file():
     })
 
 
+@search_bp.route("/thumbnail", methods=["GET"])
+@jwt_required()
+def get_file_thumbnail():
+    """
+    Serve a cached binary thumbnail of a local image.
+    size is rounded up to 128, 256 or 800 px.
+    """
+    from thumbnails import THUMBNAIL_TYPES, get_thumbnail
+
+    user_id = get_jwt_identity()
+    filepath = request.args.get("filepath")
+    if not filepath:
+        return jsonify({"error": "filepath required"}), 400
+
+    file_record = IndexedFile.query.filter_by(
+        filepath=filepath, user_id=user_id
+    ).first()
+    if not file_record or file_record.storage_type not in ("local", "local_browser"):
+        return jsonify({"error": "File not found"}), 404
+
+    filetype = (file_record.filetype or "").lower()
+    if filetype == "svg":
+        return send_file(filepath, mimetype="image/svg+xml", conditional=True)
+    if filetype not in THUMBNAIL_TYPES:
+        return jsonify({"error": "Thumbnail not supported for this file type"}), 415
+
+    thumb = get_thumbnail(filepath, request.args.get("size", type=int))
+    if thumb is None:
+        return jsonify({"error": "Could not generate thumbnail"}), 500
+    thumb_path, mimetype, etag = thumb
+    return send_file(thumb_path, mimetype=mimetype, conditional=True, etag=etag)
+
+
 @search_bp.route('/<string:file_path>/favorite', methods=['POST'])
 @jwt_required()
 def toggle_favorite(file_path):
     user_id = get_jwt_identity()
     file = IndexedFile.query.filter_by(filepath=file_path, user_id=user_id).first()
 
-    
     if not file:
         return jsonify({"error": "File not found"}), 404
 
-    # data = request.get_json()
-    # is_favorite = data.get('is_favorite')
-
-
-
     file.is_favorite = not file.is_favorite
     db.session.commit()
 
+    try:
+        update_es_docs(user_id, {file.filepath: {"is_favorite": file.is_favorite}})
+    except Exception as e:
+        logging.warning(f"Favorite update in Elasticsearch failed (non-fatal): {e}")
+
     return jsonify({"message": "Favorite status updated", "file": file.to_dict()})
 
 
+MAX_FAVORITES_BATCH = 1000
+
+
+@search_bp.route('/favorites', methods=['POST'])
+@jwt_required()
+def set_favorites():
+    """Set is_favorite for many files at once.
+
+    Body: {"ids": [...]} and/or {"filepaths": [...]}, plus "is_favorite"
+    (default true).  One UPDATE changes every row that differs; the changed
+    docs are then patched in ES with bulk partial updates.
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    ids = data.get("ids") or []
+    filepaths = data.get("filepaths") or []
+    is_favorite = bool(data.get("is_favorite", True))
+
+    if not isinstance(ids, list) or not isinstance(filepaths, list) or not (ids or filepaths):
+        return jsonify({"error": "ids or filepaths must be a non-empty list"}), 400
+    if len(ids) + len(filepaths) > MAX_FAVORITES_BATCH:
+        return jsonify({"error": f"At most {MAX_FAVORITES_BATCH} files per request"}), 400
+    try:
+        ids = [int(i) for i in ids]
+    except (TypeError, ValueError):
+        return jsonify({"error": "ids must be integers"}), 400
+
+    matches = []
+    if ids:
+        matches.append(IndexedFile.id.in_(ids))
+    if filepaths:
+        matches.append(IndexedFile.filepath.in_([str(p) for p in filepaths]))
+
+    try:
+        changed = db.session.execute(
+            IndexedFile.__table__.update()
+            .where(IndexedFile.user_id == user_id,
+                   IndexedFile.is_favorite.isnot(is_favorite),
+                   or_(*matches))
+            .values(is_favorite=is_favorite)
+            .returning(IndexedFile.filepath)
+        ).scalars().all()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Batch favorite update failed: {e}")
+        return jsonify({"error": "Failed to update favorites"}), 500
+
+    try:
+        update_es_docs(user_id, {path: {"is_favorite": is_favorite} for path in changed})
+    except Exception as e:
+        logging.warning(f"Favorite update in Elasticsearch failed (non-fatal): {e}")
+
+    return jsonify({"updated": len(changed), "is_favorite": is_favorite}), 200
+
+
+@search_bp.route('/favorites', methods=['GET'])
+@jwt_required()
+def list_favorites():
+    """The user's favorites by name, served from a partial index."""
+    user_id = get_jwt_identity()
+    try:
+        limit = min(max(int(request.args.get("limit", 50)), 1), 200)
+        offset = max(int(request.args.get("offset", 0)), 0)
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+
+    files = IndexedFile.query.filter(
+        IndexedFile.user_id == user_id, IndexedFile.is_favorite == True
+    ).order_by(IndexedFile.filename, IndexedFile.id).offset(offset).limit(limit + 1).all()
+
+    return jsonify({
+        "results": [f.to_dict() for f in files[:limit]],
+        "offset": offset + min(len(files), limit),
+        "has_more": len(files) > limit,
+    }), 200
+
+
 @search_bp.route('/recent-searches', methods=['GET'])
 @jwt_required()
 def get_recent_searches():
@@ -1931,23 +2272,34 @@ def get_recent_searches():
 @jwt_required()
 def log_file_access():
     user_id = get_jwt_identity()
-    data = request.get_json()
-    
-    file = None
-    if data.get('filepath'):
-        file = IndexedFile.query.filter_by(filepath=data['filepath'], user_id=user_id).first()
-    elif data.get('cloud_file_id'):
-        file = IndexedFile.query.filter_by(cloud_file_id=data['cloud_file_id'], user_id=user_id).first()
-    elif data.get('id'):
-        file = IndexedFile.query.filter_by(id=data['id'], user_id=user_id).first()
-        
-    if not file:
-        return jsonify({"error": "File not found"}), 404
-        
-    file.last_accessed = datetime.utcnow()
-    db.session.commit()
-    
-    return jsonify({"message": "Access logged"}), 200
+    data = request.get_json(silent=True) or {}
+
+    # Written in batches by flush_file_access (see access_log.py).
+    if not record_access(user_id, data):
+        return jsonify({"error": "filepath, cloud_file_id or id is required"}), 400
+
+    return jsonify({"message": "Access logged"}), 202
+
+
+def flush_file_access(app):
+    """Scheduler job: write buffered opens, then their frecency to ES."""
+    with app.app_context():
+        updated = flush_access_events(db.session)
+        db.session.remove()
+    if not updated or not es or not check_elasticsearch():
+        return
+    for user_id, frecency in updated.items():
+        try:
+            es.update_by_query(index="file_index", body={
+                "query": {"bool": {"filter": [
+                    {"term": {"user_id": user_id}},
+                    {"terms": {"filepath": list(frecency)}},
+                ]}},
+                "script": {"source": "ctx._source.frecency = params.frecency[ctx._source.filepath]",
+                           "params": {"frecency": frecency}},
+            })
+        except Exception as e:
+            logging.warning(f"Frecency update in Elasticsearch failed (non-fatal): {e}")
 
 
 @search_bp.route('/storage/stats', methods=['GET'])
@@ -1956,36 +2308,31 @@ def get_storage_stats():
     user_id = get_jwt_identity()
     
     stats = {
-        "local": {"connected": True, "count": 0, "status": "Connected"},
-        "google_drive": {"connected": False, "count": 0, "status": "Not Connected"},
-        "dropbox": {"connected": False, "count": 0, "status": "Not Connected"},
-        "gmail": {"connected": False, "count": 0, "status": "Not Connected"}
+        "local": {"connected": True, "count": 0, "bytes": 0, "status": "Connected"},
+        "google_drive": {"connected": False, "count": 0, "bytes": 0, "status": "Not Connected"},
+        "dropbox": {"connected": False, "count": 0, "bytes": 0, "status": "Not Connected"},
+        "gmail": {"connected": False, "count": 0, "bytes": 0, "status": "Not Connected"}
     }
+    stat_keys = {"local": "local", "local_upload": "local", "google_drive": "google_drive", "dropbox": "dropbox"}
     
     try:
-        # Get file counts per storage_type
-        counts = db.session.query(
-            IndexedFile.storage_type, 
-            db.func.count(IndexedFile.id)
-        ).filter(
-            IndexedFile.user_id == user_id,
-            IndexedFile.is_folder == False
-        ).group_by(IndexedFile.storage_type).all()
-        
-        local_count = sum([count for storage_type, count in counts if storage_type in ('local', 'local_upload')])
-        stats["local"]["count"] = local_count
-        
-        gdrive_count = sum([count for storage_type, count in counts if storage_type == 'google_drive'])
-        stats["google_drive"]["count"] = gdrive_count
-        
-        dropbox_count = sum([count for storage_type, count in counts if storage_type == 'dropbox'])
-        stats["dropbox"]["count"] = dropbox_count
+        # Counters are maintained by triggers on indexed_file (see StorageUsage).
+        usage = db.session.query(
+            StorageUsage.storage_type, StorageUsage.file_count, StorageUsage.total_bytes
+        ).filter(StorageUsage.user_id == user_id).all()
+
+        for storage_type, file_count, total_bytes in usage:
+            key = stat_keys.get(storage_type)
+            if key:
+                stats[key]["count"] += file_count
+                stats[key]["bytes"] += total_bytes
         
         # Update connection status based on linked accounts
-        accounts = CloudStorageAccount.query.filter_by(user_id=user_id).all()
+        providers = db.session.query(CloudStorageAccount.provider)\
+            .filter_by(user_id=user_id).distinct().all()
         
-        for account in accounts:
-            provider = account.provider.lower()
+        for (provider,) in providers:
+            provider = provider.lower()
             if 'google' in provider or 'drive' in provider:
                 stats["google_drive"]["connected"] = True
                 stats["google_drive"]["status"] = "Connected"
@@ -2001,6 +2348,128 @@ def get_storage_stats():
         logging.error(f"Error fetching storage stats: {e}")
         return jsonify({"error": "Failed to fetch storage stats"}), 500
 
+
+def _reconcile_user_storage(user_id):
+    """Recount one user's storage_usage rows; returns how many changed."""
+    from sqlalchemy import text as sql_text
+    params = {"user_id": user_id}
+    # Lock first, then count in a fresh (READ COMMITTED) snapshot.
+    stored = {st: (n, b) for st, n, b in db.session.execute(sql_text(
+        "SELECT storage_type, file_count, total_bytes FROM storage_usage "
+        "WHERE user_id = :user_id FOR UPDATE"
+    ), params)}
+    actual = {st: (n, b) for st, n, b in db.session.execute(sql_text(
+        "SELECT storage_type, COUNT(*), COALESCE(SUM(filesize), 0) FROM indexed_file "
+        "WHERE user_id = :user_id AND NOT is_folder GROUP BY storage_type"
+    ), params)}
+
+    fixed = 0
+    for storage_type, (file_count, total_bytes) in actual.items():
+        row = {**params, "storage_type": storage_type, "file_count": file_count, "total_bytes": total_bytes}
+        if storage_type not in stored:
+            # Not locked: a trigger may be creating it right now, so never overwrite.
+            fixed += db.session.execute(sql_text(
+                "INSERT INTO storage_usage (user_id, storage_type, file_count, total_bytes) "
+                "VALUES (:user_id, :storage_type, :file_count, :total_bytes) "
+                "ON CONFLICT (user_id, storage_type) DO NOTHING"
+            ), row).rowcount
+        elif stored[storage_type] != (file_count, total_bytes):
+            db.session.execute(sql_text(
+                "UPDATE storage_usage SET file_count = :file_count, total_bytes = :total_bytes "
+                "WHERE user_id = :user_id AND storage_type = :storage_type"
+            ), row)
+            fixed += 1
+    for storage_type in stored.keys() - actual.keys():
+        db.session.execute(sql_text(
+            "DELETE FROM storage_usage WHERE user_id = :user_id AND storage_type = :storage_type"
+        ), {**params, "storage_type": storage_type})
+        fixed += 1
+    db.session.commit()
+    return fixed
+
+
+def reconcile_storage_usage(app):
+    """Scheduler job: recount storage_usage from indexed_file, fixing any
+    drift in the trigger-maintained counters.
+
+    Each user is recounted in its own transaction while holding their
+    counter rows, so a concurrent write to their files either committed
+    before the count (and is in it) or waits and adds its delta on top."""
+    with app.app_context():
+        fixed = 0
+        try:
+            user_ids = [user_id for (user_id,) in db.session.query(User.id).all()]
+            for user_id in user_ids:
+                try:
+                    fixed += _reconcile_user_storage(user_id)
+                except Exception as e:
+                    db.session.rollback()
+                    logging.error(f"Storage usage reconcile failed for user {user_id}: {e}")
+            if fixed:
+                logging.warning(f"Storage usage reconcile corrected {fixed} counters")
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Storage usage reconcile failed: {e}")
+        finally:
+            db.session.remove()
+
+@search_bp.route('/duplicates', methods=['GET'])
+@jwt_required()
+def get_duplicates():
+    """
+    List groups of identical files (same content_hash), largest waste first.
+
+    Hashes come from the agent's staged duplicate pass and from
+    upload-and-index, both SHA-256 over the file's bytes.  Drive and Dropbox
+    checksums are a different algorithm and are not compared.
+    """
+    user_id = get_jwt_identity()
+    limit = min(request.args.get("limit", 20, type=int), 100)
+    offset = request.args.get("offset", 0, type=int)
+
+    try:
+        copies = db.func.count(IndexedFile.id)
+        size = db.func.max(IndexedFile.filesize)
+        wasted = (copies - 1) * db.func.coalesce(size, 0)
+        base = db.session.query(IndexedFile.content_hash).filter(
+            IndexedFile.user_id == user_id,
+            IndexedFile.is_folder == False,
+            IndexedFile.content_hash.isnot(None),
+        ).group_by(IndexedFile.content_hash).having(copies > 1)
+
+        total_groups = base.count()
+        groups = base.add_columns(copies, size, wasted) \
+            .order_by(wasted.desc(), IndexedFile.content_hash) \
+            .offset(offset).limit(limit).all()
+
+        # Fetch every member of the page's groups in one query.
+        hashes = [g.content_hash for g in groups]
+        members = {}
+        if hashes:
+            for f in IndexedFile.query.filter(
+                IndexedFile.user_id == user_id,
+                IndexedFile.is_folder == False,
+                IndexedFile.content_hash.in_(hashes),
+            ).order_by(IndexedFile.filepath):
+                members.setdefault(f.content_hash, []).append(f.to_dict())
+
+        return jsonify({
+            "groups": [{
+                "content_hash": content_hash,
+                "copies": count,
+                "filesize": filesize,
+                "wasted_bytes": int(waste or 0),
+                "files": members.get(content_hash, []),
+            } for content_hash, count, filesize, waste in groups],
+            "total_groups": total_groups,
+            "offset": offset,
+            "limit": limit,
+            "has_more": offset + limit < total_groups,
+        }), 200
+    except Exception as e:
+        logging.error(f"Error fetching duplicates: {e}")
+        return jsonify({"error": "Failed to fetch duplicates"}), 500
+
 @search_bp.route('/file-details', methods=['GET'])
 @jwt_required()
 def get_file_details():
@@ -2027,20 +2496,9 @@ def get_file_details():
 
     try:
         if file.storage_type == "google_drive" and file.cloud_file_id:
-            account = CloudStorageAccount.query.filter_by(user_id=user_id, provider="Google Drive").first()
+            account = file_account(file, user_id, "Google Drive")
             if account and account.access_token:
-                creds = Credentials(
-                    token=account.access_token,
-                    refresh_token=account.refresh_token,
-                    token_uri="https://oauth2.googleapis.com/token",
-                    client_id=os.getenv("CLIENT_ID"),
-                    client_secret=os.getenv("CLIENT_SECRET")
-                )
-                drive_service = build("drive", "v3", credentials=creds)
-                file_info = drive_service.files().get(
-                    fileId=file.cloud_file_id, 
-                    fields="thumbnailLink, webContentLink, size, owners"
-                ).execute()
+                file_info = provider_clients.drive_file_info(account, file.cloud_file_id)
                 
                 details["preview_url"] = file_info.get("thumbnailLink")
                 if "size" in file_info:
@@ -2053,18 +2511,16 @@ def get_file_details():
                     details["owner"] = file_info["owners"][0].get("displayName", "Me")
 
         elif file.storage_type == "dropbox" and file.cloud_file_id:
-            account = CloudStorageAccount.query.filter_by(user_id=user_id, provider="Dropbox").first()
+            account = file_account(file, user_id, "Dropbox")
             if account and account.access_token:
-                dbx = dropbox.Dropbox(account.access_token)
                 try:
                     # The path in Dropbox API usually starts with /
                     db_path = file.filepath.replace('dropbox://', '')
-                    res = dbx.files_get_temporary_link(db_path)
-                    details["preview_url"] = res.link
+                    info = provider_clients.dropbox_file_info(account, db_path)
+                    details["preview_url"] = info["preview_url"]
                     
-                    meta = dbx.files_get_metadata(db_path)
-                    if hasattr(meta, 'size'):
-                        size_bytes = meta.size
+                    if info["size"] is not None:
+                        size_bytes = info["size"]
                         if size_bytes > 1024 * 1024:
                             details["size"] = f"{size_bytes / (1024 * 1024):.1f} MB"
                         else:
@@ -0,0 +1,56 @@
+import math
+import time
+
+# ---------------------------------------------------------------------------
+# Frecency — how often and how recently a file was opened, as one number
+# ---------------------------------------------------------------------------
+#
+# Each open adds 1 to a score that halves every FRECENCY_HALF_LIFE_DAYS.
+# Instead of the score itself we store the moment at which it would have
+# decayed to exactly 1 ("frecency", epoch seconds):
+#
+#     score(now) = exp(FRECENCY_RATE * (frecency - now))
+#
+# A larger stored value always means a larger score, at any time, so
+# nothing ever has to be re-decayed: an open only rewrites one column, and
+# ranking (Postgres ORDER BY or the Elasticsearch function_score below)
+# reads it as is.
+
+FRECENCY_HALF_LIFE_DAYS = 14
+FRECENCY_RATE = math.log(2) / (FRECENCY_HALF_LIFE_DAYS * 86400)
+
+# Multiplier on a search hit's relevance per unit of log(1 + score):
+# one recent open ≈ ×1.2, ten ≈ ×1.7, and nothing ever opened ×1.
+FRECENCY_BOOST = 0.3
+
+
+def bump_frecency(frecency, now=None):
+    """The stored value after one more open at now (epoch seconds)."""
+    now = time.time() if now is None else now
+    if frecency is None:
+        return now
+    # log(exp(r*(f-now)) + 1) / r + now, computed without overflow.
+    high, low = max(frecency, now), min(frecency, now)
+    return high + math.log1p(math.exp(FRECENCY_RATE * (low - high))) / FRECENCY_RATE
+
+
+def frecency_function_score(query, now=None):
+    """Wrap an Elasticsearch query so hits are boosted by their frecency."""
+    now = time.time() if now is None else now
+    return {
+        "function_score": {
+            "query": query,
+            "functions": [{
+                "filter": {"exists": {"field": "frecency"}},
+                "script_score": {
+                    "script": {
+                        "source": "1 + params.boost * Math.log1p("
+                                  "Math.exp(params.rate * (doc['frecency'].value - params.now)))",
+                        "params": {"boost": FRECENCY_BOOST, "rate": FRECENCY_RATE, "now": now},
+                    }
+                },
+            }],
+            "score_mode": "multiply",
+            "boost_mode": "multiply",
+        }
+    }
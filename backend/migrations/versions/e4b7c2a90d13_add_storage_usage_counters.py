@@ -0,0 +1,84 @@
+"""add storage_usage counters maintained by triggers on indexed_file
+
+Revision ID: e4b7c2a90d13
+Revises: d6a3f1c98e25
+Create Date: 2026-10-19 17:05:33.617290
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7c2a90d13'
+down_revision = 'd6a3f1c98e25'
+branch_labels = None
+depends_on = None
+
+
+# Statement-level triggers see every row a statement touched at once (PG 10+
+# transition tables), so a 2000-row bulk upsert costs one counter upsert per
+# (user, storage type) rather than one per row.  Folders are not counted.
+_APPLY_DELTA = """
+    INSERT INTO storage_usage AS su (user_id, storage_type, file_count, total_bytes)
+    SELECT user_id, storage_type, SUM(n), SUM(b) FROM (
+        {rows}
+    ) AS delta
+    GROUP BY user_id, storage_type
+    HAVING SUM(n) <> 0 OR SUM(b) <> 0
+    ON CONFLICT (user_id, storage_type) DO UPDATE
+        SET file_count = su.file_count + EXCLUDED.file_count,
+            total_bytes = su.total_bytes + EXCLUDED.total_bytes;
+"""
+
+_ADDED = "SELECT user_id, storage_type, 1 AS n, COALESCE(filesize, 0) AS b FROM new_rows WHERE NOT is_folder"
+_REMOVED = "SELECT user_id, storage_type, -1 AS n, -COALESCE(filesize, 0) AS b FROM old_rows WHERE NOT is_folder"
+
+_TRIGGERS = {
+    "INSERT": ("NEW TABLE AS new_rows", _ADDED),
+    "UPDATE": ("OLD TABLE AS old_rows NEW TABLE AS new_rows", f"{_ADDED} UNION ALL {_REMOVED}"),
+    "DELETE": ("OLD TABLE AS old_rows", _REMOVED),
+}
+
+
+def upgrade():
+    op.create_table('storage_usage',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('storage_type', sa.String(length=20), nullable=False),
+    sa.Column('file_count', sa.BigInteger(), nullable=False),
+    sa.Column('total_bytes', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'storage_type')
+    )
+
+    for event, (referencing, rows) in _TRIGGERS.items():
+        name = f"storage_usage_on_{event.lower()}"
+        op.execute(f"""
+            CREATE OR REPLACE FUNCTION {name}() RETURNS trigger AS $$
+            BEGIN
+                {_APPLY_DELTA.format(rows=rows)}
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {name} AFTER {event} ON indexed_file
+            REFERENCING {referencing}
+            FOR EACH STATEMENT EXECUTE PROCEDURE {name}();
+        """)
+
+    # Seed from what is already indexed.
+    op.execute("""
+        INSERT INTO storage_usage (user_id, storage_type, file_count, total_bytes)
+        SELECT user_id, storage_type, COUNT(*), COALESCE(SUM(filesize), 0)
+        FROM indexed_file WHERE NOT is_folder
+        GROUP BY user_id, storage_type;
+    """)
+
+
+def downgrade():
+    for event in _TRIGGERS:
+        name = f"storage_usage_on_{event.lower()}"
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON indexed_file;")
+        op.execute(f"DROP FUNCTION IF EXISTS {name}();")
+    op.drop_table('storage_usage')
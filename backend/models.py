@@ -89,11 +89,23 @@ class IndexedFile(db.Model):
     filesize = db.Column(db.BigInteger, nullable=True)  # File size in bytes
     last_modified = db.Column(db.DateTime, nullable=True)  # Last modified timestamp (for cloud files)
     last_accessed = db.Column(db.DateTime, nullable=True)  # Tracker for Recently Accessed
+    frecency = db.Column(db.Float, nullable=True)  # Open frequency + recency, see frecency.py
 
 
     # Relationship
     account = db.relationship('CloudStorageAccount', backref='indexed_files', lazy=True)
 
+    __table_args__ = (
+        # Duplicate-file report groups a user's files by content hash.
+        db.Index('ix_indexed_file_user_content_hash', 'user_id', 'content_hash'),
+        # "Recently accessed" (empty search) is one range scan of this index.
+        db.Index('ix_indexed_file_user_last_accessed', user_id, last_accessed.desc(),
+                 postgresql_where=last_accessed.isnot(None)),
+        # Favorites listing, in name order; only favourited rows are indexed.
+        db.Index('ix_indexed_file_user_favorite_name', user_id, filename, id,
+                 postgresql_where=is_favorite == True),
+    )
+
     def to_dict(self):
         return {
         "id": self.id,
@@ -120,6 +132,9 @@ class CloudStorageAccount(db.Model):
     email = db.Column(db.String(100), nullable=False)
     access_token = db.Column(db.String(20000), nullable=False)  # Short-lived access token
     refresh_token = db.Column(db.String(1000), nullable=True)  # Store refresh token
+    token_expires_at = db.Column(db.DateTime, nullable=True)  # UTC expiry of access_token
+    token_retry_at = db.Column(db.DateTime, nullable=True)  # No refresh before this (after an error)
+    needs_reauth = db.Column(db.Boolean, nullable=False, default=False)  # Refresh token rejected
     permissions = db.Column(db.Text, nullable=True)
     last_synced = db.Column(db.DateTime, nullable=True)
 
@@ -129,7 +144,8 @@ class CloudStorageAccount(db.Model):
             "provider": self.provider,
             "email": self.email,
             "permissions": self.permissions.split(",") if self.permissions else [],
-            "lastSynced": self.last_synced.isoformat() if self.last_synced else None
+            "lastSynced": self.last_synced.isoformat() if self.last_synced else None,
+            "needsReauth": bool(self.needs_reauth)
         }
 class SearchHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -161,3 +177,33 @@ class IndexingProgress(db.Model):
     __table_args__ = (
         db.UniqueConstraint('user_id', 'source', 'account_id', name='uq_indexing_progress'),
     )
+
+
+class ExtractionCache(db.Model):
+    """Extracted text keyed by the SHA-256 of the file's bytes.
+
+    Shared by every ingest path and every Gunicorn worker, so the same
+    document is parsed once no matter how often (or from where) it arrives.
+    """
+    __tablename__ = "extraction_cache"
+
+    content_hash = db.Column(db.String(64), primary_key=True)
+    extractor_version = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    nbytes = db.Column(db.Integer, nullable=False)
+    last_used = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class StorageUsage(db.Model):
+    """File count and bytes per (user, storage type), for the dashboard.
+
+    Kept current by statement-level triggers on indexed_file (see migration
+    e4b7c2a90d13), so every ingest and deletion path updates it in its own
+    transaction; reconcile_storage_usage() corrects any drift periodically.
+    """
+    __tablename__ = "storage_usage"
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    storage_type = db.Column(db.String(20), primary_key=True)
+    file_count = db.Column(db.BigInteger, nullable=False, default=0)
+    total_bytes = db.Column(db.BigInteger, nullable=False, default=0)
@@ -0,0 +1,208 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+from sqlalchemy import or_, text as sql_text
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from models import db, CloudStorageAccount
+
+# ---------------------------------------------------------------------------
+# Expiry-aware OAuth tokens for linked cloud accounts
+# ---------------------------------------------------------------------------
+#
+# Listing a user's cloud accounts used to refresh every access token, one
+# after another, on each call, while syncs used whatever token was stored.
+# Each account now keeps token_expires_at, and a token is refreshed only
+# once it is within TOKEN_REFRESH_MARGIN of expiring:
+#
+#   - refresh_expiring_tokens (scheduler, every TOKEN_REFRESH_SECONDS) and
+#     the accounts listing hand such accounts to a small thread pool;
+#   - a sync asks fresh_access_token, which refreshes inline if needed.
+#
+# A refresh holds a transaction-level advisory lock on the account, so
+# among all workers only one talks to the provider; the others skip it (in
+# the background) or wait and then read the stored result (for a sync).
+# Accounts without an expiry yet (linked before it was recorded) count as
+# expiring and are refreshed once.
+#
+# A refresh token the provider rejects (revoked, expired) sets needs_reauth
+# and the account is left alone until the user links it again; any other
+# failure only postpones the next attempt by TOKEN_RETRY_BACKOFF.
+
+GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
+DROPBOX_TOKEN_URL = "https://api.dropbox.com/oauth2/token"
+
+TOKEN_REFRESH_SECONDS = 60
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+TOKEN_REQUEST_TIMEOUT = 15
+TOKEN_RETRY_BACKOFF = timedelta(minutes=10)
+
+# Used when the provider's response has no expires_in.
+DEFAULT_TOKEN_LIFETIME = {"Google Drive": 3600, "Dropbox": 4 * 3600}
+
+_REFRESH_WORKERS = 4
+_ADVISORY_LOCK_CLASS = 0x5A58   # first key of pg_*advisory_xact_lock(int, int)
+
+_pool = ThreadPoolExecutor(max_workers=_REFRESH_WORKERS, thread_name_prefix="token-refresh")
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def _client_credentials(provider):
+    if provider == "Dropbox":
+        return DROPBOX_TOKEN_URL, os.getenv("DROPBOX_CLIENT_ID"), os.getenv("DROPBOX_CLIENT_SECRET")
+    return GOOGLE_TOKEN_URL, os.getenv("CLIENT_ID"), os.getenv("CLIENT_SECRET")
+
+
+def token_expiry(provider, tokens, now=None):
+    """When the access token in a token-endpoint response expires (UTC)."""
+    now = now or datetime.utcnow()
+    lifetime = tokens.get("expires_in") or DEFAULT_TOKEN_LIFETIME.get(provider, 3600)
+    return now + timedelta(seconds=int(lifetime))
+
+
+def expires_soon(account, now=None):
+    """True when account's token should be refreshed (and can be)."""
+    now = now or datetime.utcnow()
+    if not account.refresh_token or account.needs_reauth:
+        return False
+    if account.token_retry_at is not None and account.token_retry_at > now:
+        return False
+    if account.token_expires_at is None:
+        return True
+    return account.token_expires_at <= now + TOKEN_REFRESH_MARGIN
+
+
+def _request_token(provider, refresh_token):
+    """POST a refresh_token grant.  Returns (tokens, rejected): tokens is
+    None on failure, and rejected is True when the provider refused the
+    grant itself rather than failing transiently."""
+    url, client_id, client_secret = _client_credentials(provider)
+    try:
+        response = requests.post(url, data={
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "refresh_token": refresh_token,
+            "grant_type": "refresh_token",
+        }, timeout=TOKEN_REQUEST_TIMEOUT)
+        tokens = response.json()
+    except Exception as e:
+        logging.error(f"Error refreshing {provider} token: {e}")
+        return None, False
+    if "access_token" not in tokens:
+        logging.error(f"{provider} token refresh rejected: {tokens.get('error', response.status_code)}")
+        # OAuth errors (invalid_grant, ...) come back as 400 / 401.
+        return None, response.status_code in (400, 401) and "error" in tokens
+    return tokens, False
+
+
+def refresh_account(session, account_id, wait=False):
+    """Refresh one account's access token if it is close to expiring and
+    persist it.  Returns True when this call stored a new token.
+
+    With wait=False an account another worker is already refreshing is
+    skipped; with wait=True the call blocks until that refresh commits."""
+    lock = "pg_advisory_xact_lock" if wait else "pg_try_advisory_xact_lock"
+    try:
+        got = session.execute(
+            sql_text(f"SELECT {lock}(:cls, :id)"), {"cls": _ADVISORY_LOCK_CLASS, "id": account_id}
+        ).scalar()
+        if not wait and not got:
+            session.rollback()
+            return False
+
+        # Re-read under the lock: another worker may have just refreshed it.
+        account = session.get(CloudStorageAccount, account_id, populate_existing=True)
+        if not account or not expires_soon(account):
+            session.rollback()
+            return False
+
+        tokens, rejected = _request_token(account.provider, account.refresh_token)
+        if not tokens:
+            # Recorded so no worker asks again until re-link or backoff.
+            if rejected:
+                account.needs_reauth = True
+                logging.warning(f"⚠️ {account.provider} account {account_id} must be re-linked")
+            else:
+                account.token_retry_at = datetime.utcnow() + TOKEN_RETRY_BACKOFF
+            session.commit()
+            return False
+
+        account.access_token = tokens["access_token"]
+        account.token_retry_at = None
+        # Providers may rotate refresh tokens.
+        if tokens.get("refresh_token"):
+            account.refresh_token = tokens["refresh_token"]
+        account.token_expires_at = token_expiry(account.provider, tokens)
+        session.commit()
+        logging.info(f"🔑 Refreshed {account.provider} token for account {account_id}")
+        return True
+    except Exception as e:
+        session.rollback()
+        logging.error(f"Token refresh failed for account {account_id}: {e}")
+        return False
+
+
+def _refresh_in_own_session(account_id, wait=False):
+    # refresh_account commits or rolls back its session; never the caller's.
+    session = scoped_session(sessionmaker(bind=db.engine))
+    try:
+        return refresh_account(session, account_id, wait=wait)
+    finally:
+        session.remove()
+
+
+def fresh_access_token(session, account_id, provider):
+    """The account's access token, refreshed first if it expires soon.
+    None when there is no such account.  The refresh runs in a session of
+    its own; session is only read from."""
+    account = session.query(CloudStorageAccount).filter_by(id=account_id, provider=provider).first()
+    if not account:
+        return None
+    if expires_soon(account):
+        _refresh_in_own_session(account.id, wait=True)
+        session.refresh(account)
+    return account.access_token
+
+
+def _refresh_job(app, account_id):
+    with app.app_context():
+        try:
+            _refresh_in_own_session(account_id)
+        finally:
+            with _in_flight_lock:
+                _in_flight.discard(account_id)
+
+
+def refresh_in_background(app, account_ids):
+    """Queue refreshes for account_ids on the refresh pool, skipping any
+    this process is already refreshing."""
+    with _in_flight_lock:
+        queued = [a for a in account_ids if a not in _in_flight]
+        _in_flight.update(queued)
+    for account_id in queued:
+        _pool.submit(_refresh_job, app, account_id)
+    return len(queued)
+
+
+def refresh_expiring_tokens(app):
+    """Scheduler job: queue a refresh for every token that expires soon."""
+    with app.app_context():
+        now = datetime.utcnow()
+        try:
+            account_ids = [account_id for (account_id,) in db.session.query(CloudStorageAccount.id).filter(
+                CloudStorageAccount.refresh_token.isnot(None),
+                CloudStorageAccount.needs_reauth.is_(False),
+                or_(CloudStorageAccount.token_retry_at.is_(None),
+                    CloudStorageAccount.token_retry_at <= now),
+                or_(CloudStorageAccount.token_expires_at.is_(None),
+                    CloudStorageAccount.token_expires_at <= now + TOKEN_REFRESH_MARGIN),
+            ).all()]
+        finally:
+            db.session.remove()
+    if account_ids:
+        refresh_in_background(app, account_ids)
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import dropbox
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2.credentials import Credentials
+
+# ---------------------------------------------------------------------------
+# Per-account provider clients and a TTL cache for provider metadata
+# ---------------------------------------------------------------------------
+#
+# Opening a details pane used to build Google credentials and a Drive
+# service (or a new Dropbox client) and then make live API calls on every
+# request.  Clients are now kept per account (rebuilt only when its tokens
+# change), and metadata, thumbnail links and shared links are cached for a
+# few minutes to a day.  sync_google_drive / sync_dropbox drop an account's
+# cached entries, so a resync never serves stale details.
+#
+# Both are per process; each Gunicorn worker warms its own.
+
+GOOGLE_TOKEN_URI = "https://oauth2.googleapis.com/token"
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+
+MAX_CLIENTS = 256
+MAX_CACHED_ITEMS = 10000
+
+# Drive thumbnail links expire after a few hours, Dropbox temporary links
+# after four; shared links do not expire.
+METADATA_TTL = 10 * 60
+TEMPORARY_LINK_TTL = 60 * 60
+SHARED_LINK_TTL = 24 * 60 * 60
+
+
+class _LRU:
+    """A small thread-safe LRU map with optional per-entry expiry."""
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl=None):
+        with self._lock:
+            expires = time.monotonic() + ttl if ttl else None
+            self._items[key] = (value, expires)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def drop(self, match):
+        with self._lock:
+            for key in [k for k in self._items if match(k)]:
+                del self._items[key]
+
+
+_clients = _LRU(MAX_CLIENTS)
+_cache = _LRU(MAX_CACHED_ITEMS)
+
+
+# --------------------------
+# Clients
+# --------------------------
+
+def drive_session(account):
+    """A requests session for the Drive REST API that signs and refreshes
+    with the account's tokens.  Safe to share between threads, unlike a
+    discovery-built Drive service."""
+    key = ("drive", account.id, account.access_token, account.refresh_token)
+    session = _clients.get(key)
+    if session is None:
+        creds = Credentials(
+            token=account.access_token,
+            refresh_token=account.refresh_token,
+            token_uri=GOOGLE_TOKEN_URI,
+            client_id=os.getenv("CLIENT_ID"),
+            client_secret=os.getenv("CLIENT_SECRET"),
+            expiry=account.token_expires_at
+        )
+        session = AuthorizedSession(creds)
+        _clients.drop(lambda k: k[:2] == ("drive", account.id))
+        _clients.put(key, session)
+    return session
+
+
+def dropbox_client(account):
+    """A Dropbox client that can refresh its own token when the account has
+    a refresh token (oauth_tokens normally refreshes it first)."""
+    key = ("dropbox", account.id, account.access_token)
+    client = _clients.get(key)
+    if client is None:
+        if account.refresh_token:
+            client = dropbox.Dropbox(
+                oauth2_access_token=account.access_token,
+                oauth2_access_token_expiration=account.token_expires_at,
+                oauth2_refresh_token=account.refresh_token,
+                app_key=os.getenv("DROPBOX_CLIENT_ID"),
+                app_secret=os.getenv("DROPBOX_CLIENT_SECRET"),
+            )
+        else:
+            client = dropbox.Dropbox(account.access_token)
+        _clients.drop(lambda k: k[:2] == ("dropbox", account.id))
+        _clients.put(key, client)
+    return client
+
+
+# --------------------------
+# Cached lookups
+# --------------------------
+
+def _cached(key, ttl, fetch):
+    value = _cache.get(key)
+    if value is None:
+        value = fetch()
+        _cache.put(key, value, ttl)
+    return value
+
+
+def drive_file_info(account, file_id):
+    """thumbnailLink, webContentLink, size and owners of a Drive file."""
+    def fetch():
+        resp = drive_session(account).get(
+            f"{DRIVE_FILES_URL}/{file_id}",
+            params={"fields": "thumbnailLink, webContentLink, size, owners"},
+            timeout=15,
+        )
+        resp.raise_for_status()
+        return resp.json()
+    return _cached(("drive_info", account.id, file_id), METADATA_TTL, fetch)
+
+
+def dropbox_file_info(account, path):
+    """{"preview_url", "size"} for a Dropbox file: a temporary link and the
+    size from its metadata."""
+    def fetch():
+        dbx = dropbox_client(account)
+        link = dbx.files_get_temporary_link(path).link
+        meta = dbx.files_get_metadata(path)
+        return {"preview_url": link, "size": getattr(meta, "size", None)}
+    return _cached(("dropbox_info", account.id, path), TEMPORARY_LINK_TTL, fetch)
+
+
+def dropbox_shared_link(account, path):
+    """An existing direct shared link for path, or a newly created one."""
+    def fetch():
+        dbx = dropbox_client(account)
+        links = dbx.sharing_list_shared_links(path=path, direct_only=True).links
+        if links:
+            return links[0].url
+        return dbx.sharing_create_shared_link_with_settings(path).url
+    return _cached(("dropbox_link", account.id, path), SHARED_LINK_TTL, fetch)
+
+
+def invalidate_account(account_id):
+    """Forget cached metadata and links for an account (after a sync).
+    account_id may come straight from request JSON, as a string."""
+    account_id = int(account_id)
+    _cache.drop(lambda k: k[1] == account_id)
@@ -0,0 +1,154 @@
+import os, logging, hashlib, threading
+
+# ---------------------------------------------------------------------------
+# Disk-backed thumbnail cache
+# ---------------------------------------------------------------------------
+#
+# Image previews used to decode the full original with PIL and return it as
+# base64 JSON on every request.  Thumbnails are now rendered once per
+# (path, mtime, size, requested size) in a few fixed sizes, stored on disk
+# and served as binary images.  JPEGs are decoded at reduced scale
+# (Image.draft), several times faster than a full decode of a large photo.
+# The directory is capped at THUMBNAIL_CACHE_MAX_BYTES; hits bump a file's
+# mtime and the least recently used files are evicted first.
+#
+# Concurrent requests for one thumbnail render it once per process (a lock
+# per cache key).  Writes are tmp-file + rename, so several Gunicorn workers
+# can share the directory; at worst two workers render the same image.
+#
+# This is the agent's zenxplor-agent/agent/thumbnails.py with a
+# configurable cache directory; keep the two in step.
+
+THUMBNAIL_SIZES = (128, 256, 800)
+THUMBNAIL_TYPES = {"jpg", "jpeg", "png", "gif", "webp", "bmp", "tif", "tiff"}
+
+THUMBNAIL_CACHE_DIR = os.getenv(
+    "THUMBNAIL_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "thumbnail_cache")
+)
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv("THUMBNAIL_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Bump when the output format changes so old thumbnails are not reused.
+THUMBNAIL_VERSION = 1
+
+SWEEP_EVERY = 50      # new thumbnails between eviction sweeps
+EVICT_TARGET = 0.9    # evict down to this fraction of the cap
+
+_state_lock = threading.Lock()
+_inflight = {}      # key -> [lock, waiters]
+_writes_since_sweep = SWEEP_EVERY
+
+
+def pick_thumbnail_size(requested):
+    """Round a requested edge length up to the nearest fixed size."""
+    if not requested:
+        return THUMBNAIL_SIZES[1]
+    for size in THUMBNAIL_SIZES:
+        if requested <= size:
+            return size
+    return THUMBNAIL_SIZES[-1]
+
+
+def _render(src, dest, size):
+    from PIL import Image, ImageOps
+    with Image.open(src) as img:
+        if img.format == "JPEG":
+            # Decode at reduced scale — much faster than a full decode.
+            img.draft("RGB", (size, size))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size))
+        if img.mode in ("RGBA", "LA", "P"):
+            img.save(dest, format="PNG", optimize=True)
+            return "image/png"
+        img.convert("RGB").save(dest, format="JPEG", quality=82)
+        return "image/jpeg"
+
+
+def sweep_thumbnail_cache():
+    """Evict least recently used thumbnails until the cache fits its cap."""
+    entries, total = [], 0
+    if not os.path.isdir(THUMBNAIL_CACHE_DIR):
+        return
+    for sub in os.scandir(THUMBNAIL_CACHE_DIR):
+        if not sub.is_dir():
+            continue
+        for entry in os.scandir(sub.path):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+    if total <= THUMBNAIL_CACHE_MAX_BYTES:
+        return
+    evicted = 0
+    for _, nbytes, path in sorted(entries):
+        if total <= THUMBNAIL_CACHE_MAX_BYTES * EVICT_TARGET:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= nbytes
+        evicted += 1
+    logging.info(f"🧹 Thumbnail cache: evicted {evicted} files")
+
+
+def get_thumbnail(filepath, requested=None):
+    """
+    Return (thumbnail_path, mimetype, etag) for a local image, rendering it
+    on a cache miss.  Returns None if it cannot be thumbnailed.
+    """
+    global _writes_since_sweep
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+
+    size = pick_thumbnail_size(requested)
+    raw = f"{THUMBNAIL_VERSION}\0{filepath}\0{st.st_mtime_ns}\0{st.st_size}\0{size}"
+    key = hashlib.sha1(raw.encode("utf-8", "surrogatepass")).hexdigest()
+    base = os.path.join(THUMBNAIL_CACHE_DIR, key[:2], key)
+
+    with _state_lock:
+        slot = _inflight.setdefault(key, [threading.Lock(), 0])
+        slot[1] += 1
+    try:
+        with slot[0]:
+            for ext, mimetype in ((".jpg", "image/jpeg"), (".png", "image/png")):
+                if os.path.exists(base + ext):
+                    try:
+                        os.utime(base + ext)  # mark as recently used
+                    except OSError:
+                        pass
+                    return base + ext, mimetype, key
+
+            os.makedirs(os.path.dirname(base), exist_ok=True)
+            tmp = f"{base}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                mimetype = _render(filepath, tmp, size)
+                final = base + (".png" if mimetype == "image/png" else ".jpg")
+                os.replace(tmp, final)
+            except Exception as e:
+                logging.error(f"Thumbnail generation failed for {filepath}: {e}")
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+                return None
+    finally:
+        with _state_lock:
+            slot[1] -= 1
+            if slot[1] == 0:
+                _inflight.pop(key, None)
+
+    with _state_lock:
+        _writes_since_sweep += 1
+        sweep = _writes_since_sweep >= SWEEP_EVERY
+        if sweep:
+            _writes_since_sweep = 0
+    if sweep:
+        try:
+            sweep_thumbnail_cache()
+        except OSError as e:
+            logging.warning(f"Thumbnail cache sweep failed: {e}")
+    return final, mimetype, key
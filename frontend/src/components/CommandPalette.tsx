@@ -96,7 +96,7 @@ const CommandPalette: React.FC<CommandPaletteProps> = ({ isOpen, onClose, agentR
         });
         const details = res.data;
         if (details.preview_url === "local_agent_preview" && agentRunning) {
-          details.preview_url = `${AGENT_URL}/preview?filepath=${encodeURIComponent(file.filepath || "")}`;
+          details.preview_url = `${AGENT_URL}/thumbnail?filepath=${encodeURIComponent(file.filepath || "")}&size=256`;
         }
         setSelectedFileDetails(details);
       } catch {
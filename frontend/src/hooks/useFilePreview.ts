@@ -56,10 +56,10 @@ async function buildLocalPreview(file: SearchResult, agentRunning: boolean): Pro
     return base;
   }
 
-  // Image preview via agent /preview endpoint (serves raw file)
+  // Image preview via agent /thumbnail endpoint (cached, downscaled copy)
   if (IMAGE_TYPES.has(ext)) {
     try {
-      const url = `${AGENT_URL}/preview?filepath=${encodeURIComponent(file.filepath)}`;
+      const url = `${AGENT_URL}/thumbnail?filepath=${encodeURIComponent(file.filepath)}&size=800`;
       // Verify the agent can serve this file
       const headRes = await axios.head(url, { timeout: 3000 });
       if (headRes.status === 200) {
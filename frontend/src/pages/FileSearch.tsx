@@ -141,6 +141,23 @@ const FileSearch: React.FC = () => {
         }
       }
 
+      // Drop local results whose file no longer exists (deletes are not
+      // propagated to the backend) — one /stat call for the whole page.
+      if (agentRunning) {
+        const localPaths = newData
+          .filter((f) => f.storage_type === "local" && f.filepath)
+          .map((f) => f.filepath as string);
+        if (localPaths.length > 0) {
+          try {
+            const statRes = await axios.post(`${AGENT_URL}/stat`, { paths: localPaths }, { timeout: 2000 });
+            const stats = statRes.data.results || {};
+            newData = newData.filter((f) => !(f.filepath && stats[f.filepath]?.exists === false));
+          } catch {
+            // Agent unreachable — show results unfiltered
+          }
+        }
+      }
+
       setFiles(newData);
       setCurrentPage(page);
     } catch (error) {
@@ -192,6 +192,7 @@ const CloudStorageAccounts = () => {
         `https://www.dropbox.com/oauth2/authorize?` +
         `client_id=${encodeURIComponent(DROPBOX_CLIENT_ID)}` +
         `&response_type=code` +
+        `&token_access_type=offline` +
         `&redirect_uri=${encodeURIComponent(DROPBOX_REDIRECT_URI)}` +
         `&state=${encodeURIComponent(state)}`;
 
@@ -0,0 +1,210 @@
+"""
+archives.py — index the files inside archives as children of the archive.
+
+A project zip is one opaque entry in a metadata-only index.  Here its
+listing is read and every allowed member becomes a sync record at
+``<archive path>\\<member path>`` carrying the member's size and date.
+
+- ZIP: only the central directory at the end of the file is read.
+- TAR: headers are read and the payloads between them are seeked over.
+- Compressed TAR (.tar.gz, .tgz, .tar.bz2, .tar.xz): headers sit inside the
+  compressed stream, so it is decompressed on the fly (nothing is written)
+  — only up to MAX_STREAMED_ARCHIVE_BYTES.
+- 7z: the header block via ``py7zr`` when it is installed.
+
+Listings are remembered by archive (size, mtime) in the ``archives`` table,
+so an unchanged archive is never opened again.  Member rows carry their
+archive in ``files.archive``; they are removed with the archive and are
+never stat'ed, hashed or extracted as if they were real files.
+"""
+
+import logging
+import os
+import tarfile
+import time
+import zipfile
+from typing import Iterator, NamedTuple, Optional
+
+try:
+    import py7zr
+    _PY7ZR_AVAILABLE = True
+except ImportError:
+    _PY7ZR_AVAILABLE = False
+
+from .localdb import transaction
+from .localindex import remove_path
+from .policy import PathPolicy, get_policy
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".7z")
+
+# Compressed tars must be decompressed to reach their headers.
+MAX_STREAMED_ARCHIVE_BYTES = 20 * 1024 * 1024
+
+# Members indexed per archive; the rest are ignored.
+MAX_MEMBERS_PER_ARCHIVE = 5000
+
+
+class _Member(NamedTuple):
+    name: str            # "/"-separated path inside the archive
+    size: Optional[int]
+    mtime: Optional[float]
+
+
+def is_archive(path: str) -> bool:
+    lower = path.lower()
+    if lower.endswith(".7z"):
+        return _PY7ZR_AVAILABLE
+    return lower.endswith(ARCHIVE_SUFFIXES)
+
+
+def archive_for(path: str) -> Optional[str]:
+    """The archive file a member path points into, or None.
+
+    Walks up to the first ancestor that exists on disk; the path is a
+    member when that ancestor is an archive file."""
+    parent = os.path.dirname(path)
+    while parent and parent != path:
+        if os.path.exists(parent):
+            return parent if os.path.isfile(parent) and is_archive(parent) else None
+        path, parent = parent, os.path.dirname(parent)
+    return None
+
+
+# ─── Readers ──────────────────────────────────────────────────────────────────
+
+def _zip_members(path: str) -> Iterator[_Member]:
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            try:
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+            except (OverflowError, ValueError):
+                mtime = None
+            yield _Member(info.filename, info.file_size, mtime)
+
+
+def _tar_members(path: str, mode: str) -> Iterator[_Member]:
+    with tarfile.open(path, mode) as tf:
+        for info in tf:
+            if info.isfile():
+                yield _Member(info.name, info.size, float(info.mtime))
+
+
+def _7z_members(path: str) -> Iterator[_Member]:
+    with py7zr.SevenZipFile(path, "r") as archive:
+        for info in archive.list():
+            if info.is_directory:
+                continue
+            mtime = info.creationtime.timestamp() if info.creationtime else None
+            yield _Member(info.filename, info.uncompressed, mtime)
+
+
+def _read_members(path: str, size: int) -> Iterator[_Member]:
+    lower = path.lower()
+    if lower.endswith(".zip"):
+        return _zip_members(path)
+    if lower.endswith(".tar"):
+        return _tar_members(path, "r:")
+    if lower.endswith(".7z"):
+        return _7z_members(path)
+    if size > MAX_STREAMED_ARCHIVE_BYTES:
+        return iter(())
+    # "r|*" reads the compressed stream forward only, never seeking back.
+    return _tar_members(path, "r|*")
+
+
+def _member_parts(name: str, policy: PathPolicy) -> Optional[list[str]]:
+    """Clean member path components, or None when it must not be indexed."""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".", "..")]
+    if not parts:
+        return None
+    if any(p in policy.exclude_dirs for p in parts[:-1]):
+        return None
+    if not policy.allows_name(parts[-1]):
+        return None
+    return parts
+
+
+def _list(path: str, size: int) -> list[dict]:
+    policy = get_policy()
+    records = []
+    try:
+        for member in _read_members(path, size):
+            parts = _member_parts(member.name, policy)
+            if parts is None:
+                continue
+            name = parts[-1]
+            records.append({
+                "filepath": os.path.join(path, *parts),
+                "filename": name,
+                "filetype": os.path.splitext(name)[1].lower().lstrip(".") or "unknown",
+                "filesize": member.size,
+                "last_modified": member.mtime,
+                "is_folder": False,
+                "archive": path,
+            })
+            if len(records) >= MAX_MEMBERS_PER_ARCHIVE:
+                logger.debug("Archive %s: member cap reached.", path)
+                break
+    except Exception as exc:
+        # Corrupt, encrypted or truncated archives simply have no members.
+        logger.debug("Cannot list archive %s: %s", path, exc)
+    return records
+
+
+# ─── Public API ───────────────────────────────────────────────────────────────
+
+def member_records(records: list[dict]) -> list[dict]:
+    """Sync records for the members of every archive in records whose
+    (size, mtime) changed since it was last listed."""
+    archives = [r for r in records
+                if not r.get("is_folder") and not r.get("archive") and is_archive(r["filepath"])]
+    if not archives:
+        return []
+
+    paths = [r["filepath"] for r in archives]
+    with transaction() as conn:
+        known = {
+            path: (size, mtime)
+            for path, size, mtime in conn.execute(
+                f"SELECT path, size, mtime FROM archives "
+                f"WHERE path IN ({','.join('?' * len(paths))})",
+                paths,
+            )
+        }
+
+    members: list[dict] = []
+    for r in archives:
+        path, size, mtime = r["filepath"], r.get("filesize"), r.get("last_modified")
+        if size is None or known.get(path) == (size, mtime):
+            continue
+        listed = _list(path, size)
+        _forget_stale_members(path, {m["filepath"] for m in listed})
+        with transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO archives (path, size, mtime, members) VALUES (?, ?, ?, ?)",
+                (path, size, mtime, len(listed)),
+            )
+        members += listed
+    if members:
+        logger.debug("Archives: %d members from %d archives.", len(members), len(archives))
+    return members
+
+
+def _forget_stale_members(archive: str, current: set[str]) -> None:
+    with transaction() as conn:
+        previous = [row[0] for row in conn.execute(
+            "SELECT path FROM files WHERE archive = ?", (archive,)
+        )]
+    for path in previous:
+        if path not in current:
+            remove_path(path)
+
+
+def forget(archive: str) -> None:
+    """Drop the cached listing of a deleted archive."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM archives WHERE path = ?", (archive,))
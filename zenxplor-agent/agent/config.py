@@ -1,13 +1,26 @@
 """
 config.py — reads and writes the ZenXplor agent config.ini stored in
 %APPDATA%\\ZenXplor\\config.ini.
+
+The parsed config is cached in memory and re-read only when the file's
+mtime or size changes, so hot paths (watcher events, every /open) can call
+get_config() freely.  Writes go to a temp file that is renamed over
+config.ini, so a crash mid-write never leaves a truncated config behind.
 """
 
 import configparser
 import os
+import tempfile
+import threading
+import time
+from typing import Optional
 
 from .constants import APP_DATA_DIR, CONFIG_PATH
 
+_lock = threading.RLock()
+_cached: Optional[configparser.ConfigParser] = None
+_cached_stamp: Optional[tuple[int, int]] = None
+
 
 def _ensure_app_dir() -> None:
     os.makedirs(APP_DATA_DIR, exist_ok=True)
@@ -23,32 +36,105 @@ def _default_config() -> configparser.ConfigParser:
         "roots": r"C:\Users",
         "last_full_scan": "",
         "registered": "false",
+        # Optional .gitignore-style rules (see policy.py).
+        "ignore": "",
+        "ignore_file": "",
+    }
+    # Resource budgets for background work (see governor.py).
+    cfg["governor"] = {
+        "max_cpu_percent": "60",
+        "pause_on_battery": "false",
+        "min_battery_percent": "30",
+        "idle_seconds": "120",
+        "upload_files_per_second": "100",
+        "scan_dir_delay_ms": "5",
+        "startup_delay_seconds": "300",
+    }
+    # Local filename search (see fuzzy.py).
+    cfg["search"] = {
+        "fuzzy": "true",
+        "memory_cap_mb": "64",
     }
     return cfg
 
 
-def get_config() -> configparser.ConfigParser:
-    """Return a ConfigParser loaded from CONFIG_PATH.
-    Creates the file with defaults if it does not yet exist."""
+def _stamp() -> Optional[tuple[int, int]]:
+    try:
+        st = os.stat(CONFIG_PATH)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _write_atomic(cfg: configparser.ConfigParser) -> None:
+    """Write cfg to a temp file in the same directory, then rename it over
+    CONFIG_PATH."""
     _ensure_app_dir()
-    cfg = _default_config()
-    if os.path.exists(CONFIG_PATH):
-        cfg.read(CONFIG_PATH, encoding="utf-8")
-    else:
-        with open(CONFIG_PATH, "w", encoding="utf-8") as fh:
+    fd, tmp_path = tempfile.mkstemp(dir=APP_DATA_DIR, prefix=".config-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
             cfg.write(fh)
-    return cfg
+            fh.flush()
+            os.fsync(fh.fileno())
+        # Windows refuses the rename while another process (an editor, AV)
+        # has config.ini open; that is brief, so retry a few times.
+        for attempt in range(5):
+            try:
+                os.replace(tmp_path, CONFIG_PATH)
+                break
+            except PermissionError:
+                if attempt == 4:
+                    raise
+                time.sleep(0.05)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def get_config() -> configparser.ConfigParser:
+    """Return the ConfigParser loaded from CONFIG_PATH.
+    Creates the file with defaults if it does not yet exist.
+
+    The returned object is shared — treat it as read-only and change
+    settings through set_value() and friends.
+    """
+    global _cached, _cached_stamp
+    stamp = _stamp()
+    with _lock:
+        if _cached is not None and stamp is not None and stamp == _cached_stamp:
+            return _cached
+        cfg = _default_config()
+        if stamp is not None:
+            cfg.read(CONFIG_PATH, encoding="utf-8")
+        else:
+            _write_atomic(cfg)
+        _cached, _cached_stamp = cfg, _stamp()
+        return cfg
+
+
+def _update(values: dict[str, dict[str, str]]) -> None:
+    """Apply {section: {key: value}} to a copy of the config and persist it."""
+    global _cached, _cached_stamp
+    with _lock:
+        cfg = _default_config()
+        cfg.read_dict(get_config())
+        for section, items in values.items():
+            if not cfg.has_section(section):
+                cfg.add_section(section)
+            for key, value in items.items():
+                cfg.set(section, key, value)
+        _write_atomic(cfg)
+        # Swap rather than mutate, so readers holding the old object never
+        # see a half-applied update.
+        _cached, _cached_stamp = cfg, _stamp()
 
 
 def set_value(section: str, key: str, value: str) -> None:
     """Write a single key to the config file."""
-    cfg = get_config()
-    if not cfg.has_section(section):
-        cfg.add_section(section)
-    cfg.set(section, key, value)
-    _ensure_app_dir()
-    with open(CONFIG_PATH, "w", encoding="utf-8") as fh:
-        cfg.write(fh)
+    _update({section: {key: value}})
 
 
 def get_roots() -> list[str]:
@@ -65,14 +151,7 @@ def set_roots(roots: list[str]) -> None:
 
 def set_jwt(token: str, backend_url: str) -> None:
     """Save authentication credentials."""
-    cfg = get_config()
-    if not cfg.has_section("auth"):
-        cfg.add_section("auth")
-    cfg.set("auth", "jwt_token", token)
-    cfg.set("auth", "backend_url", backend_url)
-    _ensure_app_dir()
-    with open(CONFIG_PATH, "w", encoding="utf-8") as fh:
-        cfg.write(fh)
+    _update({"auth": {"jwt_token": token, "backend_url": backend_url}})
 
 
 def is_registered() -> bool:
@@ -10,9 +10,19 @@ APP_DATA_DIR = os.path.join(os.environ.get("APPDATA", ""), "ZenXplor")
 DB_PATH = os.path.join(APP_DATA_DIR, "index.db")
 CONFIG_PATH = os.path.join(APP_DATA_DIR, "config.ini")
 LOG_PATH = os.path.join(APP_DATA_DIR, "agent.log")
+THUMBNAIL_DIR = os.path.join(APP_DATA_DIR, "thumbs")
 
 RESCAN_INTERVAL_HOURS = 6
 
+# ── Scan priority ─────────────────────────────────────────────────────────────
+# Folders users actually search in are walked (and synced) before the rest of
+# the tree so the first useful results land within seconds of install.
+PRIORITY_FOLDERS: tuple[str, ...] = ("Desktop", "Documents", "Downloads")
+
+# Directories near the top of a root whose mtime is newer than this are
+# scanned right after the well-known folders.
+RECENT_DIR_DAYS = 14
+
 # Maximum file size to index (50 MB) — skips huge media/archive files
 MAX_FILE_SIZE_BYTES = 50 * 1024 * 1024
 
@@ -0,0 +1,120 @@
+"""
+dupes.py — staged duplicate detection over the local index.
+
+Hashing every file on disk would cost as much I/O as copying the disk, so
+candidates are narrowed in stages and only real collisions are read in full:
+
+1. Group files by size — a file with a unique size cannot have a duplicate.
+2. Hash the first and last PARTIAL_HASH_BYTES of each same-size file.
+3. Fully hash (SHA-256) only files whose size *and* partial hash collide.
+
+Hashes are stored in the local index and invalidated when a file's size or
+mtime changes, so later passes only touch new or modified files.  The full
+hash is the ``content_hash`` the backend uses for its duplicates report.
+"""
+
+import hashlib
+import logging
+import os
+from typing import Optional
+
+from .extractor import hash_file
+from .governor import governor
+from .localdb import transaction
+from .localindex import to_record
+
+logger = logging.getLogger(__name__)
+
+# Bytes hashed from each end of a file in the partial stage.
+PARTIAL_HASH_BYTES = 64 * 1024
+
+# Empty and tiny files are all "duplicates" of each other — skip them.
+MIN_DUPLICATE_SIZE = 1024
+
+
+def partial_hash(filepath: str, size: int) -> Optional[str]:
+    """SHA-256 over the size plus the first and last PARTIAL_HASH_BYTES."""
+    digest = hashlib.sha256(str(size).encode())
+    try:
+        with open(filepath, "rb") as fh:
+            digest.update(fh.read(PARTIAL_HASH_BYTES))
+            if size > 2 * PARTIAL_HASH_BYTES:
+                fh.seek(-PARTIAL_HASH_BYTES, os.SEEK_END)
+                digest.update(fh.read(PARTIAL_HASH_BYTES))
+            elif size > PARTIAL_HASH_BYTES:
+                digest.update(fh.read())
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def _hash_stage(select_sql: str, column: str, hasher) -> list[str]:
+    """Compute ``column`` for every (path, size) row returned by select_sql.
+
+    Returns the paths that were updated.
+    """
+    with transaction() as conn:
+        rows = conn.execute(select_sql).fetchall()
+
+    done = []
+    for path, size in rows:
+        governor.throttle_scan()
+        value = hasher(path, size)
+        if value is None:
+            continue
+        with transaction() as conn:
+            # Only store it if the file was not modified meanwhile.
+            conn.execute(
+                f"UPDATE files SET {column} = ? WHERE path = ? AND size IS ?",
+                (value, path, size),
+            )
+        done.append(path)
+    return done
+
+
+def find_duplicate_hashes() -> list[dict]:
+    """Run the staged pass and return sync records whose full hash is new."""
+    size_groups = f"""
+        SELECT size FROM files
+        WHERE is_folder = 0 AND archive IS NULL AND size >= {MIN_DUPLICATE_SIZE}
+        GROUP BY size HAVING COUNT(*) > 1
+    """
+
+    # Stage 2 — partial hashes for same-size files that lack one (including
+    # files already fully hashed, so their copies still land in one group).
+    partial = _hash_stage(
+        f"""
+        SELECT path, size FROM files
+        WHERE partial_hash IS NULL AND archive IS NULL AND size IN ({size_groups})
+        """,
+        "partial_hash",
+        partial_hash,
+    )
+
+    # Stage 3 — full hashes where size and partial hash still collide.
+    full = _hash_stage(
+        f"""
+        SELECT path, size FROM files
+        WHERE content_hash IS NULL AND (size, partial_hash) IN (
+            SELECT size, partial_hash FROM files
+            WHERE partial_hash IS NOT NULL AND size IN ({size_groups})
+            GROUP BY size, partial_hash HAVING COUNT(*) > 1
+        )
+        """,
+        "content_hash",
+        lambda path, _size: hash_file(path),
+    )
+
+    records = []
+    with transaction() as conn:
+        for path in full:
+            row = conn.execute(
+                "SELECT path, filename, filetype, size, mtime, is_folder, content_hash "
+                "FROM files WHERE path = ? AND content_hash IS NOT NULL",
+                (path,),
+            ).fetchone()
+            if row:
+                records.append(to_record(row))
+
+    logger.info("Duplicate pass: %d partial hashes, %d full hashes.", len(partial), len(full))
+    return records
@@ -0,0 +1,337 @@
+"""
+extractor.py — text snippet extraction for content search.
+
+The agent normally sends metadata only; this module adds a ``file_content``
+snippet for documents and source files so the backend's content match works
+for ordinary local files, not just ones pushed through upload-and-index.
+
+- Extraction mirrors ``extract_text_from_file`` in the backend's
+  file_search.py (plain text, PDF, DOCX, PPTX) and the same snippet caps.
+- Parsing runs in a small process pool so a pathological PDF cannot stall
+  the scanner, with a hard per-file timeout and a file size cap.
+- Results are cached in the local store by (path, size, mtime), so a rescan
+  only re-parses files that actually changed.
+- Behind that sits a content-addressed cache keyed by the file's SHA-256
+  (the same ``content_hash`` the backend stores), so copies of one document
+  in several folders are parsed once.  The hash is sent upstream too.
+- Only real results are cached.  Failed parses are counted separately, and
+  a file that has failed EXTRACT_MAX_FAILURES times in a row is left alone
+  until EXTRACT_FAILURE_TTL has passed since its last failure.
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from typing import Optional
+
+from .localdb import transaction
+
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = {
+    "txt", "md", "rst", "csv", "log", "py", "js", "ts", "jsx", "tsx",
+    "html", "htm", "css", "json", "xml", "yaml", "yml", "toml", "ini",
+    "cfg", "sh", "bat", "c", "cpp", "h", "java", "rb", "go", "rs",
+}
+DOCUMENT_EXTENSIONS = {"pdf", "docx", "pptx"}
+EXTRACTABLE_EXTENSIONS = TEXT_EXTENSIONS | DOCUMENT_EXTENSIONS
+
+MAX_CONTENT_BYTES = 50_000    # 50 KB plain-text read cap
+MAX_CONTENT_SNIPPET = 10_000  # characters sent to Elasticsearch
+
+# Documents larger than this are not parsed at all.
+MAX_EXTRACT_FILE_BYTES = 20 * 1024 * 1024
+
+# Hard limit on a single file's parse time; the worker is killed after it.
+EXTRACT_TIMEOUT_SECONDS = 15
+
+_EXTRACT_WORKERS = 2
+
+# Bump when extraction output changes so stale cache entries are re-parsed.
+EXTRACTOR_VERSION = 1
+
+# Upper bound on the text held in the content-addressed cache.
+EXTRACT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Consecutive failed parses before a file is skipped, and for how long.
+EXTRACT_MAX_FAILURES = 3
+EXTRACT_FAILURE_TTL = 24 * 3600
+
+_HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def hash_file(filepath: str) -> Optional[str]:
+    """Return the hex SHA-256 of a file, read in chunks; None if unreadable."""
+    digest = hashlib.sha256()
+    try:
+        with open(filepath, "rb") as fh:
+            while chunk := fh.read(_HASH_CHUNK_BYTES):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+# ─── Worker side (runs in the pool's child processes) ─────────────────────────
+
+def extract_text_from_path(filepath: str, filetype: str) -> Optional[str]:
+    """Extract a text snippet from a file on disk.
+
+    Returns an empty string if extraction is not supported, None if it fails.
+    """
+    try:
+        if filetype in TEXT_EXTENSIONS:
+            with open(filepath, "rb") as fh:
+                raw = fh.read(MAX_CONTENT_BYTES)
+            return raw.decode("utf-8", errors="replace")[:MAX_CONTENT_SNIPPET]
+
+        if filetype == "pdf":
+            import PyPDF2
+            reader = PyPDF2.PdfReader(filepath)
+            parts = []
+            for page in reader.pages[:30]:
+                text = page.extract_text()
+                if text:
+                    parts.append(text)
+                if sum(len(p) for p in parts) >= MAX_CONTENT_SNIPPET:
+                    break
+            return "\n".join(parts)[:MAX_CONTENT_SNIPPET]
+
+        if filetype == "docx":
+            import docx as docx_lib
+            doc = docx_lib.Document(filepath)
+            text = "\n".join(p.text for p in doc.paragraphs if p.text.strip())
+            return text[:MAX_CONTENT_SNIPPET]
+
+        if filetype == "pptx":
+            import pptx as pptx_lib
+            prs = pptx_lib.Presentation(filepath)
+            parts = []
+            for slide in prs.slides:
+                for shape in slide.shapes:
+                    if hasattr(shape, "text") and shape.text.strip():
+                        parts.append(shape.text)
+            return "\n".join(parts)[:MAX_CONTENT_SNIPPET]
+
+    except Exception as e:
+        logger.warning("Text extraction failed (type=%s): %s", filetype, e)
+        return None
+
+    return ""
+
+
+# ─── Pool management ──────────────────────────────────────────────────────────
+
+# Only one caller drives the pool at a time: a timeout terminates the whole
+# pool, which must not take another thread's in-flight files down with it.
+_pool_lock = threading.Lock()
+_pool: "multiprocessing.pool.Pool | None" = None
+
+
+def _get_pool() -> "multiprocessing.pool.Pool":
+    global _pool
+    if _pool is None:
+        # Recycle workers periodically — document parsers leak memory.
+        _pool = multiprocessing.Pool(_EXTRACT_WORKERS, maxtasksperchild=200)
+    return _pool
+
+
+def _kill_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+        _pool = None
+
+
+def shutdown() -> None:
+    with _pool_lock:
+        _kill_pool()
+
+
+def _run_jobs(jobs: list[tuple[str, str]]) -> dict[str, Optional[str]]:
+    """Extract every (filepath, filetype) job; returns {filepath: snippet}.
+    The snippet is None when parsing failed or the worker timed out or
+    crashed, so the caller caches nothing and the next sync tries again.
+
+    Jobs run in waves of one file per worker so each file gets the full
+    timeout to itself and a timeout only kills that wave's stragglers.
+    """
+    results: dict[str, Optional[str]] = {}
+    for i in range(0, len(jobs), _EXTRACT_WORKERS):
+        wave = jobs[i:i + _EXTRACT_WORKERS]
+        pool = _get_pool()
+        pending = [(path, pool.apply_async(extract_text_from_path, (path, ftype)))
+                   for path, ftype in wave]
+        deadline = time.monotonic() + EXTRACT_TIMEOUT_SECONDS
+        timed_out = False
+        for path, res in pending:
+            try:
+                results[path] = res.get(timeout=max(deadline - time.monotonic(), 0))
+            except multiprocessing.TimeoutError:
+                logger.warning("Text extraction timed out after %ds: %s",
+                               EXTRACT_TIMEOUT_SECONDS, path)
+                results[path] = None
+                timed_out = True
+            except Exception as exc:
+                logger.warning("Text extraction crashed for %s: %s", path, exc)
+                results[path] = None
+        if timed_out:
+            _kill_pool()
+    return results
+
+
+# ─── Public API ───────────────────────────────────────────────────────────────
+
+def _wants_content(record: dict) -> bool:
+    if record.get("is_folder"):
+        return False
+    if record.get("filetype") not in EXTRACTABLE_EXTENSIONS:
+        return False
+    size = record.get("filesize")
+    return size is not None and size <= MAX_EXTRACT_FILE_BYTES
+
+
+def _evict_cache(conn) -> None:
+    """Drop least-recently-used entries until the cache fits its byte budget."""
+    total = conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM extract_cache").fetchone()[0]
+    if total <= EXTRACT_CACHE_MAX_BYTES:
+        return
+    excess = total - EXTRACT_CACHE_MAX_BYTES
+    victims = []
+    for content_hash, nbytes in conn.execute(
+        "SELECT content_hash, nbytes FROM extract_cache ORDER BY last_used"
+    ):
+        victims.append((content_hash,))
+        excess -= nbytes
+        if excess <= 0:
+            break
+    conn.executemany("DELETE FROM extract_cache WHERE content_hash = ?", victims)
+    logger.debug("Evicted %d extraction cache entries.", len(victims))
+
+
+def attach_snippets(batch: list[dict]) -> None:
+    """Add ``file_content`` and ``content_hash`` to every extractable record.
+
+    Lookup order: the (path, size, mtime) cache, then the content-addressed
+    cache by SHA-256, then a parse in the worker pool.  New results are
+    written to both caches; a failed parse is written to neither, only
+    counted in extract_failures, and the record goes up without a snippet.
+    """
+    wanted = [r for r in batch if _wants_content(r)]
+    if not wanted:
+        return
+
+    paths = [r["filepath"] for r in wanted]
+    with transaction() as conn:
+        cached = {
+            path: (size, mtime, content_hash, snippet)
+            for path, size, mtime, content_hash, snippet in conn.execute(
+                f"SELECT path, size, mtime, content_hash, snippet FROM extracted_text "
+                f"WHERE path IN ({','.join('?' * len(paths))})",
+                paths,
+            )
+        }
+
+    misses = []
+    for r in wanted:
+        hit = cached.get(r["filepath"])
+        if hit and hit[0] == r["filesize"] and hit[1] == r["last_modified"] and hit[2]:
+            r["content_hash"], r["file_content"] = hit[2], hit[3]
+        else:
+            misses.append(r)
+
+    if not misses:
+        return
+
+    # Hash the changed files, then try the content-addressed cache.
+    for r in misses:
+        r["content_hash"] = hash_file(r["filepath"])
+    hashes = [r["content_hash"] for r in misses if r["content_hash"]]
+    now = time.time()
+    with transaction() as conn:
+        by_hash = dict(conn.execute(
+            f"SELECT content_hash, text FROM extract_cache "
+            f"WHERE extractor_version = ? AND content_hash IN ({','.join('?' * len(hashes))})",
+            [EXTRACTOR_VERSION, *hashes],
+        )) if hashes else {}
+        given_up = {h for (h,) in conn.execute(
+            f"SELECT content_hash FROM extract_failures "
+            f"WHERE extractor_version = ? AND failures >= ? AND last_failed > ? "
+            f"AND content_hash IN ({','.join('?' * len(hashes))})",
+            [EXTRACTOR_VERSION, EXTRACT_MAX_FAILURES, now - EXTRACT_FAILURE_TTL, *hashes],
+        )} if hashes else set()
+
+    # One parse per distinct hash, even when a batch holds several copies.
+    jobs: dict[str, tuple[str, str]] = {}
+    for r in misses:
+        text = by_hash.get(r["content_hash"])
+        if text is not None:
+            r["file_content"] = text
+        elif r["content_hash"] and r["content_hash"] not in given_up:
+            jobs.setdefault(r["content_hash"], (r["filepath"], r["filetype"]))
+
+    extracted: dict[str, Optional[str]] = {}
+    if jobs:
+        with _pool_lock:
+            by_path = _run_jobs(list(jobs.values()))
+        extracted = {h: by_path[path] for h, (path, _) in jobs.items()}
+
+    path_rows, cache_rows = [], []
+    for r in misses:
+        if r["content_hash"] is None:
+            r.pop("content_hash")
+            continue
+        if r["content_hash"] in given_up or (
+            r["content_hash"] in extracted and extracted[r["content_hash"]] is None
+        ):
+            continue    # failed: leave both caches alone so it is retried
+        snippet = extracted.get(r["content_hash"])
+        if snippet is not None:
+            r["file_content"] = snippet
+            cache_rows.append((r["content_hash"], EXTRACTOR_VERSION, snippet,
+                               len(snippet.encode("utf-8")), now))
+        path_rows.append((r["filepath"], r["filesize"], r["last_modified"] or 0.0,
+                          r["content_hash"], r.get("file_content", "")))
+
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO extracted_text (path, size, mtime, content_hash, snippet) "
+            "VALUES (?, ?, ?, ?, ?)",
+            path_rows,
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO extract_cache "
+            "(content_hash, extractor_version, text, nbytes, last_used) VALUES (?, ?, ?, ?, ?)",
+            cache_rows,
+        )
+        conn.executemany(
+            "UPDATE extract_cache SET last_used = ? WHERE content_hash = ?",
+            [(now, h) for h in by_hash],
+        )
+        failed = [h for h, text in extracted.items() if text is None]
+        conn.executemany(
+            "INSERT INTO extract_failures (content_hash, extractor_version, failures, last_failed) "
+            "VALUES (?, ?, 1, ?) ON CONFLICT (content_hash) DO UPDATE SET "
+            "failures = CASE WHEN extractor_version = excluded.extractor_version "
+            "THEN failures + 1 ELSE 1 END, "
+            "extractor_version = excluded.extractor_version, last_failed = excluded.last_failed",
+            [(h, EXTRACTOR_VERSION, now) for h in failed],
+        )
+        conn.executemany(
+            "DELETE FROM extract_failures WHERE content_hash = ?",
+            [(h,) for h, text in extracted.items() if text is not None],
+        )
+        if cache_rows:
+            _evict_cache(conn)
+    logger.debug("Snippets: %d path-cached, %d hash-cached, %d parsed.",
+                 len(wanted) - len(misses), len(by_hash), len(jobs))
+
+
+def forget(filepath: str) -> None:
+    """Drop the cached snippet for a deleted file."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM extracted_text WHERE path = ?", (filepath,))
@@ -0,0 +1,113 @@
+"""
+federated.py — one search across the local index and the backend.
+
+``GET /search?mode=federated`` streams newline-delimited JSON so the
+slowest source never decides time-to-first-result:
+
+1. ``{"source": "local", ...}``  — local index hits, usually within a few ms.
+2. ``{"source": "cloud", ...}``  — backend hits not already listed locally,
+   or ``"timed_out": true`` / ``"error"`` once the latency budget is spent.
+3. ``{"source": "merged", "done": true, ...}`` — both sets ranked together.
+
+The backend request is started before the local lookup, so both run
+concurrently.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Iterator, Optional
+
+try:
+    import requests as _requests
+    _REQUESTS_AVAILABLE = True
+except ImportError:
+    _REQUESTS_AVAILABLE = False
+
+from .indexer import get_sync_credentials, search_files
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET_SECONDS = 1.5
+MAX_BUDGET_SECONDS = 10.0
+
+# Backend queries in flight at once (one per concurrent federated search).
+_backend_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="federated")
+
+
+def _query_backend(query: str, limit: int, filetype: Optional[str],
+                   timeout: float) -> list[dict]:
+    if not _REQUESTS_AVAILABLE:
+        raise RuntimeError("requests is not installed")
+    jwt_token, backend_url, sync_cookies = get_sync_credentials()
+    if not jwt_token or not backend_url:
+        raise RuntimeError("agent is not signed in")
+    params = {"q": query, "limit": limit, "offset": 0}
+    if filetype:
+        params["filetype"] = filetype
+    resp = _requests.get(
+        f"{backend_url}/search/search-files",
+        params=params,
+        cookies=sync_cookies,
+        timeout=timeout,
+    )
+    resp.raise_for_status()
+    return resp.json().get("results", [])
+
+
+def _name_tier(filename: str, query: str) -> int:
+    """0 exact name, 1 prefix, 2 every term in the name, 3 anything else
+    (e.g. a content match from the backend)."""
+    name, q = (filename or "").lower(), query.lower()
+    if name == q or name.rsplit(".", 1)[0] == q:
+        return 0
+    if name.startswith(q):
+        return 1
+    if all(term in name for term in q.split()):
+        return 2
+    return 3
+
+
+def merge_results(local: list[dict], cloud: list[dict], query: str, limit: int) -> list[dict]:
+    """Rank both lists by name-match tier, keeping each source's own order
+    within a tier and preferring local hits on ties.  Paths present in both
+    are listed once, with the backend's record (it carries id / favourite)."""
+    by_path = {r["filepath"]: r for r in cloud if r.get("filepath")}
+    ranked = []
+    for pos, r in enumerate(local):
+        ranked.append((_name_tier(r["filename"], query), 0, pos,
+                       {**by_path.pop(r["filepath"], r), "local": True}))
+    for pos, r in enumerate(cloud):
+        if r.get("filepath") in by_path:
+            ranked.append((_name_tier(r.get("filename"), query), 1, pos, r))
+    ranked.sort(key=lambda item: item[:3])
+    return [r for *_, r in ranked[:limit]]
+
+
+def federated_search(query: str, limit: int = 50, filetype: Optional[str] = None,
+                     budget: float = DEFAULT_BUDGET_SECONDS) -> Iterator[dict]:
+    """Yield the local, cloud and merged chunks described in the module notes."""
+    budget = min(max(budget, 0.0), MAX_BUDGET_SECONDS)
+    deadline = time.monotonic() + budget
+    future = _backend_pool.submit(_query_backend, query, limit, filetype, budget)
+
+    started = time.monotonic()
+    local = [{**r, "source": "local"} for r in search_files(query, limit=limit, filetype=filetype)]
+    yield {"source": "local", "results": local,
+           "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+
+    cloud: list[dict] = []
+    try:
+        cloud = future.result(timeout=max(deadline - time.monotonic(), 0))
+    except FutureTimeout:
+        yield {"source": "cloud", "results": [], "timed_out": True}
+    except Exception as exc:
+        logger.debug("Federated search: backend query failed: %s", exc)
+        yield {"source": "cloud", "results": [], "error": str(exc)}
+    else:
+        local_paths = {r["filepath"] for r in local}
+        yield {"source": "cloud",
+               "results": [r for r in cloud if r.get("filepath") not in local_paths],
+               "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+
+    yield {"source": "merged", "results": merge_results(local, cloud, query, limit), "done": True}
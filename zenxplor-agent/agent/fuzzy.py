@@ -0,0 +1,329 @@
+"""
+fuzzy.py — typo-tolerant filename matching over the local index.
+
+Filenames are split into lowercase tokens ("MyReport_2024.pdf" → myreport,
+my, report, 2024, pdf).  Three tables in index.db hold the structure:
+
+- ``vocab``          every distinct token with its document frequency;
+- ``vocab_trigrams`` a trigram posting list over the vocabulary;
+- ``file_tokens``    which files contain which token.
+
+A query term matches a token exactly, as a prefix (a partially typed word),
+or within the edit distance Elasticsearch's ``fuzziness: "AUTO"`` allows
+(0 edits up to 2 characters, 1 up to 5, 2 beyond; numbers get none).  Typo candidates come
+from the trigram postings and are verified with an optimal-string-alignment
+distance, so only a few hundred tokens are ever compared — never the whole
+vocabulary and never every filename.
+
+The same tables answer plain substring search (``substring_paths``): a
+term's trigrams narrow the vocabulary to tokens that may contain it, so
+localindex.search never scans the files table with ``LIKE '%term%'``.
+
+The tables are kept current by ``localindex.record_files`` /
+``remove_path`` and live on disk; per-query work is bounded by
+_MAX_TOKENS_PER_TERM and _MAX_CANDIDATE_PATHS, and SQLite's page cache by
+``[search] memory_cap_mb`` (see localdb.py).
+"""
+
+import logging
+import re
+import sqlite3
+from collections import Counter
+from typing import Iterable, Optional
+
+from .localdb import prefix_range
+
+logger = logging.getLogger(__name__)
+
+# Candidate tokens considered per query term (most frequent first).
+_MAX_TOKENS_PER_TERM = 200
+
+# Files gathered for the most selective term before the others filter them.
+_MAX_CANDIDATE_PATHS = 20_000
+
+# SQLite's default host-parameter limit is 999 on older builds.
+_IN_CHUNK = 900
+
+# Ranking cost per match kind; a file's cost is the sum over query terms.
+_COST_EXACT = 0
+_COST_PREFIX = 1
+_COST_PER_EDIT = 2
+_COST_INFIX = 2
+
+_SPLIT_RE = re.compile(r"[\W_]+")
+_CAMEL_RE = re.compile(r"(?<=[a-z])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])|(?<=\D)(?=\d)|(?<=\d)(?=\D)")
+
+
+# ─── Tokens ───────────────────────────────────────────────────────────────────
+
+def tokenize(filename: str) -> set[str]:
+    """Lowercase tokens of a filename: each word, and each camelCase /
+    letter-digit part of it.  Single characters are not indexed."""
+    tokens = set()
+    for word in _SPLIT_RE.split(filename):
+        if not word:
+            continue
+        tokens.add(word.lower())
+        tokens.update(part.lower() for part in _CAMEL_RE.split(word))
+    return {t for t in tokens if len(t) >= 2}
+
+
+def query_terms(query: str) -> list[str]:
+    return [t for t in _SPLIT_RE.split(query.lower()) if t]
+
+
+def _trigrams(token: str) -> set[str]:
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(term: str) -> int:
+    """Edits allowed for a term — Elasticsearch's AUTO fuzziness."""
+    if len(term) <= 2:
+        return 0
+    return 1 if len(term) <= 5 else 2
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (adjacent swaps count as one edit);
+    returns limit + 1 as soon as the distance must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2: list[int] = []
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cost = ca != cb
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def _placeholders(n: int) -> str:
+    return ",".join("?" * n)
+
+
+# ─── Index maintenance (called inside localindex transactions) ────────────────
+
+def _lookup_ids(conn: sqlite3.Connection, tokens: list[str]) -> dict[str, int]:
+    ids: dict[str, int] = {}
+    for i in range(0, len(tokens), _IN_CHUNK):
+        chunk = tokens[i:i + _IN_CHUNK]
+        ids.update((tok, tid) for tid, tok in conn.execute(
+            f"SELECT id, token FROM vocab WHERE token IN ({_placeholders(len(chunk))})", chunk
+        ))
+    return ids
+
+
+def _token_ids(conn: sqlite3.Connection, tokens: set[str]) -> dict[str, int]:
+    """Return {token: id}, adding new tokens and their trigrams."""
+    ids = _lookup_ids(conn, sorted(tokens))
+    new = sorted(tokens - ids.keys())
+    if new:
+        conn.executemany("INSERT INTO vocab (token, df) VALUES (?, 0)", [(tok,) for tok in new])
+        added = _lookup_ids(conn, new)
+        conn.executemany(
+            "INSERT OR IGNORE INTO vocab_trigrams (trigram, token_id) VALUES (?, ?)",
+            [(tri, tid) for tok, tid in added.items() if not tok.isdigit()
+             for tri in _trigrams(tok)],
+        )
+        ids.update(added)
+    return ids
+
+
+def add_names(conn: sqlite3.Connection, entries: Iterable[tuple[str, str]]) -> None:
+    """Index (path, filename) pairs for paths not indexed before."""
+    per_path = [(path, tokenize(name)) for path, name in entries]
+    ids = _token_ids(conn, set().union(*(toks for _, toks in per_path)))
+    rows = [(ids[tok], path) for path, toks in per_path for tok in toks]
+    if not rows:
+        return
+    conn.executemany("INSERT OR IGNORE INTO file_tokens (token_id, path) VALUES (?, ?)", rows)
+    counts = Counter(tid for tid, _ in rows)
+    conn.executemany("UPDATE vocab SET df = df + ? WHERE id = ?",
+                     [(n, tid) for tid, n in counts.items()])
+
+
+def forget(conn: sqlite3.Connection, path: str, prefix: str) -> None:
+    """Drop the tokens of path and of everything below prefix."""
+    where = "(path = ? OR (path >= ? AND path < ?))"
+    params = (path, *prefix_range(prefix))
+    conn.execute(
+        f"UPDATE vocab SET df = df - (SELECT COUNT(*) FROM file_tokens "
+        f"WHERE token_id = vocab.id AND {where}) "
+        f"WHERE id IN (SELECT token_id FROM file_tokens WHERE {where})",
+        params * 2,
+    )
+    conn.execute(f"DELETE FROM file_tokens WHERE {where}", params)
+
+
+def prune_vocab(conn: sqlite3.Connection) -> int:
+    """Delete tokens no file uses any more; returns how many went."""
+    dead = conn.execute("SELECT id, token FROM vocab WHERE df <= 0").fetchall()
+    for tid, tok in dead:
+        conn.executemany(
+            "DELETE FROM vocab_trigrams WHERE trigram = ? AND token_id = ?",
+            [(tri, tid) for tri in _trigrams(tok)],
+        )
+    conn.execute("DELETE FROM vocab WHERE df <= 0")
+    return len(dead)
+
+
+def backfill_batch(conn: sqlite3.Connection, after: str, batch: int = 5000) -> Optional[str]:
+    """Tokenise up to batch indexed files (in path order, after ``after``)
+    that predate the fuzzy tables.  Returns the last path seen, or None
+    once the end is reached."""
+    rows = conn.execute(
+        "SELECT path, filename FROM files WHERE path > ? "
+        "AND NOT EXISTS (SELECT 1 FROM file_tokens WHERE file_tokens.path = files.path) "
+        "ORDER BY path LIMIT ?",
+        (after, batch),
+    ).fetchall()
+    add_names(conn, rows)
+    return rows[-1][0] if len(rows) == batch else None
+
+
+# ─── Matching ─────────────────────────────────────────────────────────────────
+
+def _term_candidates(conn: sqlite3.Connection, term: str) -> dict[int, tuple[int, int]]:
+    """Return {token_id: (cost, df)} for tokens matching term."""
+    found: dict[int, tuple[int, int]] = {}
+    for tid, tok, df in conn.execute(
+        "SELECT id, token, df FROM vocab WHERE token >= ? AND token < ? AND df > 0 "
+        "ORDER BY df DESC LIMIT ?",
+        (term, term + "\U0010ffff", _MAX_TOKENS_PER_TERM),
+    ):
+        found[tid] = (_COST_EXACT if tok == term else _COST_PREFIX, df)
+
+    # Numbers (years, counters) match exactly or by prefix only.
+    edits = 0 if term.isdigit() else max_edits(term)
+    if not edits:
+        return found
+    grams = sorted(_trigrams(term))
+    # Each edit destroys at most three trigrams; require at least one shared.
+    min_shared = max(len(grams) - 3 * edits, 1)
+    rows = conn.execute(
+        f"""
+        SELECT v.id, v.token, v.df FROM vocab_trigrams t JOIN vocab v ON v.id = t.token_id
+        WHERE t.trigram IN ({_placeholders(len(grams))})
+          AND v.df > 0 AND length(v.token) BETWEEN ? AND ?
+        GROUP BY v.id HAVING COUNT(*) >= ?
+        ORDER BY COUNT(*) DESC LIMIT ?
+        """,
+        [*grams, len(term) - edits, len(term) + edits, min_shared, _MAX_TOKENS_PER_TERM * 4],
+    ).fetchall()
+    for tid, tok, df in rows:
+        if tid in found:
+            continue
+        distance = _edit_distance(term, tok, edits)
+        if distance <= edits:
+            found[tid] = (_COST_PER_EDIT * distance, df)
+    if len(found) > _MAX_TOKENS_PER_TERM:
+        best = sorted(found.items(), key=lambda item: (item[1][0], -item[1][1]))
+        found = dict(best[:_MAX_TOKENS_PER_TERM])
+    return found
+
+
+def _paths_for(conn: sqlite3.Connection, candidates: dict[int, tuple[int, int]],
+               within: Optional[list[str]] = None) -> dict[str, int]:
+    """Return {path: best cost} for files containing any candidate token,
+    optionally only among the paths in within."""
+    best: dict[str, int] = {}
+    # Cheapest tokens first, so the path cap keeps the best matches.
+    ids = sorted(candidates, key=lambda tid: candidates[tid][0])
+    if within is None:
+        for i in range(0, len(ids), _IN_CHUNK):
+            chunk = ids[i:i + _IN_CHUNK]
+            for path, tid in conn.execute(
+                f"SELECT path, token_id FROM file_tokens "
+                f"WHERE token_id IN ({_placeholders(len(chunk))}) LIMIT ?",
+                [*chunk, _MAX_CANDIDATE_PATHS * 2],
+            ):
+                cost = candidates[tid][0]
+                if cost < best.get(path, cost + 1):
+                    best[path] = cost
+                if len(best) >= _MAX_CANDIDATE_PATHS:
+                    return best
+        return best
+    step = max(_IN_CHUNK - len(ids), 100)
+    for i in range(0, len(within), step):
+        chunk = within[i:i + step]
+        for path, tid in conn.execute(
+            f"SELECT path, token_id FROM file_tokens "
+            f"WHERE path IN ({_placeholders(len(chunk))}) "
+            f"AND token_id IN ({_placeholders(len(ids))})",
+            [*chunk, *ids],
+        ):
+            cost = candidates[tid][0]
+            if cost < best.get(path, cost + 1):
+                best[path] = cost
+    return best
+
+
+def match_paths(conn: sqlite3.Connection, query: str) -> dict[str, int]:
+    """Return {path: cost} for files whose name matches every query term
+    exactly, by prefix or within the allowed typos (lower cost is better)."""
+    terms = query_terms(query)
+    if not terms:
+        return {}
+    per_term = [_term_candidates(conn, term) for term in terms]
+    if not all(per_term):
+        return {}
+    # Start from the term matching the fewest files; the others only filter.
+    per_term.sort(key=lambda cands: sum(df for _, df in cands.values()))
+    scores = _paths_for(conn, per_term[0])
+    for candidates in per_term[1:]:
+        if not scores:
+            break
+        matched = _paths_for(conn, candidates, list(scores))
+        scores = {path: scores[path] + cost for path, cost in matched.items()}
+    return scores
+
+
+def _substring_candidates(conn: sqlite3.Connection, term: str) -> dict[int, tuple[int, int]]:
+    """Return {token_id: (cost, df)} for tokens containing term."""
+    if len(term) >= 3 and not term.isdigit():
+        grams = sorted({term[i:i + 3] for i in range(len(term) - 2)})
+        rows = conn.execute(
+            f"""
+            SELECT v.id, v.token, v.df FROM vocab_trigrams t JOIN vocab v ON v.id = t.token_id
+            WHERE t.trigram IN ({_placeholders(len(grams))}) AND v.df > 0
+            GROUP BY v.id HAVING COUNT(*) = ?
+            """,
+            [*grams, len(grams)],
+        )
+    else:
+        # Too short for a trigram, or a number (numbers have no trigrams):
+        # scan the vocabulary, which is far smaller than the files table.
+        rows = conn.execute(
+            "SELECT id, token, df FROM vocab WHERE df > 0 AND instr(token, ?) > 0", (term,)
+        )
+    found: dict[int, tuple[int, int]] = {}
+    for tid, tok, df in rows:
+        if tok == term:
+            found[tid] = (_COST_EXACT, df)
+        elif tok.startswith(term):
+            found[tid] = (_COST_PREFIX, df)
+        elif term in tok:
+            found[tid] = (_COST_INFIX, df)
+    return found
+
+
+def substring_paths(conn: sqlite3.Connection, query: str) -> list[str]:
+    """Candidate paths for a substring search: files with a token that
+    contains the most selective query term, at most _MAX_CANDIDATE_PATHS of
+    them.  A superset — the caller checks every term against the filename."""
+    terms = query_terms(query)
+    if not terms:
+        return []
+    per_term = [_substring_candidates(conn, term) for term in terms]
+    if not all(per_term):
+        return []
+    candidates = min(per_term, key=lambda cands: sum(df for _, df in cands.values()))
+    return list(_paths_for(conn, candidates))
+
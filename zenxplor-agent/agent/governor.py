@@ -0,0 +1,237 @@
+"""
+governor.py — resource governor for the ZenXplor agent.
+
+Keeps background work (full scans, watcher flushes, periodic rescans) from
+competing with the user:
+
+- Pauses scanning while system CPU is above a budget (games, calls, builds).
+- Pauses on battery, or below a battery threshold.
+- Paces uploads with a token bucket while the user is active, and lifts the
+  pacing once the machine has been idle for a while.  Input idle time is
+  read on Windows and macOS; elsewhere it is unknown and the user counts
+  as idle once ``startup_delay_seconds`` have passed.
+- Defers scheduled rescans (and the post-login scan) until the machine is calm.
+
+All budgets live in the ``[governor]`` section of config.ini.  When psutil is
+not installed the governor never throttles.
+"""
+
+import logging
+import re
+import subprocess
+import sys
+import threading
+import time
+from typing import Optional
+
+try:
+    import psutil as _psutil
+    _PSUTIL_AVAILABLE = True
+except ImportError:
+    _PSUTIL_AVAILABLE = False
+    logging.getLogger(__name__).warning(
+        "'psutil' is not installed — resource governor disabled. "
+        "Run: pip install psutil>=5.9.0"
+    )
+
+from .config import get_config
+
+logger = logging.getLogger(__name__)
+
+# How long a load sample is reused before psutil is queried again.
+_SAMPLE_TTL_SECONDS = 2.0
+
+# Poll interval while paused waiting for the machine to calm down.
+_PAUSE_POLL_SECONDS = 5.0
+
+
+_HID_IDLE_RE = re.compile(rb'"HIDIdleTime" = (\d+)')
+
+
+def _mac_idle_seconds() -> Optional[float]:
+    try:
+        out = subprocess.run(["ioreg", "-c", "IOHIDSystem", "-d", "4"],
+                             capture_output=True, timeout=2).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = _HID_IDLE_RE.search(out)
+    return int(match.group(1)) / 1e9 if match else None
+
+
+def _idle_seconds() -> Optional[float]:
+    """Seconds since the last keyboard/mouse input, or None if unknown
+    (always on Linux, where there is no portable source)."""
+    if sys.platform == "darwin":
+        return _mac_idle_seconds()
+    if sys.platform != "win32":
+        return None
+    try:
+        import ctypes
+
+        class _LastInputInfo(ctypes.Structure):
+            _fields_ = [("cbSize", ctypes.c_uint), ("dwTime", ctypes.c_uint32)]
+
+        info = _LastInputInfo()
+        info.cbSize = ctypes.sizeof(info)
+        if not ctypes.windll.user32.GetLastInputInfo(ctypes.byref(info)):
+            return None
+        # Both are 32-bit tick counts that wrap every ~49.7 days.
+        get_tick_count = ctypes.windll.kernel32.GetTickCount
+        get_tick_count.restype = ctypes.c_uint32
+        millis = (get_tick_count() - info.dwTime) & 0xFFFFFFFF
+        return millis / 1000.0
+    except Exception:
+        return None
+
+
+class ResourceGovernor:
+    """Measures system load and decides how fast background work may run."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._sample: dict = {}
+        self._sampled_at = 0.0
+        self._tokens = 0.0
+        self._tokens_at = time.monotonic()
+        self._started_at = time.monotonic()
+        self.paused_seconds = 0.0
+
+    # ── Budgets ──────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _budgets() -> dict:
+        cfg = get_config()
+        return {
+            "max_cpu_percent": cfg.getfloat("governor", "max_cpu_percent", fallback=60.0),
+            "pause_on_battery": cfg.getboolean("governor", "pause_on_battery", fallback=False),
+            "min_battery_percent": cfg.getfloat("governor", "min_battery_percent", fallback=30.0),
+            "idle_seconds": cfg.getfloat("governor", "idle_seconds", fallback=120.0),
+            "startup_delay_seconds": cfg.getfloat("governor", "startup_delay_seconds", fallback=300.0),
+            "upload_files_per_second": cfg.getfloat("governor", "upload_files_per_second", fallback=100.0),
+            "scan_dir_delay_ms": cfg.getfloat("governor", "scan_dir_delay_ms", fallback=5.0),
+        }
+
+    # ── Measurements ─────────────────────────────────────────────────────────
+
+    def sample(self) -> dict:
+        """Return the current load sample (cached for a couple of seconds)."""
+        with self._lock:
+            now = time.monotonic()
+            if self._sample and now - self._sampled_at < _SAMPLE_TTL_SECONDS:
+                return self._sample
+
+            sample = {"cpu_percent": None, "on_battery": False,
+                      "battery_percent": None, "idle_seconds": _idle_seconds()}
+            if _PSUTIL_AVAILABLE:
+                try:
+                    # Non-blocking: CPU usage since the previous call.
+                    sample["cpu_percent"] = _psutil.cpu_percent(interval=None)
+                    battery = _psutil.sensors_battery()
+                    if battery is not None:
+                        sample["on_battery"] = not battery.power_plugged
+                        sample["battery_percent"] = battery.percent
+                except Exception as exc:
+                    logger.debug("governor: psutil sample failed: %s", exc)
+
+            self._sample = sample
+            self._sampled_at = now
+            return sample
+
+    def _is_idle(self, sample: dict, budgets: dict) -> bool:
+        idle = sample["idle_seconds"]
+        if idle is None:
+            # Unknown (Linux): relax once start-up is over; the CPU and
+            # battery budgets still pause work.
+            return time.monotonic() - self._started_at >= budgets["startup_delay_seconds"]
+        return idle >= budgets["idle_seconds"]
+
+    def busy_reason(self) -> Optional[str]:
+        """Return why background work should pause right now, or None."""
+        if not _PSUTIL_AVAILABLE:
+            return None
+        budgets = self._budgets()
+        sample = self.sample()
+
+        if sample["on_battery"]:
+            if budgets["pause_on_battery"]:
+                return "on battery"
+            percent = sample["battery_percent"]
+            if percent is not None and percent < budgets["min_battery_percent"]:
+                return f"battery at {percent:.0f}%"
+
+        cpu = sample["cpu_percent"]
+        if cpu is not None and cpu > budgets["max_cpu_percent"]:
+            return f"CPU at {cpu:.0f}%"
+        return None
+
+    # ── Pacing ───────────────────────────────────────────────────────────────
+
+    def wait_until_calm(self, abort: Optional[threading.Event] = None) -> None:
+        """Block while the machine is busy.  Returns early if abort is set."""
+        reason = self.busy_reason()
+        if reason is None:
+            return
+        logger.info("governor: pausing background work (%s).", reason)
+        started = time.monotonic()
+        while reason is not None:
+            if abort is not None:
+                if abort.wait(_PAUSE_POLL_SECONDS):
+                    break
+            else:
+                time.sleep(_PAUSE_POLL_SECONDS)
+            reason = self.busy_reason()
+        waited = time.monotonic() - started
+        self.paused_seconds += waited
+        logger.info("governor: resuming after %.0f s.", waited)
+
+    def throttle_scan(self, abort: Optional[threading.Event] = None) -> None:
+        """Called by scan workers once per directory."""
+        self.wait_until_calm(abort)
+        budgets = self._budgets()
+        if not self._is_idle(self.sample(), budgets) and budgets["scan_dir_delay_ms"] > 0:
+            time.sleep(budgets["scan_dir_delay_ms"] / 1000.0)
+
+    def pace_upload(self, n_files: int) -> None:
+        """Token bucket on files sent upstream; unlimited while the user is idle."""
+        budgets = self._budgets()
+        rate = budgets["upload_files_per_second"]
+        if rate <= 0 or self._is_idle(self.sample(), budgets):
+            return
+        with self._lock:
+            now = time.monotonic()
+            # Allow bursts of up to one second's worth of files.
+            self._tokens = min(rate, self._tokens + (now - self._tokens_at) * rate)
+            self._tokens_at = now
+            self._tokens -= n_files
+            deficit = -self._tokens
+        if deficit > 0:
+            time.sleep(deficit / rate)
+
+    def status(self) -> dict:
+        return {
+            "enabled": _PSUTIL_AVAILABLE,
+            "busy_reason": self.busy_reason(),
+            "paused_seconds": round(self.paused_seconds, 1),
+            **self.sample(),
+        }
+
+
+governor = ResourceGovernor()
+
+
+def lower_process_priority() -> None:
+    """Run the whole agent at below-normal CPU and low I/O priority."""
+    if not _PSUTIL_AVAILABLE:
+        return
+    try:
+        proc = _psutil.Process()
+        if sys.platform == "win32":
+            proc.nice(_psutil.BELOW_NORMAL_PRIORITY_CLASS)
+            proc.ionice(_psutil.IOPRIO_LOW)
+        else:
+            proc.nice(10)
+            if hasattr(proc, "ionice"):
+                proc.ionice(_psutil.IOPRIO_CLASS_IDLE)
+        logger.info("Lowered process CPU/IO priority.")
+    except Exception as exc:
+        logger.warning("Could not lower process priority: %s", exc)
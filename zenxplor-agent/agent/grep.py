@@ -0,0 +1,268 @@
+"""
+grep.py — "search inside files" over text and source files under the roots.
+
+``GET /grep`` streams matches as newline-delimited JSON while the search runs:
+
+- The walk uses the shared PathPolicy (excluded dirs, ignore rules, size
+  cap) and only yields GREP_EXTENSIONS — plain text, data and code files.
+- Files are handed in small chunks to a process pool; each worker
+  memory-maps the file and searches the raw bytes, using ``bytes.find`` for
+  case-sensitive literals and a compiled bytes regex otherwise.  Files with
+  a NUL byte near the start are treated as binary and skipped.
+- Only a few chunks are in flight at once, so when the client disconnects
+  the generator stops submitting and the pool is idle again within one
+  chunk per worker.  A progress line goes out every second without
+  matches, so a disconnect is noticed even when nothing matches.
+"""
+
+import logging
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+import time
+from typing import Iterator, NamedTuple, Optional
+
+from .config import get_roots
+from .constants import ALLOWED_EXTENSIONS
+from .policy import get_policy
+
+logger = logging.getLogger(__name__)
+
+GREP_EXTENSIONS: set[str] = ALLOWED_EXTENSIONS & {
+    ".txt", ".md", ".markdown", ".rst", ".log", ".csv", ".tsv",
+    ".py", ".ipynb", ".js", ".ts", ".jsx", ".tsx", ".vue", ".svelte",
+    ".html", ".htm", ".css", ".scss", ".sass", ".less",
+    ".json", ".yaml", ".yml", ".toml", ".xml",
+    ".sql", ".sh", ".bash", ".zsh", ".ps1", ".bat", ".cmd",
+    ".java", ".kt", ".scala", ".cpp", ".c", ".h", ".hpp", ".cc", ".cs", ".vb",
+    ".go", ".rs", ".rb", ".php", ".swift", ".dart", ".r", ".m", ".lua",
+    ".env", ".gitignore", ".dockerignore", ".makefile", ".mk", ".gradle", ".pom",
+    ".eml",
+}
+
+MAX_CONTEXT_LINES = 5
+MAX_MATCHES_PER_FILE = 100
+MAX_LINE_CHARS = 500
+DEFAULT_MAX_RESULTS = 1000
+
+# Files per pool task, and tasks in flight per worker.
+_CHUNK_FILES = 32
+_INFLIGHT_PER_WORKER = 2
+
+# With no match for this long, a progress line is sent.
+_PROGRESS_SECONDS = 1.0
+
+# A NUL byte in this many leading bytes marks a file as binary.
+_BINARY_SNIFF_BYTES = 8192
+
+_GREP_WORKERS = max(2, min(4, (os.cpu_count() or 2) - 1))
+
+
+class GrepOptions(NamedTuple):
+    pattern: str
+    regex: bool = False
+    ignore_case: bool = True
+    context: int = 0
+
+
+# ─── Worker side (runs in the pool processes) ─────────────────────────────────
+
+def compile_pattern(opts: GrepOptions) -> "re.Pattern[bytes] | bytes":
+    needle = opts.pattern.encode("utf-8")
+    if not opts.regex and not opts.ignore_case:
+        return needle
+    if not opts.regex:
+        needle = re.escape(needle)
+    return re.compile(needle, re.MULTILINE | (re.IGNORECASE if opts.ignore_case else 0))
+
+
+def _line_text(raw: bytes) -> str:
+    return raw.rstrip(b"\r").decode("utf-8", "replace")[:MAX_LINE_CHARS]
+
+
+def _grep_one(path: str, matcher, context: int) -> list[dict]:
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm.find(b"\0", 0, _BINARY_SNIFF_BYTES) != -1:
+                return []
+            matches: list[dict] = []
+            size = len(mm)
+            pos = 0
+            line_no, counted_to = 1, 0
+            while pos < size and len(matches) < MAX_MATCHES_PER_FILE:
+                if isinstance(matcher, bytes):
+                    hit = mm.find(matcher, pos)
+                else:
+                    m = matcher.search(mm, pos)
+                    hit = m.start() if m else -1
+                if hit == -1:
+                    break
+                start = mm.rfind(b"\n", 0, hit) + 1
+                end = mm.find(b"\n", hit)
+                end = size if end == -1 else end
+                line_no += mm[counted_to:start].count(b"\n")
+                counted_to = start
+
+                match = {"line": line_no, "text": _line_text(mm[start:end])}
+                if context:
+                    before, b_end = [], start
+                    while len(before) < context and b_end > 0:
+                        b_start = mm.rfind(b"\n", 0, b_end - 1) + 1
+                        before.append(_line_text(mm[b_start:b_end - 1]))
+                        b_end = b_start
+                    after, a_start = [], end + 1
+                    while len(after) < context and a_start < size:
+                        a_end = mm.find(b"\n", a_start)
+                        a_end = size if a_end == -1 else a_end
+                        after.append(_line_text(mm[a_start:a_end]))
+                        a_start = a_end + 1
+                    match["before"] = before[::-1]
+                    match["after"] = after
+                matches.append(match)
+                # One hit per line, like grep.
+                pos = end + 1
+            return matches
+
+
+def _grep_chunk(paths: list[str], opts: GrepOptions) -> list[dict]:
+    matcher = compile_pattern(opts)
+    found = []
+    for path in paths:
+        try:
+            matches = _grep_one(path, matcher, opts.context)
+        except (OSError, ValueError):
+            continue    # vanished, locked or unmappable
+        if matches:
+            found.append({"filepath": path, "matches": matches})
+    return found
+
+
+# ─── Walk ─────────────────────────────────────────────────────────────────────
+
+def _iter_files(roots: list[str]) -> Iterator[str]:
+    policy = get_policy()
+    stack = [(root, policy.relative(root)) for root in roots]
+    while stack:
+        path, rel = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not policy.skips_dir(entry.name, rel):
+                        child_rel = f"{rel}/{entry.name}" if rel else (entry.name if rel == "" else None)
+                        stack.append((entry.path, child_rel))
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                if os.path.splitext(entry.name)[1].lower() not in GREP_EXTENSIONS:
+                    continue
+                if not policy.allows_name(entry.name, rel):
+                    continue
+                if not policy.allows_size(entry.stat(follow_symlinks=False).st_size):
+                    continue
+            except OSError:
+                continue
+            yield entry.path
+
+
+def _chunks(paths: Iterator[str]) -> Iterator[list[str]]:
+    chunk: list[str] = []
+    for path in paths:
+        chunk.append(path)
+        if len(chunk) >= _CHUNK_FILES:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ─── Pool ─────────────────────────────────────────────────────────────────────
+
+_pool_lock = threading.Lock()
+_pool: "multiprocessing.pool.Pool | None" = None
+
+
+def _get_pool() -> "multiprocessing.pool.Pool":
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = multiprocessing.Pool(_GREP_WORKERS)
+        return _pool
+
+
+# ─── Public API ───────────────────────────────────────────────────────────────
+
+def grep(roots: list[str], opts: GrepOptions,
+         max_results: int = DEFAULT_MAX_RESULTS) -> Iterator[dict]:
+    """Yield ``{"filepath", "matches": [...]}`` per matching file as results
+    arrive, then one ``{"done": true, ...}`` summary.  Closing the generator
+    (client disconnect) stops the search."""
+    pool = _get_pool()
+    chunks = _chunks(_iter_files(roots))
+    inflight: list = []
+    started = last_yield = time.monotonic()
+    files = results = 0
+    truncated = False
+    exhausted = False
+
+    while True:
+        while not exhausted and len(inflight) < _GREP_WORKERS * _INFLIGHT_PER_WORKER:
+            chunk = next(chunks, None)
+            if chunk is None:
+                exhausted = True
+                break
+            files += len(chunk)
+            inflight.append(pool.apply_async(_grep_chunk, (chunk, opts)))
+        if not inflight:
+            break
+        # Hand back whichever task finishes first.
+        done = next((r for r in inflight if r.ready()), None)
+        if done is None:
+            inflight[0].wait(0.05)
+            if time.monotonic() - last_yield >= _PROGRESS_SECONDS:
+                # Writing something is how a dropped client gets noticed.
+                last_yield = time.monotonic()
+                yield {"progress": True, "files_searched": files}
+            continue
+        inflight.remove(done)
+        try:
+            found = done.get()
+        except Exception as exc:
+            logger.warning("grep worker failed: %s", exc)
+            continue
+        for item in found:
+            last_yield = time.monotonic()
+            yield item
+            results += len(item["matches"])
+            if results >= max_results:
+                truncated = True
+                break
+        if truncated:
+            break
+
+    yield {
+        "done": True,
+        "files_searched": files,
+        "matches": results,
+        "truncated": truncated,
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+    }
+
+
+def grep_roots(path: Optional[str]) -> Optional[list[str]]:
+    """Roots to search: path (when it is inside a root) or every root."""
+    policy = get_policy()
+    if path:
+        resolved, safe = policy.resolve(path)
+        if not safe or not policy.within_roots(resolved) or not os.path.isdir(resolved):
+            return None
+        return [resolved]
+    return [r for r in get_roots() if os.path.isdir(r)]
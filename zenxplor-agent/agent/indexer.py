@@ -4,15 +4,30 @@ indexer.py — cloud-synced filesystem index for the ZenXplor agent.
 Key improvements:
 - Allowlist-only indexing: only useful day-to-day files are sent.
 - Parallel directory scanning via ThreadPoolExecutor for 3-5× speed boost.
+- Priority-ordered scan: Desktop/Documents/Downloads and recently modified
+  folders are synced before the rest of the tree.
 - Per-batch retries and 401-abort to avoid spamming the backend.
+- Scan workers and uploads are paced by the resource governor.
+- Subtrees where the watcher lost events are re-walked on their own
+  (rescan_subtree) instead of waiting for the next full scan.
 - File size cap so huge media files are skipped.
+- Text snippets of documents and code ride along in each batch
+  (see extractor.py) so content search works for local files.
+- Every synced record is mirrored into the local index; after a scan,
+  duplicate candidates are hashed in stages (see dupes.py).
+- Image EXIF fields and audio/video durations are read from file headers
+  and sent along (see media.py).
+- Files inside zip / tar / 7z archives are synced as children of the
+  archive, listed only when the archive changed (see archives.py).
 """
 
 import logging
 import os
+import stat
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Optional
+from typing import NamedTuple, Optional
 
 try:
     import requests as _requests
@@ -23,12 +38,26 @@ except ImportError:
         "'requests' is not installed. Run: pip install requests>=2.31.0"
     )
 
+from .archives import forget as forget_archive, member_records
 from .config import get_config, get_roots, set_value
-from .constants import (
-    ALLOWED_EXTENSIONS,
-    EXCLUDE_DIRS,
-    MAX_FILE_SIZE_BYTES,
+from .constants import PRIORITY_FOLDERS, RECENT_DIR_DAYS
+from .dupes import find_duplicate_hashes
+from .extractor import attach_snippets, forget as forget_snippet
+from .governor import governor
+from .localdb import db_size_mb, init_db as _init_local_db
+from .localindex import (
+    backfill_tokens,
+    begin_scan,
+    file_count,
+    indexed_paths_under,
+    prune_unseen,
+    prune_vocabulary,
+    record_files,
+    remove_path,
+    search as search_local_index,
 )
+from .media import attach_media, forget as forget_media
+from .policy import get_policy
 
 logger = logging.getLogger(__name__)
 
@@ -48,12 +77,19 @@ def is_scanning() -> bool:
 
 
 def init_db() -> None:
-    pass  # no local DB — all data lives in PostgreSQL
+    # PostgreSQL is the source of truth; the local store mirrors what was
+    # synced and holds the agent's caches.
+    _init_local_db()
+    threading.Thread(target=_backfill_local_index, daemon=True, name="index-backfill").start()
+
+
+def _backfill_local_index() -> None:
+    backfill_tokens()
 
 
 # ─── Auth helpers ──────────────────────────────────────────────────────────────
 
-def _get_sync_credentials() -> tuple[str, str, dict]:
+def get_sync_credentials() -> tuple[str, str, dict]:
     cfg = get_config()
     jwt_token = cfg.get("auth", "jwt_token", fallback="").strip()
     backend_url = cfg.get("auth", "backend_url", fallback="").rstrip("/")
@@ -88,26 +124,7 @@ def _validate_token(jwt_token: str, backend_url: str, sync_cookies: dict) -> boo
         return False
 
 
-# ─── File filtering ────────────────────────────────────────────────────────────
-
-def _is_allowed(fname: str, filepath: str) -> bool:
-    """Return True only if the file should be indexed."""
-    ext = os.path.splitext(fname)[1].lower()
-    if ext not in ALLOWED_EXTENSIONS:
-        return False
-    # Skip symlinks
-    if os.path.islink(filepath):
-        return False
-    # Skip files that are too large
-    try:
-        if os.path.getsize(filepath) > MAX_FILE_SIZE_BYTES:
-            return False
-    except OSError:
-        pass
-    return True
-
-
-# ─── Single-file upsert (used by the realtime watcher) ────────────────────────
+# ─── Realtime upserts (used by the watcher) ───────────────────────────────────
 
 def upsert_file(
     filepath: str,
@@ -117,58 +134,55 @@ def upsert_file(
     last_modified: Optional[float],
     is_folder: bool = False,
 ) -> None:
-    if not _REQUESTS_AVAILABLE:
-        return
-
-    ext = os.path.splitext(filename)[1].lower()
-    if not is_folder and ext not in ALLOWED_EXTENSIONS:
-        return
-
-    jwt_token, backend_url, sync_cookies = _get_sync_credentials()
-    if not jwt_token or not backend_url:
-        logger.warning("upsert_file: no credentials — skipping.")
+    if not is_folder and not get_policy().allows_name(filename):
         return
-
-    payload = [{
+    upsert_files([{
         "filepath": filepath,
         "filename": filename,
         "filetype": filetype or "unknown",
         "filesize": filesize,
         "last_modified": last_modified,
         "is_folder": is_folder,
-    }]
+    }])
 
-    try:
-        resp = _requests.post(
-            f"{backend_url}/search/sync-agent-files",
-            json={"files": payload},
-            cookies=sync_cookies,
-            timeout=10,
-        )
-        if resp.status_code == 401:
-            logger.error("upsert_file: 401 Unauthorized — token expired.")
-        elif resp.status_code not in (200, 201):
-            logger.warning("upsert_file: HTTP %d — %s", resp.status_code, resp.text[:200])
-    except Exception as exc:
-        logger.warning("upsert_file: network error for '%s': %s", filepath, exc)
+
+def upsert_files(records: list[dict]) -> None:
+    """Sync a batch of already-filtered watcher changes in one request."""
+    if not _REQUESTS_AVAILABLE or not records:
+        return
+
+    jwt_token, backend_url, sync_cookies = get_sync_credentials()
+    if not jwt_token or not backend_url:
+        logger.warning("upsert_files: no credentials — skipping %d changes.", len(records))
+        return
+
+    for i in range(0, len(records), _BATCH_SIZE):
+        if not _send_batch(records[i:i + _BATCH_SIZE], backend_url, sync_cookies, "watcher"):
+            return
 
 
 def delete_file(filepath: str) -> None:
+    forget_snippet(filepath)
+    forget_archive(filepath)
+    forget_media(filepath)
+    remove_path(filepath)
     logger.debug("delete_file: %s (backend endpoint not yet implemented)", filepath)
 
 
 def search_files(query: str, limit: int = 50, offset: int = 0,
                  filetype: Optional[str] = None) -> list[dict]:
-    return []
+    return search_local_index(query, limit=limit, offset=offset, filetype=filetype)
 
 
 def get_stats() -> dict:
     cfg = get_config()
+    total_files, total_folders = file_count()
     return {
-        "total_files": 0,
-        "total_folders": 0,
-        "db_size_mb": 0.0,
+        "total_files": total_files,
+        "total_folders": total_folders,
+        "db_size_mb": db_size_mb(),
         "last_scan": cfg.get("indexing", "last_full_scan", fallback=""),
+        "scan_progress": get_scan_progress(),
     }
 
 
@@ -179,6 +193,17 @@ def _send_batch(batch: list[dict], backend_url: str, sync_cookies: dict,
     """POST a batch. Returns False on 401 (caller should abort)."""
     if not batch:
         return True
+    try:
+        # Archive members cannot be opened as files.
+        attach_snippets([r for r in batch if not r.get("archive")])
+    except Exception as exc:
+        logger.warning("Text extraction failed for batch [%s]: %s", label, exc)
+    try:
+        attach_media(batch)
+    except Exception as exc:
+        logger.warning("Media metadata failed for batch [%s]: %s", label, exc)
+    record_files(batch)
+    governor.pace_upload(len(batch))
     try:
         logger.info("Sending batch of %d files [%s]", len(batch), label)
         resp = _requests.post(
@@ -195,42 +220,225 @@ def _send_batch(batch: list[dict], backend_url: str, sync_cookies: dict,
                            resp.status_code, label, resp.text[:300])
     except Exception as exc:
         logger.warning("Network error sending batch [%s]: %s", label, exc)
+
+    members = member_records(batch)
+    for i in range(0, len(members), _BATCH_SIZE):
+        if not _send_batch(members[i:i + _BATCH_SIZE], backend_url, sync_cookies,
+                           f"{label}/archives"):
+            return False
     return True
 
 
-# ─── Per-root scanner (runs in a worker thread) ────────────────────────────────
+# ─── Scan planning (priority tiers) ────────────────────────────────────────────
+#
+# os.walk visits directories in whatever order the filesystem returns them, so
+# a plain per-root walk can spend hours in an old archive before it reaches
+# Desktop.  Instead the scan is split into units, each tagged with a tier:
+#
+#   0  well_known  Desktop / Documents / Downloads of every user under a root
+#   1  recent      directories near the top of a root modified recently
+#   2  rest        every other top-level subtree of each root
+#   3  rescan      subtrees re-walked because the watcher lost events there
+#
+# Units are submitted to the pool in tier order, and every unit prunes the
+# paths claimed by other units, so each directory is walked exactly once.
+
+_TIER_NAMES = ("well_known", "recent", "rest", "rescan")
+_RESCAN_TIER = 3
+
+# Smaller batches for the first tier so results reach the backend immediately.
+_FIRST_TIER_BATCH_SIZE = 50
+
+# How deep below a root to look for recently modified directories.
+_RECENT_SEARCH_DEPTH = 2
+
+
+class _ScanUnit(NamedTuple):
+    path: str
+    tier: int
+    recursive: bool = True
+
 
-def _scan_root(root: str, backend_url: str, sync_cookies: dict) -> tuple[int, bool]:
-    """Walk a single root directory and sync to backend.
+_progress_lock = threading.Lock()
+_progress: dict[str, dict] = {}
 
-    Returns (files_processed, should_abort).
-    should_abort is True if the backend returned 401 (token invalid).
+
+def _reset_progress(units: list[_ScanUnit]) -> None:
+    with _progress_lock:
+        _progress.clear()
+        for tier, name in enumerate(_TIER_NAMES):
+            _progress[name] = {
+                "units_total": sum(1 for u in units if u.tier == tier),
+                "units_done": 0,
+                "files": 0,
+            }
+
+
+def _record_progress(tier: int, files: int = 0, unit_done: bool = False) -> None:
+    with _progress_lock:
+        entry = _progress.get(_TIER_NAMES[tier])
+        if entry is None:
+            return
+        entry["files"] += files
+        if unit_done:
+            entry["units_done"] += 1
+
+
+def get_scan_progress() -> dict:
+    """Return per-tier progress of the current (or last) full scan."""
+    with _progress_lock:
+        return {name: dict(entry) for name, entry in _progress.items()}
+
+
+def _subdirs(path: str) -> list[os.DirEntry]:
+    """Return the non-excluded, non-symlink subdirectories of path."""
+    policy = get_policy()
+    rel = policy.relative(path)
+    try:
+        with os.scandir(path) as it:
+            return [
+                e for e in it
+                if not policy.skips_dir(e.name, rel)
+                and e.is_dir(follow_symlinks=False)
+            ]
+    except OSError:
+        return []
+
+
+def _well_known_dirs(roots: list[str]) -> list[str]:
+    """Locate the PRIORITY_FOLDERS of every user profile inside the roots.
+
+    Looks in the roots themselves, one level below them (C:\\Users\\<name>),
+    the current user's home directory, and their OneDrive-redirected copies.
+    """
+    bases = [os.path.expanduser("~")]
+    for root in roots:
+        bases.append(root)
+        bases.extend(e.path for e in _subdirs(root))
+
+    found: list[str] = []
+    seen: set[str] = set()
+    for base in bases:
+        for parent in (base, os.path.join(base, "OneDrive")):
+            for name in PRIORITY_FOLDERS:
+                candidate = os.path.join(parent, name)
+                key = os.path.normcase(candidate)
+                if key in seen or not os.path.isdir(candidate):
+                    continue
+                if not any(_is_under(candidate, r) for r in roots):
+                    continue
+                seen.add(key)
+                found.append(candidate)
+    return found
+
+
+def _recent_dirs(roots: list[str], exclude: list[str]) -> list[str]:
+    """Return directories near the top of each root modified in the last
+    RECENT_DIR_DAYS days, newest first.
+
+    Ancestors of other candidates (or of the well-known folders) are dropped
+    so a recently touched home directory does not swallow the whole tree.
+    """
+    cutoff = time.time() - RECENT_DIR_DAYS * 86400
+    candidates: list[tuple[float, str]] = []
+
+    level = list(roots)
+    for _ in range(_RECENT_SEARCH_DEPTH):
+        next_level = []
+        for parent in level:
+            for entry in _subdirs(parent):
+                next_level.append(entry.path)
+                try:
+                    mtime = entry.stat(follow_symlinks=False).st_mtime
+                except OSError:
+                    continue
+                if mtime >= cutoff:
+                    candidates.append((mtime, entry.path))
+        level = next_level
+
+    paths = [p for _, p in candidates] + exclude
+    result = []
+    for mtime, path in sorted(candidates, reverse=True):
+        if any(_is_under(p, path) and p != path for p in paths):
+            continue
+        if any(_is_under(path, e) for e in exclude):
+            continue
+        result.append(path)
+    return result
+
+
+def _is_under(path: str, parent: str) -> bool:
+    """True when path equals parent or lies beneath it."""
+    path = os.path.normcase(os.path.abspath(path))
+    parent = os.path.normcase(os.path.abspath(parent))
+    return path == parent or path.startswith(parent.rstrip(os.sep) + os.sep)
+
+
+def _plan_scan(roots: list[str]) -> list[_ScanUnit]:
+    """Split the roots into prioritised scan units (see module notes above)."""
+    well_known = _well_known_dirs(roots)
+    recent = _recent_dirs(roots, well_known)
+
+    units = [_ScanUnit(p, 0) for p in well_known]
+    units += [_ScanUnit(p, 1) for p in recent]
+    seen = {os.path.normcase(u.path) for u in units}
+    for root in roots:
+        # Files directly inside the root, then each top-level subtree.  A
+        # root that is itself a well-known / recent unit already covers its
+        # own files.
+        if os.path.normcase(root) not in seen:
+            units.append(_ScanUnit(root, 2, recursive=False))
+        for entry in _subdirs(root):
+            if os.path.normcase(entry.path) not in seen:
+                units.append(_ScanUnit(entry.path, 2))
+    return units
+
+
+# ─── Unit scanner (runs in a worker thread) ────────────────────────────────────
+
+def _scan_unit(unit: _ScanUnit, claimed: frozenset[str], backend_url: str,
+               sync_cookies: dict, abort: threading.Event) -> int:
+    """Walk one scan unit and sync it to the backend.
+
+    Directories claimed by other units are pruned so nothing is sent twice.
+    Sets ``abort`` if the backend returned 401 (token invalid).
+    Returns the number of files processed.
     """
     total = 0
     batch: list[dict] = []
-
-    for dirpath, dirnames, filenames in os.walk(root, topdown=True, onerror=None):
-        # Prune excluded directories in-place
-        dirnames[:] = [
-            d for d in dirnames
-            if d not in EXCLUDE_DIRS and not os.path.islink(os.path.join(dirpath, d))
-        ]
+    batch_size = _FIRST_TIER_BATCH_SIZE if unit.tier == 0 else _BATCH_SIZE
+    policy = get_policy()
+
+    for dirpath, dirnames, filenames in os.walk(unit.path, topdown=True, onerror=None):
+        # Pause while the machine is busy / on battery, pace otherwise.
+        governor.throttle_scan(abort)
+        if abort.is_set():
+            break
+
+        rel = policy.relative(dirpath)
+        if unit.recursive:
+            # Prune excluded directories and other units' subtrees in-place
+            dirnames[:] = [
+                d for d in dirnames
+                if not policy.skips_dir(d, rel)
+                and not os.path.islink(os.path.join(dirpath, d))
+                and os.path.normcase(os.path.join(dirpath, d)) not in claimed
+            ]
+        else:
+            dirnames[:] = []
 
         for fname in filenames:
-            filepath = os.path.join(dirpath, fname)
-
-            if not _is_allowed(fname, filepath):
+            # Cheap name checks first, then a single lstat.
+            if not policy.allows_name(fname, rel):
                 continue
-
-            try:
-                filesize = os.path.getsize(filepath)
-            except OSError:
-                filesize = None
-
+            filepath = os.path.join(dirpath, fname)
             try:
-                mtime = os.path.getmtime(filepath)
+                st = os.lstat(filepath)
             except OSError:
-                mtime = None
+                continue
+            if stat.S_ISLNK(st.st_mode) or not policy.allows_size(st.st_size):
+                continue
+            filesize, mtime = st.st_size, st.st_mtime
 
             ext = os.path.splitext(fname)[1].lower()
             filetype = ext.lstrip(".") or "unknown"
@@ -245,19 +453,80 @@ def _scan_root(root: str, backend_url: str, sync_cookies: dict) -> tuple[int, bo
             })
             total += 1
 
-            if len(batch) >= _BATCH_SIZE:
+            if len(batch) >= batch_size:
                 ok = _send_batch(batch, backend_url, sync_cookies, dirpath[-60:])
+                _record_progress(unit.tier, files=len(batch))
                 batch.clear()
                 if not ok:
-                    return total, True   # 401 — abort
+                    abort.set()   # 401 — abort
+                    return total
 
-    # Flush remaining
+    # Flush remaining — early tiers reach the backend as soon as they finish.
     if batch:
-        ok = _send_batch(batch, backend_url, sync_cookies, root)
+        ok = _send_batch(batch, backend_url, sync_cookies, unit.path[-60:])
+        _record_progress(unit.tier, files=len(batch))
         if not ok:
-            return total, True
+            abort.set()
+
+    _record_progress(unit.tier, unit_done=True)
+    logger.debug("Scan unit done [%s] %s: %d files",
+                 _TIER_NAMES[unit.tier], unit.path, total)
+    return total
+
 
-    return total, False
+# ─── Targeted rescan ───────────────────────────────────────────────────────────
+
+def rescan_subtree(path: str) -> int:
+    """Re-walk one directory whose realtime events were lost (queue overflow,
+    handler error, dead emitter) and sync it.  Files that vanished meanwhile
+    are dropped from the local index.  Returns the number of files synced.
+    """
+    if not _REQUESTS_AVAILABLE:
+        return 0
+    jwt_token, backend_url, sync_cookies = get_sync_credentials()
+    if not jwt_token or not backend_url:
+        return 0
+
+    for stale in indexed_paths_under(path):
+        if not os.path.lexists(stale):
+            delete_file(stale)
+    if not os.path.isdir(path):
+        delete_file(path)
+        return 0
+
+    logger.info("Rescanning subtree after lost watcher events: %s", path)
+    with _progress_lock:
+        entry = _progress.setdefault(_TIER_NAMES[_RESCAN_TIER],
+                                     {"units_total": 0, "units_done": 0, "files": 0})
+        entry["units_total"] += 1
+    return _scan_unit(_ScanUnit(path, _RESCAN_TIER), frozenset(),
+                      backend_url, sync_cookies, threading.Event())
+
+
+def _prune_local_index(roots: list[str], gen: int) -> None:
+    """Drop index rows for files deleted while nothing was watching (e.g.
+    while the agent was not running), so the index can answer /stat.
+    Anything under a root that scan ``gen`` did not record is gone."""
+    removed = 0
+    for root in roots:
+        for path in prune_unseen(root, gen):
+            forget_snippet(path)
+            forget_archive(path)
+            forget_media(path)
+            removed += 1
+    if removed:
+        logger.info("Pruned %d vanished paths from the local index.", removed)
+    prune_vocabulary()
+
+
+# ─── Duplicate hashing ─────────────────────────────────────────────────────────
+
+def _sync_duplicate_hashes(backend_url: str, sync_cookies: dict) -> None:
+    """Hash duplicate candidates (see dupes.py) and push the new hashes."""
+    records = find_duplicate_hashes()
+    for i in range(0, len(records), _BATCH_SIZE):
+        if not _send_batch(records[i:i + _BATCH_SIZE], backend_url, sync_cookies, "duplicates"):
+            return
 
 
 # ─── Full filesystem scan ──────────────────────────────────────────────────────
@@ -265,8 +534,9 @@ def _scan_root(root: str, backend_url: str, sync_cookies: dict) -> tuple[int, bo
 def full_scan(roots: Optional[list[str]] = None) -> int:
     """Walk every root path and push allowed files to PostgreSQL + Elasticsearch.
 
-    Uses a ThreadPoolExecutor to scan multiple roots simultaneously for
-    significantly faster indexing on machines with many directories.
+    The roots are split into prioritised units (well-known folders, then
+    recently modified directories, then everything else) which a
+    ThreadPoolExecutor works through in that order.
     """
     global _scanning
     if _scanning:
@@ -282,7 +552,7 @@ def full_scan(roots: Optional[list[str]] = None) -> int:
     if roots is None:
         roots = get_roots()
 
-    jwt_token, backend_url, sync_cookies = _get_sync_credentials()
+    jwt_token, backend_url, sync_cookies = get_sync_credentials()
 
     if not jwt_token:
         logger.error(
@@ -301,42 +571,58 @@ def full_scan(roots: Optional[list[str]] = None) -> int:
         _scanning = False
         return 0
 
-    logger.info(
-        "full_scan starting. roots=%s, workers=%d, batch_size=%d, "
-        "only indexing %d allowed extensions.",
-        roots, _SCAN_WORKERS, _BATCH_SIZE, len(ALLOWED_EXTENSIONS),
-    )
-
     start_time = time.monotonic()
     grand_total = 0
+    failed = False
 
     try:
+        roots = [r for r in roots if os.path.isdir(r)]
+        units = _plan_scan(roots)
+        _reset_progress(units)
+        # Each unit skips the subtrees owned by the other units.
+        claimed = frozenset(os.path.normcase(u.path) for u in units if u.recursive)
+        abort = threading.Event()
+        gen = begin_scan()
+
+        logger.info(
+            "full_scan starting. roots=%s, workers=%d, batch_size=%d, "
+            "units=%s, only indexing %d allowed extensions.",
+            roots, _SCAN_WORKERS, _BATCH_SIZE,
+            {name: p["units_total"] for name, p in get_scan_progress().items()},
+            len(get_policy().allowed_extensions),
+        )
+
         with ThreadPoolExecutor(max_workers=_SCAN_WORKERS, thread_name_prefix="zenxplor-scan") as pool:
+            # The executor's queue is FIFO, so submitting in tier order means
+            # well-known folders are always picked up first.
             futures = {
-                pool.submit(_scan_root, root, backend_url, sync_cookies): root
-                for root in roots
-                if os.path.isdir(root)
+                pool.submit(_scan_unit, unit, claimed, backend_url, sync_cookies, abort): unit
+                for unit in units
             }
 
             for future in as_completed(futures):
-                root = futures[future]
+                unit = futures[future]
                 try:
-                    count, abort = future.result()
-                    grand_total += count
-                    logger.info("Root '%s' scanned: %d files.", root, count)
-                    if abort:
-                        logger.error("Aborting remaining roots due to 401 from backend.")
-                        # Cancel pending futures
-                        for f in futures:
-                            f.cancel()
-                        break
+                    grand_total += future.result()
                 except Exception as exc:
-                    logger.exception("Error scanning root '%s': %s", root, exc)
+                    failed = True
+                    logger.exception("Error scanning '%s': %s", unit.path, exc)
+                if abort.is_set():
+                    logger.error("Aborting remaining scan units due to 401 from backend.")
+                    for f in futures:
+                        f.cancel()
+                    break
+
+        if not abort.is_set():
+            # A unit that failed part-way saw only some of its files.
+            if not failed:
+                _prune_local_index(roots, gen)
+            _sync_duplicate_hashes(backend_url, sync_cookies)
 
         elapsed = time.monotonic() - start_time
         logger.info(
-            "full_scan complete. Total files indexed: %d in %.1f seconds.",
-            grand_total, elapsed,
+            "full_scan complete. Total files indexed: %d in %.1f seconds. Progress: %s",
+            grand_total, elapsed, get_scan_progress(),
         )
         set_value("indexing", "last_full_scan", time.strftime("%Y-%m-%d %H:%M:%S"))
 
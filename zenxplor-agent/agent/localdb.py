@@ -0,0 +1,193 @@
+"""
+localdb.py — the agent's on-disk SQLite store (%APPDATA%\\ZenXplor\\index.db).
+
+Holds the local file index and agent-side caches so work done once (e.g.
+text extraction, hashing) survives restarts.  A single connection is shared by all threads and guarded by a
+lock; callers use ``transaction()`` for both reads and writes.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+from .config import get_config
+from .constants import APP_DATA_DIR, DB_PATH
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.RLock()
+_conn: "sqlite3.Connection | None" = None
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Append new entries; never edit one that has shipped.
+_MIGRATIONS: list[str] = [
+    # 1 — text snippets extracted from documents, keyed by the file's identity.
+    """
+    CREATE TABLE IF NOT EXISTS extracted_text (
+        path     TEXT PRIMARY KEY,
+        size     INTEGER NOT NULL,
+        mtime    REAL NOT NULL,
+        snippet  TEXT NOT NULL
+    );
+    """,
+    # 2 — content-addressed extraction cache; identical bytes are parsed once.
+    """
+    ALTER TABLE extracted_text ADD COLUMN content_hash TEXT;
+    CREATE TABLE IF NOT EXISTS extract_cache (
+        content_hash       TEXT PRIMARY KEY,
+        extractor_version  INTEGER NOT NULL,
+        text               TEXT NOT NULL,
+        nbytes             INTEGER NOT NULL,
+        last_used          REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_extract_cache_last_used ON extract_cache (last_used);
+    """,
+    # 3 — local file index (mirror of what was synced) with duplicate hashes.
+    """
+    CREATE TABLE IF NOT EXISTS files (
+        path          TEXT PRIMARY KEY,
+        filename      TEXT NOT NULL,
+        filetype      TEXT,
+        size          INTEGER,
+        mtime         REAL,
+        is_folder     INTEGER NOT NULL DEFAULT 0,
+        partial_hash  TEXT,
+        content_hash  TEXT
+    );
+    CREATE INDEX IF NOT EXISTS ix_files_size ON files (size);
+    """,
+    # 4 — filename tokens and their trigrams for typo-tolerant search (fuzzy.py).
+    """
+    CREATE TABLE IF NOT EXISTS vocab (
+        id     INTEGER PRIMARY KEY,
+        token  TEXT NOT NULL UNIQUE,
+        df     INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS vocab_trigrams (
+        trigram   TEXT NOT NULL,
+        token_id  INTEGER NOT NULL,
+        PRIMARY KEY (trigram, token_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS file_tokens (
+        token_id  INTEGER NOT NULL,
+        path      TEXT NOT NULL,
+        PRIMARY KEY (token_id, path)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS ix_file_tokens_path ON file_tokens (path);
+    """,
+    # 5 — archive members indexed as children of their archive (archives.py).
+    """
+    ALTER TABLE files ADD COLUMN archive TEXT;
+    CREATE INDEX IF NOT EXISTS ix_files_archive ON files (archive);
+    CREATE TABLE IF NOT EXISTS archives (
+        path     TEXT PRIMARY KEY,
+        size     INTEGER NOT NULL,
+        mtime    REAL,
+        members  INTEGER NOT NULL
+    );
+    """,
+    # 6 — header-only image / audio / video metadata (media.py).
+    """
+    CREATE TABLE IF NOT EXISTS media_meta (
+        path     TEXT PRIMARY KEY,
+        size     INTEGER,
+        mtime    REAL,
+        version  INTEGER NOT NULL,
+        meta     TEXT NOT NULL
+    );
+    """,
+    # 7 — running per-directory and per-type usage totals (usage.py).
+    """
+    CREATE TABLE IF NOT EXISTS dir_usage (
+        path   TEXT PRIMARY KEY,
+        size   INTEGER NOT NULL,
+        files  INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_dir_usage_size ON dir_usage (size);
+    CREATE TABLE IF NOT EXISTS ext_usage (
+        filetype  TEXT PRIMARY KEY,
+        size      INTEGER NOT NULL,
+        files     INTEGER NOT NULL
+    );
+    INSERT INTO ext_usage (filetype, size, files)
+    SELECT COALESCE(NULLIF(filetype, ''), 'unknown'), SUM(COALESCE(size, 0)), COUNT(*)
+    FROM files WHERE is_folder = 0 AND archive IS NULL GROUP BY 1;
+    WITH RECURSIVE up(dir, size) AS (
+        SELECT dirname(path), COALESCE(size, 0) FROM files
+        WHERE is_folder = 0 AND archive IS NULL
+        UNION ALL
+        SELECT dirname(dir), size FROM up WHERE dirname(dir) NOT IN (dir, '')
+    )
+    INSERT INTO dir_usage (path, size, files)
+    SELECT dir, SUM(size), COUNT(*) FROM up WHERE dir <> '' GROUP BY dir;
+    """,
+    # 8 — decaying open count per file, a search ranking boost (localindex.py).
+    """
+    ALTER TABLE files ADD COLUMN frecency REAL;
+    """,
+    # 9 — full-scan generation that last recorded each row (localindex.py).
+    """
+    ALTER TABLE files ADD COLUMN scan_gen INTEGER;
+    """,
+    # 10 — content hashes whose extraction keeps failing (extractor.py).
+    """
+    CREATE TABLE IF NOT EXISTS extract_failures (
+        content_hash       TEXT PRIMARY KEY,
+        extractor_version  INTEGER NOT NULL,
+        failures           INTEGER NOT NULL,
+        last_failed        REAL NOT NULL
+    );
+    """,
+]
+
+
+def _connect() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        os.makedirs(APP_DATA_DIR, exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # The page cache is the store's main memory cost; keep it under the cap.
+        cap_mb = get_config().getint("search", "memory_cap_mb", fallback=64)
+        conn.execute(f"PRAGMA cache_size = -{max(cap_mb, 4) * 1024}")
+        # Same parent chain as usage.py walks (migration 7 seeds with it).
+        conn.create_function("dirname", 1, os.path.dirname, deterministic=True)
+        _conn = conn
+    return _conn
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Yield the shared connection inside a transaction (commit on success)."""
+    with _lock:
+        conn = _connect()
+        with conn:
+            yield conn
+
+
+def init_db() -> None:
+    """Create or upgrade the schema."""
+    with transaction() as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, script in enumerate(_MIGRATIONS[version:], start=version + 1):
+            conn.executescript(script)
+            conn.execute(f"PRAGMA user_version = {number}")
+            logger.info("Local store migrated to version %d", number)
+    logger.info("Local store ready at %s", DB_PATH)
+
+
+def prefix_range(prefix: str) -> tuple[str, str]:
+    """Bounds for ``path >= ? AND path < ?`` covering every path starting
+    with prefix; unlike substr() this can use an index on path."""
+    return prefix, prefix + "\U0010ffff"
+
+
+def db_size_mb() -> float:
+    try:
+        return round(os.path.getsize(DB_PATH) / (1024 * 1024), 2)
+    except OSError:
+        return 0.0
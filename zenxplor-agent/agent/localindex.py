@@ -0,0 +1,357 @@
+"""
+localindex.py — the agent's local mirror of every file it has synced.
+
+Rows are written by the scanner and the watcher right before a batch goes
+upstream, so the agent can answer questions about the local disk (duplicate
+candidates, disk usage, …) without walking it again.  Filename tokens for
+typo-tolerant search (fuzzy.py) and the usage totals (usage.py) are
+maintained in the same transactions.
+"""
+
+import logging
+import math
+import os
+import time
+from typing import Optional
+
+from . import fuzzy, usage
+from .config import get_config
+from .localdb import prefix_range, transaction
+
+logger = logging.getLogger(__name__)
+
+# SQLite's default host-parameter limit is 999 on older builds.
+_IN_CHUNK = 900
+
+# Stamped on every row recorded; bumped by begin_scan (see prune_unseen).
+_scan_gen: Optional[int] = None
+
+_UPSERT = """
+INSERT INTO files (path, filename, filetype, size, mtime, is_folder, content_hash, archive, scan_gen)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(path) DO UPDATE SET
+    filename = excluded.filename,
+    scan_gen = excluded.scan_gen,
+    filetype = excluded.filetype,
+    is_folder = excluded.is_folder,
+    archive = excluded.archive,
+    -- Hashes survive only while the file is unchanged.
+    partial_hash = CASE WHEN files.size IS excluded.size AND files.mtime IS excluded.mtime
+                        THEN files.partial_hash END,
+    content_hash = COALESCE(excluded.content_hash,
+                            CASE WHEN files.size IS excluded.size AND files.mtime IS excluded.mtime
+                                 THEN files.content_hash END),
+    size = excluded.size,
+    mtime = excluded.mtime
+"""
+
+
+def record_files(records: list[dict]) -> None:
+    """Upsert sync records into the local index.
+
+    Records without a ``content_hash`` get the one already known for the
+    unchanged file, so resyncs never blank a hash upstream.
+    """
+    if not records:
+        return
+    # A path listed twice must count (and be tokenised) once; the last wins.
+    latest = list({r["filepath"]: r for r in records}.values())
+    with transaction() as conn:
+        gen = _current_gen(conn)
+        # Only new paths need tokens: a path's filename never changes.
+        known: dict[str, tuple] = {}
+        for i in range(0, len(latest), _IN_CHUNK):
+            chunk = [r["filepath"] for r in latest[i:i + _IN_CHUNK]]
+            known.update((row[0], row[1:]) for row in conn.execute(
+                f"SELECT path, filetype, size, is_folder, archive FROM files "
+                f"WHERE path IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ))
+        usage.apply(conn, _usage_changes(latest, known))
+        conn.executemany(_UPSERT, [
+            (r["filepath"], r["filename"], r.get("filetype"), r.get("filesize"),
+             r.get("last_modified"), int(bool(r.get("is_folder"))), r.get("content_hash"),
+             r.get("archive"), gen)
+            for r in latest
+        ])
+        fuzzy.add_names(conn, [(r["filepath"], r["filename"]) for r in latest
+                               if r["filepath"] not in known])
+        missing = [r for r in records if not r.get("content_hash")]
+        hashes = {}
+        for i in range(0, len(missing), _IN_CHUNK):
+            chunk = [r["filepath"] for r in missing[i:i + _IN_CHUNK]]
+            hashes.update(conn.execute(
+                f"SELECT path, content_hash FROM files WHERE content_hash IS NOT NULL "
+                f"AND path IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ))
+    for r in missing:
+        if r["filepath"] in hashes:
+            r["content_hash"] = hashes[r["filepath"]]
+
+
+def _usage_changes(records: list[dict], known: dict[str, tuple]) -> list[usage.Change]:
+    """Size / count deltas of records against their previous rows; only
+    real files (not folders or archive members) take space."""
+    changes = []
+    for r in records:
+        path, filetype = r["filepath"], r.get("filetype")
+        size, files = 0, 0
+        if not r.get("is_folder") and not r.get("archive"):
+            size, files = r.get("filesize") or 0, 1
+        old = known.get(path)
+        if old and not old[2] and not old[3]:
+            if old[0] == filetype:
+                size, files = size - (old[1] or 0), files - 1
+            else:
+                changes.append(usage.Change(path, old[0], -(old[1] or 0), -1))
+        changes.append(usage.Change(path, filetype, size, files))
+    return changes
+
+
+def remove_path(path: str) -> None:
+    """Drop a file, or a folder and everything below it."""
+    prefix = path.rstrip("\\/") + _sep(path)
+    with transaction() as conn:
+        usage.forget(conn, path, prefix)
+        conn.execute(
+            "DELETE FROM files WHERE path = ? OR (path >= ? AND path < ?)",
+            (path, *prefix_range(prefix)),
+        )
+        fuzzy.forget(conn, path, prefix)
+
+
+def _current_gen(conn) -> int:
+    global _scan_gen
+    if _scan_gen is None:
+        _scan_gen = conn.execute("SELECT COALESCE(MAX(scan_gen), 0) FROM files").fetchone()[0]
+    return _scan_gen
+
+
+def begin_scan() -> int:
+    """Start a full-scan generation: rows recorded from now on carry it, so
+    prune_unseen can tell which ones the scan never came across."""
+    global _scan_gen
+    with transaction() as conn:
+        _scan_gen = _current_gen(conn) + 1
+    return _scan_gen
+
+
+def prune_unseen(root: str, gen: int) -> list[str]:
+    """Drop the rows below root that the scan of ``gen`` never recorded
+    (deleted while nothing was watching) with the members of such archives,
+    by path range rather than one lookup per file.  Returns the removed files and folders.
+
+    The scan records files only, so folder rows (from the watcher) are kept
+    while they still exist."""
+    low, high = prefix_range(root.rstrip("\\/") + _sep(root))
+    unseen = "path >= ? AND path < ? AND archive IS NULL AND COALESCE(scan_gen, 0) < ?"
+    params = (low, high, gen)
+    with transaction() as conn:
+        folders = [row[0] for row in conn.execute(
+            f"SELECT path FROM files WHERE {unseen} AND is_folder = 1", params
+        )]
+    kept = [(gen, path) for path in folders if os.path.lexists(path)]
+
+    with transaction() as conn:
+        conn.executemany("UPDATE files SET scan_gen = ? WHERE path = ?", kept)
+        stale = conn.execute(
+            f"SELECT path, filetype, COALESCE(size, 0), is_folder FROM files WHERE {unseen}", params
+        ).fetchall()
+        if not stale:
+            return []
+        usage.apply(conn, [usage.Change(path, filetype, -size, -1)
+                           for path, filetype, size, is_folder in stale if not is_folder])
+        for path, *_ in stale:
+            fuzzy.forget(conn, path, path.rstrip("\\/") + _sep(path))
+        # Members first: their archive rows are still there to match.
+        conn.execute(
+            f"DELETE FROM files WHERE path >= ? AND path < ? "
+            f"AND archive IN (SELECT path FROM files WHERE {unseen})",
+            (low, high, *params),
+        )
+        conn.execute(f"DELETE FROM files WHERE {unseen}", params)
+    return [path for path, *_ in stale]
+
+
+def prune_vocabulary() -> int:
+    """Drop fuzzy-search tokens that no indexed file uses any more."""
+    with transaction() as conn:
+        return fuzzy.prune_vocab(conn)
+
+
+def backfill_tokens() -> None:
+    """Tokenise files indexed before fuzzy search existed, one short
+    transaction per batch so searches and syncs are not held up."""
+    after: Optional[str] = ""
+    while after is not None:
+        with transaction() as conn:
+            after = fuzzy.backfill_batch(conn, after)
+
+
+def lookup(paths: list[str]) -> dict[str, tuple]:
+    """Return {path: (size, mtime, is_folder, archive)} for the paths that
+    are indexed; archive is set for archive members (see archives.py)."""
+    found: dict[str, tuple] = {}
+    with transaction() as conn:
+        for i in range(0, len(paths), _IN_CHUNK):
+            chunk = paths[i:i + _IN_CHUNK]
+            for path, size, mtime, is_folder, archive in conn.execute(
+                f"SELECT path, size, mtime, is_folder, archive FROM files "
+                f"WHERE path IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ):
+                found[path] = (size, mtime, bool(is_folder), archive)
+    return found
+
+
+# Frecency: every open adds 1 to a score that halves every
+# _FRECENCY_HALF_LIFE_DAYS.  The column holds the time at which that score
+# would have decayed to 1,
+#     score(now) = exp(_FRECENCY_RATE * (frecency - now)),
+# so a larger value is a larger score at any moment and nothing is ever
+# re-decayed.  Same model as the backend's frecency.py.
+
+_FRECENCY_HALF_LIFE_DAYS = 14
+_FRECENCY_RATE = math.log(2) / (_FRECENCY_HALF_LIFE_DAYS * 86400)
+
+
+def _bump_frecency(frecency: Optional[float], now: float) -> float:
+    if frecency is None:
+        return now
+    # log(exp(r * (f - now)) + 1) / r + now, without overflow.
+    high, low = max(frecency, now), min(frecency, now)
+    return high + math.log1p(math.exp(_FRECENCY_RATE * (low - high))) / _FRECENCY_RATE
+
+
+def record_access(path: str) -> None:
+    """Count one open of an indexed path towards its search ranking."""
+    with transaction() as conn:
+        row = conn.execute("SELECT frecency FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None:
+            conn.execute("UPDATE files SET frecency = ? WHERE path = ?",
+                         (_bump_frecency(row[0], time.time()), path))
+
+
+def _like_escape(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+_ROW_COLUMNS = "path, filename, filetype, size, mtime, is_folder, content_hash"
+
+# Search rows carry frecency after the record columns, for ranking only.
+_SEARCH_COLUMNS = f"{_ROW_COLUMNS}, frecency"
+
+
+def search(query: str, limit: int = 50, offset: int = 0,
+           filetype: Optional[str] = None) -> list[dict]:
+    """Filename search: every whitespace-separated term must appear in the
+    name (case-insensitive).  Exact names rank first, then prefixes, then
+    other matches; ties go to the most frecent (often and recently opened,
+    see record_access), then the most recently modified.
+
+    Candidates come from the filename tokens (fuzzy.substring_paths) and
+    are then checked against the whole name, so a term only matches within
+    an indexed word, never across a separator or in a single character.
+
+    When that fills less than the requested page, typo-tolerant matches
+    (see fuzzy.py) follow, unless ``[search] fuzzy`` is off.
+    """
+    terms = query.split()
+    if not terms:
+        return []
+    where = " AND ".join(["filename LIKE ? ESCAPE '\\'"] * len(terms))
+    params: list = [f"%{_like_escape(t)}%" for t in terms]
+    if filetype:
+        where += " AND filetype = ?"
+        params.append(filetype.lower().lstrip("."))
+    rows = []
+    with transaction() as conn:
+        paths = fuzzy.substring_paths(conn, query)
+        step = _IN_CHUNK - len(params)
+        for i in range(0, len(paths), step):
+            chunk = paths[i:i + step]
+            rows += conn.execute(
+                f"SELECT {_SEARCH_COLUMNS} FROM files "
+                f"WHERE path IN ({','.join('?' * len(chunk))}) AND {where}",
+                [*chunk, *params],
+            ).fetchall()
+    folded = query.lower()
+    rows.sort(key=lambda row: (0 if row[1].lower() == folded else
+                               1 if row[1].lower().startswith(folded) else 2,
+                               row[7] is None, -(row[7] or 0), -(row[4] or 0)))
+    rows = rows[:offset + limit]
+    if len(rows) < offset + limit and get_config().getboolean("search", "fuzzy", fallback=True):
+        seen = {row[0] for row in rows}
+        fuzzy_rows = _fuzzy_rows(query, filetype, offset + limit)
+        rows += [row for row in fuzzy_rows if row[0] not in seen]
+    return [to_record(row[:-1]) for row in rows[offset:offset + limit]]
+
+
+def _fuzzy_rows(query: str, filetype: Optional[str], needed: int) -> list[tuple]:
+    """Rows matched by fuzzy.match_paths, best (lowest cost) first.  Rows
+    are loaded for whole cost tiers until at least ``needed`` paths are
+    covered (or all of them when filtering by type)."""
+    rows = []
+    with transaction() as conn:
+        scores = fuzzy.match_paths(conn, query)
+        paths = sorted(scores, key=scores.get)
+        if not filetype and len(paths) > needed:
+            cutoff = scores[paths[needed - 1]] if needed > 0 else -1
+            paths = [p for p in paths if scores[p] <= cutoff]
+        for i in range(0, len(paths), _IN_CHUNK):
+            chunk = paths[i:i + _IN_CHUNK]
+            sql = f"SELECT {_SEARCH_COLUMNS} FROM files WHERE path IN ({','.join('?' * len(chunk))})"
+            if filetype:
+                sql += " AND filetype = ?"
+                chunk = [*chunk, filetype.lower().lstrip(".")]
+            rows += conn.execute(sql, chunk).fetchall()
+    rows.sort(key=lambda row: (scores[row[0]], row[7] is None, -(row[7] or 0), -(row[4] or 0)))
+    return rows
+
+
+def _query(sql: str, params: list) -> list[tuple]:
+    with transaction() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def indexed_paths_under(path: str) -> list[str]:
+    """Paths in the local index at or below path, not counting archive
+    members (they go with their archive)."""
+    prefix = path.rstrip("\\/") + _sep(path)
+    with transaction() as conn:
+        return [row[0] for row in conn.execute(
+            "SELECT path FROM files WHERE archive IS NULL "
+            "AND (path = ? OR (path >= ? AND path < ?))",
+            (path, *prefix_range(prefix)),
+        )]
+
+
+def _sep(path: str) -> str:
+    return "\\" if "\\" in path else "/"
+
+
+def to_record(row: tuple) -> dict:
+    """Convert a (path, filename, filetype, size, mtime, is_folder, content_hash)
+    row back into a sync record."""
+    path, filename, filetype, size, mtime, is_folder, content_hash = row
+    record = {
+        "filepath": path,
+        "filename": filename,
+        "filetype": filetype or "unknown",
+        "filesize": size,
+        "last_modified": mtime,
+        "is_folder": bool(is_folder),
+    }
+    if content_hash:
+        record["content_hash"] = content_hash
+    return record
+
+
+def file_count() -> tuple[int, int]:
+    """Return (files, folders) in the local index."""
+    with transaction() as conn:
+        files, folders = conn.execute(
+            "SELECT COALESCE(SUM(is_folder = 0), 0), COALESCE(SUM(is_folder = 1), 0) FROM files"
+        ).fetchone()
+    return files, folders
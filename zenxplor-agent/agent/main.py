@@ -9,9 +9,11 @@ Start-up sequence
     --debug flag is NOT present (keeps console visible during dev).
 4.  Ensure %APPDATA%\\ZenXplor\\ exists.
 5.  Initialise the database stub (no-op for cloud-only mode).
-6.  Run full_scan() in a background daemon thread.
+6.  Run full_scan() in a background daemon thread — deferred after login
+    (startup_delay_seconds) unless the machine has never been scanned.
 7.  Start real-time file watchers.
-8.  Schedule a periodic full re-scan every RESCAN_INTERVAL_HOURS hours.
+8.  Schedule a periodic full re-scan every RESCAN_INTERVAL_HOURS hours,
+    postponed while the resource governor reports the machine as busy.
 9.  Register the agent for Windows startup (first run only).
 10. Start the Flask HTTP server (blocking — last call in the function).
 """
@@ -24,8 +26,9 @@ import sys
 import threading
 import time
 
-from .config import get_roots, is_registered, mark_registered
+from .config import get_config, get_roots, is_registered, mark_registered
 from .constants import APP_DATA_DIR, LOG_PATH, PORT, RESCAN_INTERVAL_HOURS
+from .governor import governor, lower_process_priority
 from .indexer import full_scan, init_db
 from .server import run_server
 from .watcher import start_watchers
@@ -120,13 +123,50 @@ def _register_startup() -> None:
         logger.warning("Could not register startup key: %s", exc)
 
 
+# ─── Initial scan ─────────────────────────────────────────────────────────────
+
+def _initial_scan() -> None:
+    """Run the start-up scan without adding to the post-login rush.
+
+    A machine that has never been scanned starts immediately (time to first
+    search matters most then).  Otherwise the scan waits for
+    ``startup_delay_seconds`` and for the governor to report the machine calm.
+    """
+    cfg = get_config()
+    if cfg.get("indexing", "last_full_scan", fallback=""):
+        delay = cfg.getfloat("governor", "startup_delay_seconds", fallback=300.0)
+        if delay > 0:
+            logger.info("Deferring start-up scan by %.0f s.", delay)
+            time.sleep(delay)
+        governor.wait_until_calm()
+    full_scan()
+
+
 # ─── Periodic scheduler ───────────────────────────────────────────────────────
 
+_rescan_pending = False
+
+
+def _scheduled_rescan() -> None:
+    """Periodic re-scan; postponed (not skipped) while the machine is busy."""
+    global _rescan_pending
+    reason = governor.busy_reason()
+    if reason is not None:
+        if not _rescan_pending:
+            logger.info("Periodic re-scan deferred (%s).", reason)
+        _rescan_pending = True
+        return
+    _rescan_pending = False
+    full_scan()
+
+
 def _run_scheduler() -> None:
     """Run the schedule loop in a background daemon thread."""
-    schedule.every(RESCAN_INTERVAL_HOURS).hours.do(full_scan)
+    schedule.every(RESCAN_INTERVAL_HOURS).hours.do(_scheduled_rescan)
     while True:
         schedule.run_pending()
+        if _rescan_pending:
+            _scheduled_rescan()
         time.sleep(60)
 
 
@@ -147,8 +187,9 @@ def main() -> None:
     # 4. Database initialisation (no-op for cloud-only mode).
     init_db()
 
-    # 5. Initial full scan in background.
-    scan_thread = threading.Thread(target=full_scan, daemon=True, name="full-scan-initial")
+    # 5. Initial full scan in background, at low CPU/IO priority.
+    lower_process_priority()
+    scan_thread = threading.Thread(target=_initial_scan, daemon=True, name="full-scan-initial")
     scan_thread.start()
 
     # 6. Real-time watchers.
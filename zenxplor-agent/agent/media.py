@@ -0,0 +1,235 @@
+"""
+media.py — image and audio/video metadata for search.
+
+Photos and recordings are otherwise only findable by name.  For each one
+a small ``media`` dict rides along in the sync record:
+
+- images: ``width``, ``height`` and, from EXIF, ``taken_at`` (ISO local
+  time), ``camera`` (make and model) and ``has_gps``;
+- audio / video: ``duration`` in seconds.
+
+Only headers are read.  Pillow opens images lazily (size and EXIF come
+from the first few KB), MP4/MOV/M4A durations come from the ``mvhd`` box
+found by seeking over the top-level boxes, WAV from its ``fmt``/``data``
+chunk headers, and other audio through ``mutagen`` when installed.
+
+Reads run on a small thread pool.  Results are cached in the local store
+by (path, size, mtime), so a rescan only reads files that changed.
+"""
+
+import json
+import logging
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+try:
+    from PIL import Image
+    _PIL_AVAILABLE = True
+except ImportError:
+    _PIL_AVAILABLE = False
+
+try:
+    import mutagen
+    _MUTAGEN_AVAILABLE = True
+except ImportError:
+    _MUTAGEN_AVAILABLE = False
+    logging.getLogger(__name__).warning(
+        "'mutagen' is not installed — MP3/FLAC/OGG durations disabled. "
+        "Run: pip install mutagen>=1.47.0"
+    )
+
+from .localdb import transaction
+
+logger = logging.getLogger(__name__)
+
+IMAGE_TYPES = {"jpg", "jpeg", "png", "gif", "webp", "bmp", "tif", "tiff"}
+MP4_TYPES = {"mp4", "mov", "m4a"}
+MUTAGEN_TYPES = {"mp3", "flac", "ogg", "aac"}
+MEDIA_TYPES = IMAGE_TYPES | MP4_TYPES | MUTAGEN_TYPES | {"wav"}
+
+# Bump when the extracted fields change so cached entries are re-read.
+MEDIA_VERSION = 1
+
+_MEDIA_WORKERS = 4
+_pool = ThreadPoolExecutor(max_workers=_MEDIA_WORKERS, thread_name_prefix="media")
+
+_EXIF_IFD = 0x8769
+_GPS_IFD = 0x8825
+_TAG_MAKE = 0x010F
+_TAG_MODEL = 0x0110
+_TAG_DATETIME = 0x0132
+_TAG_DATETIME_ORIGINAL = 0x9003
+
+
+# ─── Readers ──────────────────────────────────────────────────────────────────
+
+def _image_meta(path: str) -> dict:
+    if not _PIL_AVAILABLE:
+        return {}
+    with Image.open(path) as img:
+        meta: dict = {"width": img.width, "height": img.height}
+        exif = img.getexif()
+    if not exif:
+        return meta
+
+    make = str(exif.get(_TAG_MAKE) or "").strip("\0 ")
+    model = str(exif.get(_TAG_MODEL) or "").strip("\0 ")
+    camera = model if model.lower().startswith(make.lower()) else f"{make} {model}".strip()
+    if camera:
+        meta["camera"] = camera
+
+    taken = exif.get_ifd(_EXIF_IFD).get(_TAG_DATETIME_ORIGINAL) or exif.get(_TAG_DATETIME)
+    if taken:
+        try:
+            meta["taken_at"] = datetime.strptime(str(taken).strip("\0 "), "%Y:%m:%d %H:%M:%S").isoformat()
+        except ValueError:
+            pass
+    meta["has_gps"] = bool(exif.get_ifd(_GPS_IFD))
+    return meta
+
+
+def _boxes(fh, start: int, end: int):
+    """Yield (type, payload_start, box_end) for the MP4 boxes in [start, end)."""
+    pos = start
+    while pos + 8 <= end:
+        fh.seek(pos)
+        size, kind = struct.unpack(">I4s", fh.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", fh.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, pos + size
+        pos += size
+
+
+def _mp4_duration(path: str) -> Optional[float]:
+    with open(path, "rb") as fh:
+        end = os.fstat(fh.fileno()).st_size
+        for kind, start, box_end in _boxes(fh, 0, end):
+            if kind != b"moov":
+                continue
+            for inner, payload, _ in _boxes(fh, start, box_end):
+                if inner != b"mvhd":
+                    continue
+                fh.seek(payload)
+                version = fh.read(4)[0]
+                if version == 1:
+                    fh.seek(16, os.SEEK_CUR)
+                    timescale, duration = struct.unpack(">IQ", fh.read(12))
+                else:
+                    fh.seek(8, os.SEEK_CUR)
+                    timescale, duration = struct.unpack(">II", fh.read(8))
+                return duration / timescale if timescale else None
+    return None
+
+
+def _wav_duration(path: str) -> Optional[float]:
+    with open(path, "rb") as fh:
+        if fh.read(12)[8:12] != b"WAVE":
+            return None
+        byte_rate = None
+        while True:
+            header = fh.read(8)
+            if len(header) < 8:
+                return None
+            kind, size = struct.unpack("<4sI", header)
+            if kind == b"fmt ":
+                byte_rate = struct.unpack("<HHII", fh.read(12))[3]
+                fh.seek(size - 12 + (size & 1), os.SEEK_CUR)
+            elif kind == b"data":
+                return size / byte_rate if byte_rate else None
+            else:
+                fh.seek(size + (size & 1), os.SEEK_CUR)
+
+
+def _mutagen_duration(path: str) -> Optional[float]:
+    if not _MUTAGEN_AVAILABLE:
+        return None
+    audio = mutagen.File(path)
+    length = getattr(getattr(audio, "info", None), "length", None)
+    return float(length) if length else None
+
+
+def read_media(path: str, filetype: str) -> dict:
+    """Header-only metadata for one file; {} when there is none."""
+    try:
+        if filetype in IMAGE_TYPES:
+            return _image_meta(path)
+        if filetype in MP4_TYPES:
+            duration = _mp4_duration(path)
+        elif filetype == "wav":
+            duration = _wav_duration(path)
+        else:
+            duration = _mutagen_duration(path)
+    except Exception as exc:
+        logger.debug("Media metadata unreadable for %s: %s", path, exc)
+        return {}
+    return {"duration": round(duration, 2)} if duration else {}
+
+
+# ─── Public API ───────────────────────────────────────────────────────────────
+
+def _wants_media(record: dict) -> bool:
+    return (not record.get("is_folder") and not record.get("archive")
+            and record.get("filetype") in MEDIA_TYPES)
+
+
+def attach_media(batch: list[dict]) -> None:
+    """Add a ``media`` dict to every image / audio / video record that has
+    metadata, from the (path, size, mtime) cache or by reading headers."""
+    wanted = [r for r in batch if _wants_media(r)]
+    if not wanted:
+        return
+
+    paths = [r["filepath"] for r in wanted]
+    with transaction() as conn:
+        cached = {
+            path: (size, mtime, meta)
+            for path, size, mtime, meta in conn.execute(
+                f"SELECT path, size, mtime, meta FROM media_meta "
+                f"WHERE version = ? AND path IN ({','.join('?' * len(paths))})",
+                [MEDIA_VERSION, *paths],
+            )
+        }
+
+    misses = []
+    for r in wanted:
+        hit = cached.get(r["filepath"])
+        if hit and hit[0] == r["filesize"] and hit[1] == r["last_modified"]:
+            meta = json.loads(hit[2])
+            if meta:
+                r["media"] = meta
+        else:
+            misses.append(r)
+    if not misses:
+        return
+
+    started = time.monotonic()
+    metas = list(_pool.map(lambda r: read_media(r["filepath"], r["filetype"]), misses))
+    rows = []
+    for r, meta in zip(misses, metas):
+        if meta:
+            r["media"] = meta
+        rows.append((r["filepath"], r["filesize"], r["last_modified"], MEDIA_VERSION, json.dumps(meta)))
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO media_meta (path, size, mtime, version, meta) "
+            "VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+    logger.debug("Media: %d cached, %d read in %.2fs.",
+                 len(wanted) - len(misses), len(misses), time.monotonic() - started)
+
+
+def forget(filepath: str) -> None:
+    """Drop the cached metadata for a deleted file."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM media_meta WHERE path = ?", (filepath,))
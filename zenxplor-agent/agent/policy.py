@@ -0,0 +1,223 @@
+"""
+policy.py — the compiled path policy shared by the scanner, watcher and server.
+
+Every "should this path be indexed / served?" decision goes through one
+PathPolicy built from:
+
+- EXCLUDE_DIRS, ALLOWED_EXTENSIONS and MAX_FILE_SIZE_BYTES (constants.py);
+- the configured roots, resolved once with realpath;
+- optional user ignore rules — ``ignore`` (one pattern per line) and
+  ``ignore_file`` (a .gitignore-style file) in the ``[indexing]`` section.
+
+Ignore rules follow a .gitignore subset: ``#`` comments, ``!`` negation
+(last match wins), a trailing ``/`` for directories only, and a ``/`` inside
+the pattern to anchor it to the root.  ``*`` may also match across ``/``.
+
+Checks cost O(path depth): the path is split once and each component is
+looked up in sets / precompiled regexes.  ``get_policy()`` rebuilds the
+policy only when config.ini changes.
+"""
+
+import fnmatch
+import logging
+import os
+import re
+import threading
+from typing import NamedTuple, Optional
+
+from .config import get_config
+from .constants import ALLOWED_EXTENSIONS, EXCLUDE_DIRS, MAX_FILE_SIZE_BYTES
+
+logger = logging.getLogger(__name__)
+
+_CASE_FLAGS = re.IGNORECASE if os.name == "nt" else 0
+
+
+class _Rule(NamedTuple):
+    regex: "re.Pattern[str]"
+    negate: bool
+    dir_only: bool
+    anchored: bool
+
+
+def _compile_rule(line: str) -> Optional[_Rule]:
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    anchored = "/" in line
+    line = line.lstrip("/")
+    if not line:
+        return None
+    if line.startswith("**/"):
+        # "**/name" matches at any depth — the same as an unanchored name.
+        line, anchored = line[3:], "/" in line[3:]
+    regex = re.compile(fnmatch.translate(line), _CASE_FLAGS)
+    return _Rule(regex, negate, dir_only, anchored)
+
+
+def _read_rules(cfg) -> list[_Rule]:
+    lines = cfg.get("indexing", "ignore", fallback="").splitlines()
+    ignore_file = cfg.get("indexing", "ignore_file", fallback="").strip()
+    if ignore_file:
+        try:
+            with open(os.path.expanduser(ignore_file), encoding="utf-8") as fh:
+                lines += fh.read().splitlines()
+        except OSError as exc:
+            logger.warning("Cannot read ignore_file %s: %s", ignore_file, exc)
+    return [rule for rule in map(_compile_rule, lines) if rule is not None]
+
+
+def _key(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path)).rstrip("\\/")
+
+
+class PathPolicy:
+    """Immutable allow/deny decisions for one configuration snapshot."""
+
+    def __init__(self, roots: list[str], rules: list[_Rule],
+                 exclude_dirs: set[str] = EXCLUDE_DIRS,
+                 allowed_extensions: set[str] = ALLOWED_EXTENSIONS,
+                 max_file_size: int = MAX_FILE_SIZE_BYTES) -> None:
+        self.exclude_dirs = frozenset(exclude_dirs)
+        self.allowed_extensions = frozenset(allowed_extensions)
+        self.max_file_size = max_file_size
+        self.rules = tuple(rules)
+
+        # Both the configured spelling and the realpath of each root map to
+        # the same root, longest first so nested roots resolve to the inner one.
+        # A root that itself lies in an excluded directory is not a root.
+        keys: set[str] = set()
+        for root in roots:
+            for form in (root, os.path.realpath(root)):
+                key = _key(form)
+                if key and not self._excluded_parts(self._split(os.path.abspath(form)), None):
+                    keys.add(key)
+        self.root_keys = tuple(sorted(keys, key=len, reverse=True))
+
+    # ── Path helpers ─────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _split(path: str) -> list[str]:
+        return [p for p in path.replace("\\", "/").split("/") if p]
+
+    def relative(self, path: str) -> Optional[str]:
+        """Path relative to its root with "/" separators ("" for the root
+        itself), or None when the path is outside every root."""
+        key = _key(path)
+        for root in self.root_keys:
+            if key == root:
+                return ""
+            if key.startswith(root) and key[len(root)] in "\\/":
+                # Keep the original spelling (case) for rule matching.
+                tail = os.path.abspath(path)[len(root) + 1:]
+                return tail.replace("\\", "/").strip("/")
+        return None
+
+    def within_roots(self, path: str) -> bool:
+        return self.relative(path) is not None
+
+    # ── Rules ────────────────────────────────────────────────────────────────
+
+    def _ignored(self, name: str, rel: Optional[str], is_dir: bool) -> bool:
+        ignored = False
+        for rule in self.rules:
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.anchored:
+                if rel is None or not rule.regex.match(rel):
+                    continue
+            elif not rule.regex.match(name):
+                continue
+            ignored = not rule.negate
+        return ignored
+
+    def _excluded_parts(self, parts: list[str], rel_parts: Optional[list[str]],
+                        last_is_dir: bool = True) -> bool:
+        """Check every component; rules see paths relative to the root."""
+        for i, part in enumerate(parts):
+            is_dir = last_is_dir or i < len(parts) - 1
+            if is_dir and part in self.exclude_dirs:
+                return True
+        if not self.rules or rel_parts is None:
+            return False
+        for i, part in enumerate(rel_parts):
+            is_dir = last_is_dir or i < len(rel_parts) - 1
+            if self._ignored(part, "/".join(rel_parts[:i + 1]), is_dir):
+                return True
+        return False
+
+    # ── Public checks ────────────────────────────────────────────────────────
+
+    def skips_dir(self, name: str, rel_parent: Optional[str]) -> bool:
+        """Should the walker prune directory ``name`` inside ``rel_parent``?"""
+        if name in self.exclude_dirs:
+            return True
+        if not self.rules:
+            return False
+        rel = f"{rel_parent}/{name}" if rel_parent else (name if rel_parent == "" else None)
+        return self._ignored(name, rel, True)
+
+    def allows_name(self, name: str, rel_parent: Optional[str] = None) -> bool:
+        """Extension and ignore-rule check for a file in an allowed directory."""
+        if os.path.splitext(name)[1].lower() not in self.allowed_extensions:
+            return False
+        if not self.rules:
+            return True
+        rel = f"{rel_parent}/{name}" if rel_parent else (name if rel_parent == "" else None)
+        return not self._ignored(name, rel, False)
+
+    def allows_size(self, size: Optional[int]) -> bool:
+        return size is None or size <= self.max_file_size
+
+    def is_excluded(self, path: str, is_dir: bool = True) -> bool:
+        """True if any component of path is excluded.  Inside a root, only
+        the components below the root are checked (roots are pre-vetted)."""
+        rel = self.relative(path)
+        if rel is None:
+            return self._excluded_parts(self._split(path), None, is_dir)
+        rel_parts = self._split(rel)
+        return self._excluded_parts(rel_parts, rel_parts, is_dir)
+
+    def allows_file(self, path: str, size: Optional[int] = None) -> bool:
+        """Full check for a single file path (watcher events)."""
+        name = os.path.basename(path)
+        if os.path.splitext(name)[1].lower() not in self.allowed_extensions:
+            return False
+        return self.allows_size(size) and not self.is_excluded(path, is_dir=False)
+
+    def resolve(self, raw_path: str) -> tuple[str, bool]:
+        """realpath a user-supplied path; is_safe is False when it cannot be
+        resolved or contains an excluded component."""
+        try:
+            resolved = os.path.realpath(raw_path)
+        except (ValueError, OSError):
+            return raw_path, False
+        return resolved, not self.is_excluded(resolved)
+
+
+# ─── Shared instance ──────────────────────────────────────────────────────────
+
+_lock = threading.Lock()
+_policy: Optional[PathPolicy] = None
+_policy_cfg = None
+
+
+def get_policy() -> PathPolicy:
+    """Return the policy for the current config, rebuilding it only when
+    config.ini changed (get_config() then returns a new object)."""
+    global _policy, _policy_cfg
+    cfg = get_config()
+    with _lock:
+        if _policy is None or _policy_cfg is not cfg:
+            raw = cfg.get("indexing", "roots", fallback=r"C:\Users")
+            roots = [p.strip() for p in raw.splitlines() if p.strip()]
+            _policy = PathPolicy(roots, _read_rules(cfg))
+            _policy_cfg = cfg
+            logger.debug("Path policy rebuilt: %d roots, %d ignore rules.",
+                         len(_policy.root_keys), len(_policy.rules))
+        return _policy
@@ -6,21 +6,51 @@ Security model:
   • Every endpoint (except /health and /auth) rejects requests whose
     remote_addr is not the loopback address.
   • CORS is restricted to known ZenXplor frontend origins.
+
+Served by cheroot (HTTP/1.1 keep-alive, TLS session reuse, a bounded worker
+pool and socket timeouts); falls back to Flask's development server when
+cheroot is not installed.
 """
 
+import json
 import logging
+import mimetypes
 import os
 import re
+import ssl
 import subprocess
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any
 
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, jsonify, request, send_file, stream_with_context
 from flask_cors import CORS
 
+try:
+    from cheroot import wsgi as _cheroot_wsgi
+    from cheroot.ssl.builtin import BuiltinSSLAdapter as _BuiltinSSLAdapter
+    _CHEROOT_AVAILABLE = True
+except ImportError:
+    _CHEROOT_AVAILABLE = False
+    logging.getLogger(__name__).warning(
+        "'cheroot' is not installed — falling back to Flask's development server. "
+        "Run: pip install cheroot>=10.0.0"
+    )
+
+from .archives import archive_for
 from .config import get_config, get_roots, set_jwt, set_roots
-from .constants import EXCLUDE_DIRS, PORT
+from .constants import PORT
+from .federated import DEFAULT_BUDGET_SECONDS, federated_search
+from .governor import governor
+from .grep import (
+    DEFAULT_MAX_RESULTS,
+    MAX_CONTEXT_LINES,
+    GrepOptions,
+    compile_pattern,
+    grep,
+    grep_roots,
+)
 from .indexer import (
     delete_file,
     full_scan,
@@ -28,7 +58,11 @@ from .indexer import (
     is_scanning,
     search_files,
 )
-from .watcher import are_watchers_active, start_watchers
+from .localindex import lookup as lookup_indexed, record_access
+from .policy import get_policy
+from .thumbnails import THUMBNAIL_EXTENSIONS, get_thumbnail, is_thumbnailable
+from .usage import usage_report
+from .watcher import are_watchers_active, get_watcher_status, is_current, start_watchers
 
 logger = logging.getLogger(__name__)
 
@@ -56,32 +90,14 @@ def _resolve_and_validate(raw_path: str) -> tuple[str, bool]:
 
     Returns (resolved_path, is_safe).  is_safe is False when:
     - The resolved path cannot be computed.
-    - Any path component is in EXCLUDE_DIRS.
+    - Any path component is in EXCLUDE_DIRS or matches an ignore rule.
     """
-    try:
-        resolved = os.path.realpath(raw_path)
-    except (ValueError, OSError):
-        return raw_path, False
-    # Reject paths containing excluded directory names
-    parts = resolved.replace("\\", "/").split("/")
-    if any(part in EXCLUDE_DIRS for part in parts):
-        return resolved, False
-    return resolved, True
+    return get_policy().resolve(raw_path)
 
 
 def _is_within_roots(filepath: str) -> bool:
     """Return True only when filepath is contained within a configured scan root."""
-    for root in get_roots():
-        try:
-            resolved_root = os.path.realpath(root)
-            if not resolved_root:
-                continue
-            common = os.path.commonpath([filepath, resolved_root])
-            if common == resolved_root:
-                return True
-        except (ValueError, OSError):
-            continue
-    return False
+    return get_policy().within_roots(filepath)
 
 
 def _get_safe_path(filepath: str) -> "str | None":
@@ -94,6 +110,25 @@ def _get_safe_path(filepath: str) -> "str | None":
         pass
     return None
 
+
+def _send_local_file(path: str) -> Any:
+    """Stream a file inline with Range and conditional-request support.
+
+    The body is read in chunks by the WSGI server, never loaded whole.  The
+    ETag is derived from size + mtime, so unchanged files answer
+    If-None-Match / If-Range without being read at all.
+    """
+    st = os.stat(path)
+    return send_file(
+        path,
+        mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream",
+        as_attachment=False,  # inline so browser can display in iframe/viewer
+        download_name=os.path.basename(path),
+        conditional=True,
+        etag=f"{st.st_size:x}-{st.st_mtime_ns:x}",
+        last_modified=st.st_mtime,
+    )
+
 # ─── Endpoints ────────────────────────────────────────────────────────────────
 
 @app.route("/health", methods=["GET"])
@@ -157,6 +192,18 @@ def search() -> Any:
 
     filetype = request.args.get("filetype") or None
 
+    if request.args.get("mode") == "federated":
+        # Local hits first, then backend hits within budget_ms, then both merged.
+        try:
+            budget = float(request.args.get("budget_ms", DEFAULT_BUDGET_SECONDS * 1000)) / 1000
+        except ValueError:
+            return jsonify({"error": "budget_ms must be a number"}), 400
+        chunks = federated_search(query, limit=limit, filetype=filetype, budget=budget)
+        return Response(
+            stream_with_context(json.dumps(chunk) + "\n" for chunk in chunks),
+            mimetype="application/x-ndjson",
+        )
+
     results = search_files(query, limit=limit, offset=offset, filetype=filetype)
     enriched = [
         {
@@ -183,7 +230,10 @@ def open_file() -> Any:
     if not raw:
         return jsonify({"error": "filepath is required"}), 400
     
+    # A file inside an archive is shown by selecting the archive.
     safe_path = _get_safe_path(raw)
+    if safe_path is None and archive_for(raw):
+        safe_path = _get_safe_path(archive_for(raw))
     if safe_path is None:
         return jsonify({"error": "Access denied or file not found"}), 403
 
@@ -193,6 +243,7 @@ def open_file() -> Any:
         logger.error("Failed to open file explorer: %s", exc)
         return jsonify({"error": "Could not open file"}), 500
 
+    record_access(raw)
     return jsonify({"opened": True})
 
 
@@ -211,11 +262,7 @@ def download_file() -> Any:
     if not os.path.isfile(safe_path):
         return jsonify({"error": "Not a file"}), 400
 
-    return send_from_directory(
-        os.path.dirname(safe_path),
-        os.path.basename(safe_path),
-        as_attachment=False,  # inline so browser can display in iframe/viewer
-    )
+    return _send_local_file(safe_path)
 
 @app.route("/preview", methods=["GET"])
 def preview_file() -> Any:
@@ -232,27 +279,176 @@ def preview_file() -> Any:
     if not os.path.isfile(safe_path):
         return jsonify({"error": "Not a file"}), 400
 
-    # Serve images inline
-    if ext in [".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp"]:
-        return send_from_directory(
-            os.path.dirname(safe_path),
-            os.path.basename(safe_path),
-            as_attachment=False,
-        )
+    ext = os.path.splitext(safe_path)[1].lower()
 
-    # Serve PDFs inline so the browser can render them in an iframe
-    if ext == ".pdf":
-        from flask import Response
-        import mimetypes
-        with open(safe_path, "rb") as f:
-            data = f.read()
-        response = Response(data, mimetype="application/pdf")
-        response.headers["Content-Disposition"] = "inline; filename=" + os.path.basename(safe_path)
-        return response
+    # Serve images and PDFs inline; PDF viewers fetch pages with Range requests.
+    if ext in [".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp", ".pdf"]:
+        return _send_local_file(safe_path)
 
     return jsonify({"error": "Preview not supported for this file type"}), 415
 
 
+@app.route("/thumbnail", methods=["GET"])
+def thumbnail() -> Any:
+    """Binary thumbnail from the disk cache; ``size`` is rounded up to 128,
+    256 or 800 px.  Originals are streamed when Pillow is unavailable."""
+    if not _is_localhost():
+        return jsonify({"error": "Forbidden"}), 403
+
+    raw = request.args.get("filepath", "").strip()
+    if not raw:
+        return jsonify({"error": "filepath parameter is required"}), 400
+
+    safe_path = _get_safe_path(raw)
+    if safe_path is None:
+        return jsonify({"error": "Access denied or file not found"}), 403
+    if not os.path.isfile(safe_path):
+        return jsonify({"error": "Not a file"}), 400
+
+    if not is_thumbnailable(safe_path):
+        # SVGs scale on their own; raster images land here without Pillow.
+        ext = os.path.splitext(safe_path)[1].lower()
+        if ext == ".svg" or ext in THUMBNAIL_EXTENSIONS:
+            return _send_local_file(safe_path)
+        return jsonify({"error": "Thumbnail not supported for this file type"}), 415
+
+    thumb = get_thumbnail(safe_path, request.args.get("size", type=int))
+    if thumb is None:
+        return jsonify({"error": "Could not generate thumbnail"}), 500
+    thumb_path, mimetype, etag = thumb
+    return send_file(thumb_path, mimetype=mimetype, conditional=True, etag=etag)
+
+
+# Most paths accepted by one /stat call, and threads used to stat the rest.
+_STAT_MAX_PATHS = 1000
+_STAT_WORKERS = 8
+
+
+def _stat_path(path: str) -> dict:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return {"exists": False}
+    return {"exists": True, "size": st.st_size, "mtime": st.st_mtime,
+            "is_folder": os.path.isdir(path), "source": "disk"}
+
+
+@app.route("/stat", methods=["POST"])
+def stat_paths() -> Any:
+    """Existence, size and mtime for a batch of paths in one round-trip.
+
+    Indexed paths the watcher vouches for (``watcher.is_current``) are
+    answered from the local index; everything else is stat'ed in parallel.
+    Paths outside the scan roots (or excluded) come back with
+    ``allowed: false`` and are never touched.
+    """
+    if not _is_localhost():
+        return jsonify({"error": "Forbidden"}), 403
+
+    data = request.get_json(silent=True) or {}
+    paths = data.get("paths")
+    if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+        return jsonify({"error": "paths must be a list of strings"}), 400
+    if len(paths) > _STAT_MAX_PATHS:
+        return jsonify({"error": f"at most {_STAT_MAX_PATHS} paths per request"}), 400
+
+    policy = get_policy()
+    results: dict[str, dict] = {}
+    allowed = []
+    for path in dict.fromkeys(paths):
+        if policy.within_roots(path) and not policy.is_excluded(path):
+            allowed.append(path)
+        else:
+            results[path] = {"allowed": False}
+
+    indexed = lookup_indexed(allowed)
+    to_stat = []
+    for path in allowed:
+        row = indexed.get(path)
+        # Archive members exist while their archive does; other index rows
+        # are only current where the watcher has caught up.
+        if row is None or not ((row[3] and os.path.isfile(row[3])) or is_current(path)):
+            to_stat.append(path)
+            continue
+        size, mtime, is_folder, archive = row
+        results[path] = {"exists": True, "size": size, "mtime": mtime,
+                         "is_folder": is_folder, "source": "index"}
+        if archive:
+            results[path]["archive"] = archive
+
+    if to_stat:
+        with ThreadPoolExecutor(max_workers=min(_STAT_WORKERS, len(to_stat))) as pool:
+            for path, info in zip(to_stat, pool.map(_stat_path, to_stat)):
+                results[path] = info
+
+    return jsonify({"results": results})
+
+
+@app.route("/grep", methods=["GET"])
+def grep_files() -> Any:
+    """Search inside text and code files under the roots (or under ``path``),
+    streaming one NDJSON line per matching file and a final summary."""
+    if not _is_localhost():
+        return jsonify({"error": "Forbidden"}), 403
+
+    pattern = request.args.get("q", "")
+    if not pattern.strip():
+        return jsonify({"error": "q parameter is required"}), 400
+    try:
+        context = min(max(int(request.args.get("context", 0)), 0), MAX_CONTEXT_LINES)
+        max_results = min(max(int(request.args.get("max_results", DEFAULT_MAX_RESULTS)), 1),
+                          DEFAULT_MAX_RESULTS * 10)
+    except ValueError:
+        return jsonify({"error": "context and max_results must be integers"}), 400
+
+    roots = grep_roots(request.args.get("path", "").strip() or None)
+    if roots is None:
+        return jsonify({"error": "Access denied or folder not found"}), 403
+
+    opts = GrepOptions(
+        pattern=pattern,
+        regex=request.args.get("regex", "false").lower() == "true",
+        ignore_case=request.args.get("case_sensitive", "false").lower() != "true",
+        context=context,
+    )
+    try:
+        compile_pattern(opts)
+    except re.error as exc:
+        return jsonify({"error": f"Invalid regex: {exc}"}), 400
+
+    # Closing the generator on disconnect stops the search (see grep.py).
+    results = grep(roots, opts, max_results=max_results)
+    return Response(
+        stream_with_context(json.dumps(item) + "\n" for item in results),
+        mimetype="application/x-ndjson",
+    )
+
+
+_USAGE_MAX_LIMIT = 200
+
+
+@app.route("/usage", methods=["GET"])
+def disk_usage() -> Any:
+    """Largest folders and files and per-type usage, from running totals
+    in the local index — nothing on disk is walked.  ``path`` narrows the
+    report to one folder (as indexed, inside the roots)."""
+    if not _is_localhost():
+        return jsonify({"error": "Forbidden"}), 403
+
+    try:
+        limit = min(max(int(request.args.get("limit", 20)), 1), _USAGE_MAX_LIMIT)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    path = request.args.get("path", "").strip().rstrip("\\/") or None
+    if path:
+        policy = get_policy()
+        if not policy.within_roots(path) or policy.is_excluded(path):
+            return jsonify({"error": "Access denied"}), 403
+
+    return jsonify(usage_report(limit=limit, under=path))
+
+
 @app.route("/scan", methods=["POST"])
 def trigger_scan() -> Any:
     if not _is_localhost():
@@ -279,8 +475,10 @@ def status() -> Any:
             "stats": get_stats(),
             "scanning": is_scanning(),
             "watching": are_watchers_active(),
+            "watcher": get_watcher_status(),
             "last_scan": last_scan,
             "roots": get_roots(),
+            "governor": governor.status(),
         }
     )
 
@@ -316,15 +514,60 @@ def update_roots() -> Any:
 
 # ─── Run ─────────────────────────────────────────────────────────────────────
 
+# Worker threads kept warm, and the ceiling under bursts (previews, downloads).
+_SERVER_THREADS = 8
+_SERVER_MAX_THREADS = 32
+
+# Accepted connections waiting for a worker before the kernel backlog fills.
+_SERVER_QUEUE_SIZE = 64
+
+# Seconds a socket may sit idle (including between keep-alive requests).
+_SERVER_SOCKET_TIMEOUT = 30
+
+
+def _ssl_adapter(cert_file: str, key_file: str) -> "_BuiltinSSLAdapter":
+    adapter = _BuiltinSSLAdapter(cert_file, key_file)
+    ctx = adapter.context
+    ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+    # Resumed sessions (tickets) skip the full handshake when the browser
+    # opens a new connection to the agent.
+    ctx.options &= ~ssl.OP_NO_TICKET
+    if hasattr(ctx, "num_tickets"):
+        ctx.num_tickets = 4
+    return adapter
+
+
 def run_server() -> None:
     from .cert import get_or_create_cert
     cert_file, key_file = get_or_create_cert()
-    
-    logger.info("Starting ZenXplor local API server on 127.0.0.1:%d (HTTPS)", PORT)
-    app.run(
-        host="127.0.0.1", 
-        port=PORT, 
-        threaded=True, 
-        use_reloader=False,
-        ssl_context=(cert_file, key_file)
+
+    if not _CHEROOT_AVAILABLE:
+        logger.info("Starting ZenXplor local API server on 127.0.0.1:%d (HTTPS, dev server)", PORT)
+        app.run(
+            host="127.0.0.1",
+            port=PORT,
+            threaded=True,
+            use_reloader=False,
+            ssl_context=(cert_file, key_file)
+        )
+        return
+
+    server = _cheroot_wsgi.Server(
+        ("127.0.0.1", PORT),
+        app,
+        numthreads=_SERVER_THREADS,
+        max=_SERVER_MAX_THREADS,
+        request_queue_size=_SERVER_QUEUE_SIZE,
+        timeout=_SERVER_SOCKET_TIMEOUT,
+        server_name="zenxplor-agent",
     )
+    server.ssl_adapter = _ssl_adapter(cert_file, key_file)
+
+    logger.info("Starting ZenXplor local API server on 127.0.0.1:%d (HTTPS, %d-%d workers)",
+                PORT, _SERVER_THREADS, _SERVER_MAX_THREADS)
+    try:
+        server.start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
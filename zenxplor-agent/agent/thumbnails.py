@@ -0,0 +1,179 @@
+"""
+thumbnails.py — disk-backed thumbnail cache for image previews.
+
+Grid and preview views ask for a thumbnail, not the original: each image is
+decoded once per (path, mtime, size, requested size) and the result is kept
+under %APPDATA%\\ZenXplor\\thumbs.
+
+- Only a few fixed sizes exist (THUMBNAIL_SIZES); requests are rounded up.
+- JPEGs are decoded at reduced scale (``Image.draft``), which is several
+  times faster than a full decode for large photos.
+- Concurrent requests for the same thumbnail generate it once.
+- The cache is capped at THUMBNAIL_CACHE_MAX_BYTES.  A hit bumps the file's
+  mtime, and the least recently used files are evicted past the cap.
+
+When Pillow is not installed, ``get_thumbnail`` returns None and callers
+serve the original file.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from typing import Optional
+
+try:
+    from PIL import Image, ImageOps
+    _PIL_AVAILABLE = True
+except ImportError:
+    _PIL_AVAILABLE = False
+    logging.getLogger(__name__).warning(
+        "'Pillow' is not installed — image previews will serve originals. "
+        "Run: pip install Pillow>=10.0.0"
+    )
+
+from .constants import THUMBNAIL_DIR
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZES = (128, 256, 800)
+THUMBNAIL_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".tif", ".tiff"}
+THUMBNAIL_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Bump when the output format changes so old thumbnails are not reused.
+_THUMBNAIL_VERSION = 1
+
+# Evict down to this fraction of the cap, so sweeps are not back to back.
+_EVICT_TARGET = 0.9
+
+# Run an eviction sweep after this many new thumbnails.
+_SWEEP_EVERY = 50
+
+_state_lock = threading.Lock()
+_inflight: dict[str, list] = {}      # key -> [lock, waiters]
+_writes_since_sweep = _SWEEP_EVERY   # sweep on the first write after start-up
+
+
+def pick_size(requested: Optional[int]) -> int:
+    """Round a requested edge length up to the nearest fixed size."""
+    if not requested:
+        return THUMBNAIL_SIZES[1]
+    for size in THUMBNAIL_SIZES:
+        if requested <= size:
+            return size
+    return THUMBNAIL_SIZES[-1]
+
+
+def is_thumbnailable(path: str) -> bool:
+    return _PIL_AVAILABLE and os.path.splitext(path)[1].lower() in THUMBNAIL_EXTENSIONS
+
+
+def _cache_key(path: str, st: os.stat_result, size: int) -> str:
+    raw = f"{_THUMBNAIL_VERSION}\0{os.path.normcase(path)}\0{st.st_mtime_ns}\0{st.st_size}\0{size}"
+    return hashlib.sha1(raw.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def _render(src: str, dest: str, size: int) -> str:
+    """Write a thumbnail of src to dest; returns the MIME type written."""
+    with Image.open(src) as img:
+        if img.format == "JPEG":
+            img.draft("RGB", (size, size))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size))
+        if img.mode in ("RGBA", "LA", "P"):
+            img.save(dest, format="PNG", optimize=True)
+            return "image/png"
+        img.convert("RGB").save(dest, format="JPEG", quality=82)
+        return "image/jpeg"
+
+
+def _sweep() -> None:
+    """Evict least recently used thumbnails until the cache fits its cap."""
+    entries = []
+    total = 0
+    for sub in os.scandir(THUMBNAIL_DIR):
+        if not sub.is_dir():
+            continue
+        for entry in os.scandir(sub.path):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+    if total <= THUMBNAIL_CACHE_MAX_BYTES:
+        return
+    target = THUMBNAIL_CACHE_MAX_BYTES * _EVICT_TARGET
+    evicted = 0
+    for _, nbytes, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= nbytes
+        evicted += 1
+    logger.debug("Thumbnail cache: evicted %d files.", evicted)
+
+
+def get_thumbnail(path: str, requested: Optional[int] = None) -> Optional[tuple[str, str, str]]:
+    """Return (thumbnail_path, mimetype, etag) for an image, generating it
+    on a cache miss.  Returns None if the file cannot be thumbnailed."""
+    global _writes_since_sweep
+    if not is_thumbnailable(path):
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    size = pick_size(requested)
+    key = _cache_key(path, st, size)
+    base = os.path.join(THUMBNAIL_DIR, key[:2], key)
+
+    with _state_lock:
+        slot = _inflight.setdefault(key, [threading.Lock(), 0])
+        slot[1] += 1
+    try:
+        with slot[0]:
+            for ext, mimetype in ((".jpg", "image/jpeg"), (".png", "image/png")):
+                cached = base + ext
+                if os.path.exists(cached):
+                    try:
+                        os.utime(cached)   # mark as recently used
+                    except OSError:
+                        pass
+                    return cached, mimetype, key
+
+            os.makedirs(os.path.dirname(base), exist_ok=True)
+            tmp = f"{base}.{threading.get_ident()}.tmp"
+            try:
+                # The image's mode decides the format, and so the suffix.
+                mimetype = _render(path, tmp, size)
+                final = base + (".png" if mimetype == "image/png" else ".jpg")
+                os.replace(tmp, final)
+            except Exception as exc:
+                logger.warning("Thumbnail generation failed for %s: %s", path, exc)
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+                return None
+    finally:
+        with _state_lock:
+            slot[1] -= 1
+            if slot[1] == 0:
+                _inflight.pop(key, None)
+
+    with _state_lock:
+        _writes_since_sweep += 1
+        sweep = _writes_since_sweep >= _SWEEP_EVERY
+        if sweep:
+            _writes_since_sweep = 0
+    if sweep:
+        try:
+            _sweep()
+        except OSError as exc:
+            logger.warning("Thumbnail cache sweep failed: %s", exc)
+    return final, mimetype, key
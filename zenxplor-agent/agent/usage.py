@@ -0,0 +1,169 @@
+"""
+usage.py — disk usage from the local index, without walking the disk again.
+
+Two tables in index.db hold running totals:
+
+- ``dir_usage``  cumulative size and file count for every directory that
+  contains indexed files, at any depth (up to the drive root);
+- ``ext_usage``  size and file count per file type.
+
+They are updated with deltas in the same transactions as the ``files`` rows
+(``localindex.record_files`` / ``remove_path``): a file that grows by 1 MB
+adds 1 MB to each of its ancestors, a removed folder subtracts its subtree
+once.  Folders and archive members (see archives.py) take no space of their
+own and are not counted.  An index that predates the totals is seeded by
+the migration that creates them (localdb.py), before anything else runs.
+"""
+
+import os
+import sqlite3
+from collections import defaultdict
+from typing import Iterable, NamedTuple, Optional
+
+from .config import get_roots
+from .localdb import prefix_range, transaction
+
+
+class Change(NamedTuple):
+    path: str       # file (or removed folder) the delta applies above
+    filetype: Optional[str]
+    size: int
+    files: int
+
+
+_DIR_UPSERT = """
+INSERT INTO dir_usage (path, size, files) VALUES (?, ?, ?)
+ON CONFLICT(path) DO UPDATE SET size = size + excluded.size, files = files + excluded.files
+"""
+
+_EXT_UPSERT = """
+INSERT INTO ext_usage (filetype, size, files) VALUES (?, ?, ?)
+ON CONFLICT(filetype) DO UPDATE SET size = size + excluded.size, files = files + excluded.files
+"""
+
+
+def _ancestors(path: str) -> Iterable[str]:
+    parent = os.path.dirname(path)
+    while parent and parent != path:
+        yield parent
+        path, parent = parent, os.path.dirname(parent)
+
+
+# ─── Maintenance (called inside localindex transactions) ──────────────────────
+
+def apply(conn: sqlite3.Connection, changes: Iterable[Change]) -> None:
+    """Add each change to every ancestor directory of its path and to its
+    file type."""
+    dirs: dict[str, list[int]] = defaultdict(lambda: [0, 0])
+    exts: dict[str, list[int]] = defaultdict(lambda: [0, 0])
+    for change in changes:
+        if not change.size and not change.files:
+            continue
+        for parent in _ancestors(change.path):
+            totals = dirs[parent]
+            totals[0] += change.size
+            totals[1] += change.files
+        totals = exts[change.filetype or "unknown"]
+        totals[0] += change.size
+        totals[1] += change.files
+    if not dirs and not exts:
+        return
+    conn.executemany(_DIR_UPSERT, [(path, size, files) for path, (size, files) in dirs.items()
+                                   if size or files])
+    conn.executemany(_EXT_UPSERT, [(ft, size, files) for ft, (size, files) in exts.items()
+                                   if size or files])
+    emptied = [(path,) for path, (_, files) in dirs.items() if files < 0]
+    if emptied:
+        conn.executemany("DELETE FROM dir_usage WHERE path = ? AND files <= 0", emptied)
+        conn.execute("DELETE FROM ext_usage WHERE files <= 0")
+
+
+def forget(conn: sqlite3.Connection, path: str, prefix: str) -> None:
+    """Subtract path and everything below prefix; must run before their
+    ``files`` rows are deleted."""
+    low, high = prefix_range(prefix)
+    rows = conn.execute(
+        "SELECT filetype, COALESCE(SUM(size), 0), COUNT(*) FROM files "
+        "WHERE is_folder = 0 AND archive IS NULL "
+        "AND (path = ? OR (path >= ? AND path < ?)) GROUP BY filetype",
+        (path, low, high),
+    ).fetchall()
+    conn.execute("DELETE FROM dir_usage WHERE path = ? OR (path >= ? AND path < ?)",
+                 (path, low, high))
+    apply(conn, [Change(path, filetype, -size, -files) for filetype, size, files in rows])
+
+
+# ─── Queries ──────────────────────────────────────────────────────────────────
+
+def _under(path: str) -> tuple[str, str]:
+    sep = "\\" if "\\" in path else "/"
+    return prefix_range(path.rstrip("\\/") + sep)
+
+
+def _top_folders(conn: sqlite3.Connection, limit: int, under: Optional[str]) -> list[dict]:
+    if under:
+        rows = conn.execute(
+            "SELECT path, size, files FROM dir_usage WHERE path >= ? AND path < ? "
+            "ORDER BY size DESC LIMIT ?",
+            (*_under(under), limit),
+        ).fetchall()
+    else:
+        # The roots and the directories above them would always lead.
+        hidden = {a for root in get_roots() for a in (root, *_ancestors(root))}
+        rows = [row for row in conn.execute(
+            "SELECT path, size, files FROM dir_usage ORDER BY size DESC LIMIT ?",
+            (limit + len(hidden),),
+        ) if row[0] not in hidden][:limit]
+    return [{"path": path, "size": size, "files": files} for path, size, files in rows]
+
+
+def _top_files(conn: sqlite3.Connection, limit: int, under: Optional[str]) -> list[dict]:
+    where = "is_folder = 0 AND archive IS NULL AND size IS NOT NULL"
+    params: list = []
+    if under:
+        where += " AND path >= ? AND path < ?"
+        params += _under(under)
+    rows = conn.execute(
+        f"SELECT path, filetype, size, mtime FROM files WHERE {where} "
+        f"ORDER BY size DESC LIMIT ?",
+        [*params, limit],
+    )
+    return [{"path": path, "filetype": ft or "unknown", "size": size, "last_modified": mtime}
+            for path, ft, size, mtime in rows]
+
+
+def _by_extension(conn: sqlite3.Connection, limit: int, under: Optional[str]) -> list[dict]:
+    if under:
+        # A subtree has no running per-type totals; sum its rows instead.
+        rows = conn.execute(
+            "SELECT COALESCE(filetype, 'unknown') AS ft, COALESCE(SUM(size), 0) AS total, "
+            "COUNT(*) FROM files WHERE is_folder = 0 AND archive IS NULL "
+            "AND path >= ? AND path < ? GROUP BY ft ORDER BY total DESC LIMIT ?",
+            (*_under(under), limit),
+        )
+    else:
+        rows = conn.execute(
+            "SELECT filetype, size, files FROM ext_usage ORDER BY size DESC LIMIT ?", (limit,)
+        )
+    return [{"filetype": ft, "size": size, "files": files} for ft, size, files in rows]
+
+
+def _totals(conn: sqlite3.Connection, paths: list[str]) -> list[dict]:
+    found = {path: (size, files) for path, size, files in conn.execute(
+        f"SELECT path, size, files FROM dir_usage WHERE path IN ({','.join('?' * len(paths))})",
+        paths,
+    )} if paths else {}
+    return [{"path": p, "size": found.get(p, (0, 0))[0], "files": found.get(p, (0, 0))[1]}
+            for p in paths]
+
+
+def usage_report(limit: int = 20, under: Optional[str] = None) -> dict:
+    """Totals, largest folders, largest files and per-type usage for every
+    root, or for the folder under."""
+    with transaction() as conn:
+        return {
+            "totals": _totals(conn, [under] if under else get_roots()),
+            "folders": _top_folders(conn, limit, under),
+            "files": _top_files(conn, limit, under),
+            "extensions": _by_extension(conn, limit, under),
+        }
@@ -1,174 +1,417 @@
 """
 watcher.py — real-time filesystem monitoring using the watchdog library.
 
-Watches every root path recursively and keeps the SQLite index up-to-date
-as files are created, modified, moved, or deleted.
+Watches every root path recursively and keeps the index up-to-date as files
+are created, modified, moved, or deleted.
+
+- One Observer holds the watches for all roots.
+- The watchdog handler only enqueues events into a bounded queue; a single
+  consumer thread drains it in short windows, coalesces repeated events for
+  the same path and syncs each window in one request.
+- When events are lost — the queue is full, handling a batch fails, or a
+  watch's emitter thread dies — the affected directory is marked dirty and
+  re-walked with ``rescan_subtree`` once the queue has room again.
+- Counters are exposed through ``get_watcher_status()`` (``GET /status``).
+- ``is_current(path)`` says whether the index can stand in for the disk at
+  a path: its root has a live watch, no dirty (or rescanning) directory
+  covers it and every queued event has been applied.
 """
 
 import logging
 import os
-from typing import Optional
+import queue
+import threading
+import time
+from typing import NamedTuple, Optional
 
 from watchdog.events import FileSystemEventHandler, FileSystemEvent
 from watchdog.observers import Observer
 
-from .constants import ALLOWED_EXTENSIONS, EXCLUDE_DIRS
-from .indexer import upsert_file, delete_file
+from .indexer import delete_file, rescan_subtree, upsert_files
+from .policy import get_policy
 
 logger = logging.getLogger(__name__)
 
+# Events buffered between the observer and the consumer.
+_QUEUE_MAX = 10_000
+
+# A batch closes after this many events or this long after its first event.
+_BATCH_MAX_EVENTS = 500
+_BATCH_WINDOW_SECONDS = 0.5
+
+# Above this many dirty directories, collapse them to their roots.
+_MAX_DIRTY_DIRS = 64
+
+# How often the consumer checks that every watch's emitter is still alive.
+_HEALTH_CHECK_SECONDS = 30.0
+
 
 def _file_meta(filepath: str) -> tuple[Optional[int], Optional[float]]:
     """Return (filesize, mtime) for filepath, silencing OSError."""
     try:
-        filesize = os.path.getsize(filepath)
-    except OSError:
-        filesize = None
-    try:
-        mtime = os.path.getmtime(filepath)
+        st = os.stat(filepath)
     except OSError:
-        mtime = None
-    return filesize, mtime
+        return None, None
+    return st.st_size, st.st_mtime
 
 
 def _should_skip(path: str) -> bool:
     """Return True if the path contains an excluded directory component."""
-    parts = path.replace("\\", "/").split("/")
-    return any(part in EXCLUDE_DIRS for part in parts)
+    return get_policy().is_excluded(path)
+
+
+def _is_under(path: str, parent: str) -> bool:
+    path, parent = os.path.normcase(path), os.path.normcase(parent)
+    return path == parent or path.startswith(parent.rstrip("\\/") + os.sep)
+
+
+def _folder_record(path: str) -> dict:
+    return {
+        "filepath": path,
+        "filename": os.path.basename(path),
+        "filetype": "unknown",
+        "filesize": None,
+        "last_modified": None,
+        "is_folder": True,
+    }
+
+
+def _file_record(path: str) -> Optional[dict]:
+    """Build a sync record once the extension, ignore rules and size cap pass."""
+    policy = get_policy()
+    name = os.path.basename(path)
+    if not policy.allows_name(name, policy.relative(os.path.dirname(path))):
+        return None
+    filesize, mtime = _file_meta(path)
+    if not policy.allows_size(filesize):
+        return None
+    ext = os.path.splitext(name)[1].lower()
+    return {
+        "filepath": path,
+        "filename": name,
+        "filetype": ext.lstrip(".") or "unknown",
+        "filesize": filesize,
+        "last_modified": mtime,
+        "is_folder": False,
+    }
+
+
+class _Change(NamedTuple):
+    kind: str            # "created" | "modified" | "deleted" | "moved"
+    src: str
+    dest: Optional[str]
+    is_dir: bool
 
 
-class FileChangeHandler(FileSystemEventHandler):
-    def on_created(self, event: FileSystemEvent) -> None:
-        path = event.src_path
-        if _should_skip(path):
+class _EnqueueHandler(FileSystemEventHandler):
+    """Runs on watchdog's dispatcher thread — must never block."""
+
+    def __init__(self, service: "WatchService") -> None:
+        super().__init__()
+        self._service = service
+
+    def on_any_event(self, event: FileSystemEvent) -> None:
+        if event.event_type not in ("created", "modified", "deleted", "moved"):
             return
-        if event.is_directory:
-            upsert_file(
-                filepath=path,
-                filename=os.path.basename(path),
-                filetype=None,
-                filesize=None,
-                last_modified=None,
-                is_folder=True,
-            )
-        else:
-            ext = os.path.splitext(path)[1].lower()
-            if ext not in ALLOWED_EXTENSIONS:
-                return
-            filesize, mtime = _file_meta(path)
-            upsert_file(
-                filepath=path,
-                filename=os.path.basename(path),
-                filetype=ext.lstrip(".") if ext else None,
-                filesize=filesize,
-                last_modified=mtime,
-            )
-
-    def on_deleted(self, event: FileSystemEvent) -> None:
-        if _should_skip(event.src_path):
+        if event.event_type == "modified" and event.is_directory:
             return
-        delete_file(event.src_path)
+        self._service.enqueue(_Change(
+            event.event_type,
+            os.fsdecode(event.src_path),
+            os.fsdecode(event.dest_path) if event.event_type == "moved" else None,
+            event.is_directory,
+        ))
 
-    def on_moved(self, event: FileSystemEvent) -> None:
-        if not _should_skip(event.src_path):
-            delete_file(event.src_path)
-        dest = event.dest_path
-        if _should_skip(dest):
-            return
-        if event.is_directory:
-            upsert_file(
-                filepath=dest,
-                filename=os.path.basename(dest),
-                filetype=None,
-                filesize=None,
-                last_modified=None,
-                is_folder=True,
-            )
-        else:
-            ext = os.path.splitext(dest)[1].lower()
-            if ext not in ALLOWED_EXTENSIONS:
+
+class WatchService:
+    """One observer for every root plus the consumer that syncs its events."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[_Change]" = queue.Queue(maxsize=_QUEUE_MAX)
+        self._observer: Optional[Observer] = None
+        self._watches: dict = {}          # root path -> ObservedWatch
+        self._handler = _EnqueueHandler(self)
+        self._dirty: set[str] = set()
+        self._rescanning: set[str] = set()
+        self._consumer: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._last_health_check = 0.0
+        self.metrics = {
+            "events_received": 0,
+            "events_dropped": 0,
+            "batches": 0,
+            "last_batch_events": 0,
+            "batch_errors": 0,
+            "emitter_restarts": 0,
+            "rescans": 0,
+        }
+
+    # ── Observer side ────────────────────────────────────────────────────────
+
+    def enqueue(self, change: _Change) -> None:
+        try:
+            self._queue.put_nowait(change)
+            self.metrics["events_received"] += 1
+        except queue.Full:
+            # Lost event: re-walk its directory once the backlog clears.
+            self.metrics["events_dropped"] += 1
+            self.mark_dirty(change.src if change.is_dir else os.path.dirname(change.src))
+            if change.dest:
+                self.mark_dirty(change.dest if change.is_dir else os.path.dirname(change.dest))
+
+    def mark_dirty(self, path: str) -> None:
+        with self._lock:
+            if any(_is_under(path, d) for d in self._dirty):
                 return
-            filesize, mtime = _file_meta(dest)
-            upsert_file(
-                filepath=dest,
-                filename=os.path.basename(dest),
-                filetype=ext.lstrip(".") if ext else None,
-                filesize=filesize,
-                last_modified=mtime,
-            )
-
-    def on_modified(self, event: FileSystemEvent) -> None:
-        if event.is_directory:
-            return
-        path = event.src_path
-        if _should_skip(path):
+            self._dirty = {d for d in self._dirty if not _is_under(d, path)}
+            self._dirty.add(path)
+            if len(self._dirty) > _MAX_DIRTY_DIRS:
+                roots = {r for r in self._watches for d in self._dirty if _is_under(d, r)}
+                logger.warning("Watcher: %d dirty directories — rescanning roots %s instead.",
+                               len(self._dirty), sorted(roots))
+                self._dirty = roots
+
+    # ── Lifecycle ────────────────────────────────────────────────────────────
+
+    def start(self, roots: list[str]) -> None:
+        """(Re)start watching roots.
+
+        If a root fails to start (e.g. permission denied on a drive root),
+        the error is logged and that root is skipped — remaining roots still
+        get watched.
+        """
+        self.stop_observer()
+        observer = Observer()
+        watches = {}
+        for root in roots:
+            # Resolve and verify path components to guard against traversal
+            resolved_root, safe = get_policy().resolve(root)
+            if not safe:
+                logger.warning("Watcher skipped — excluded path: %s", root)
+                continue
+            if not os.path.isdir(resolved_root):
+                logger.warning("Watcher skipped — path does not exist: %s", root)
+                continue
+            try:
+                watches[resolved_root] = observer.schedule(self._handler, resolved_root, recursive=True)
+                logger.info("Watching: %s", root)
+            except Exception as exc:
+                logger.warning("Could not start watcher for %s: %s", root, exc)
+
+        try:
+            observer.start()
+        except Exception as exc:
+            # The health check retries a dead observer.
+            logger.warning("Could not start observer: %s", exc)
+        with self._lock:
+            self._observer, self._watches = observer, watches
+
+        if self._consumer is None or not self._consumer.is_alive():
+            self._stop.clear()
+            self._consumer = threading.Thread(target=self._consume, daemon=True,
+                                              name="watcher-consumer")
+            self._consumer.start()
+
+    def stop_observer(self) -> None:
+        with self._lock:
+            observer, self._observer, self._watches = self._observer, None, {}
+        if observer is not None:
+            try:
+                observer.stop()
+                observer.join(timeout=5)
+            except Exception as exc:
+                logger.warning("Error stopping observer: %s", exc)
+
+    def stop(self) -> None:
+        self.stop_observer()
+        self._stop.set()
+        if self._consumer is not None:
+            self._consumer.join(timeout=5)
+            self._consumer = None
+
+    def is_active(self) -> bool:
+        observer = self._observer
+        return observer is not None and observer.is_alive() and bool(self._watches)
+
+    def is_current(self, path: str) -> bool:
+        """True when the index reflects path: a live watch covers it, it is
+        not under a dirty directory and no event is still waiting."""
+        if self._queue.unfinished_tasks:
+            return False
+        with self._lock:
+            observer, watches = self._observer, self._watches
+            stale = self._dirty | self._rescanning
+        if observer is None or not observer.is_alive():
+            return False
+        alive = {e.watch for e in observer.emitters if e.is_alive()}
+        if not any(w in alive and _is_under(path, root) for root, w in watches.items()):
+            return False
+        return not any(_is_under(path, d) for d in stale)
+
+    def status(self) -> dict:
+        return {
+            **self.metrics,
+            "active": self.is_active(),
+            "watches": len(self._watches),
+            "queue_depth": self._queue.qsize(),
+            "queue_max": _QUEUE_MAX,
+            "dirty_dirs": len(self._dirty),
+        }
+
+    # ── Consumer side ────────────────────────────────────────────────────────
+
+    def _next_batch(self) -> list[_Change]:
+        try:
+            batch = [self._queue.get(timeout=1.0)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + _BATCH_WINDOW_SECONDS
+        while len(batch) < _BATCH_MAX_EVENTS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _consume(self) -> None:
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch:
+                self.metrics["batches"] += 1
+                self.metrics["last_batch_events"] = len(batch)
+                try:
+                    self._apply(batch)
+                except Exception as exc:
+                    self.metrics["batch_errors"] += 1
+                    logger.warning("Watcher batch of %d events failed: %s", len(batch), exc)
+                    for change in batch:
+                        for path in (change.src, change.dest):
+                            if path:
+                                self.mark_dirty(path if change.is_dir else os.path.dirname(path))
+                finally:
+                    # Marked done only once applied (or marked dirty), for is_current.
+                    for _ in batch:
+                        self._queue.task_done()
+
+            if self._dirty and self._queue.qsize() < _QUEUE_MAX // 2:
+                self._run_rescans()
+            if time.monotonic() - self._last_health_check >= _HEALTH_CHECK_SECONDS:
+                self._check_emitters()
+
+    def _apply(self, batch: list[_Change]) -> None:
+        """Coalesce a batch (last event per path wins) and sync it."""
+        upserts: dict[str, bool] = {}     # path -> is_dir
+        deletes: set[str] = set()
+        for change in batch:
+            if change.kind in ("deleted", "moved"):
+                deletes.add(change.src)
+                upserts.pop(change.src, None)
+            if change.kind == "moved":
+                upserts[change.dest] = change.is_dir
+                deletes.discard(change.dest)
+                if change.is_dir:
+                    # A moved folder's contents never produce their own events.
+                    self.mark_dirty(change.dest)
+            elif change.kind in ("created", "modified"):
+                upserts[change.src] = change.is_dir
+                deletes.discard(change.src)
+
+        for path in deletes:
+            if not _should_skip(path):
+                delete_file(path)
+
+        records = []
+        for path, is_dir in upserts.items():
+            if _should_skip(path):
+                continue
+            record = _folder_record(path) if is_dir else _file_record(path)
+            if record is not None:
+                records.append(record)
+        upsert_files(records)
+
+    def _run_rescans(self) -> None:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            self._rescanning = dirty
+        try:
+            for path in sorted(dirty):
+                if self._stop.is_set():
+                    return
+                if _should_skip(path):
+                    continue
+                self.metrics["rescans"] += 1
+                try:
+                    rescan_subtree(path)
+                except Exception as exc:
+                    logger.warning("Rescan of %s failed: %s", path, exc)
+        finally:
+            with self._lock:
+                self._rescanning = set()
+
+    def _check_emitters(self) -> None:
+        """Re-create watches whose emitter thread died and rescan their roots."""
+        self._last_health_check = time.monotonic()
+        with self._lock:
+            observer, watches = self._observer, dict(self._watches)
+        if observer is None:
             return
-        ext = os.path.splitext(path)[1].lower()
-        if ext not in ALLOWED_EXTENSIONS:
+        if not observer.is_alive():
+            logger.warning("Watcher observer is not running — restarting.")
+            self.metrics["emitter_restarts"] += 1
+            self.start(list(watches))
+            for root in watches:
+                self.mark_dirty(root)
             return
-        filesize, mtime = _file_meta(path)
-        upsert_file(
-            filepath=path,
-            filename=os.path.basename(path),
-            filetype=ext.lstrip(".") if ext else None,
-            filesize=filesize,
-            last_modified=mtime,
-        )
+        alive = {e.watch for e in observer.emitters if e.is_alive()}
+        for root, watch in watches.items():
+            if watch in alive:
+                continue
+            logger.warning("Watcher for %s stopped — restarting and rescanning.", root)
+            self.metrics["emitter_restarts"] += 1
+            try:
+                observer.unschedule(watch)
+            except Exception:
+                pass
+            if not os.path.isdir(root):
+                # The root itself is gone; nothing left to watch.
+                with self._lock:
+                    if self._observer is observer:
+                        self._watches.pop(root, None)
+                continue
+            try:
+                new_watch = observer.schedule(self._handler, root, recursive=True)
+            except Exception as exc:
+                logger.warning("Could not restart watcher for %s: %s", root, exc)
+                continue
+            with self._lock:
+                if self._observer is observer:
+                    self._watches[root] = new_watch
+            self.mark_dirty(root)
 
 
-# Module-level list so the server can check watcher health.
-_observers: list[Observer] = []
+_service = WatchService()
 
 
 def are_watchers_active() -> bool:
-    return any(obs.is_alive() for obs in _observers)
+    return _service.is_active()
+
+
+def is_current(path: str) -> bool:
+    return _service.is_current(path)
+
+
+def get_watcher_status() -> dict:
+    return _service.status()
 
 
 def stop_watchers() -> None:
-    for obs in _observers:
-        try:
-            obs.stop()
-            obs.join(timeout=5)
-        except Exception as exc:
-            logger.warning("Error stopping observer: %s", exc)
-    _observers.clear()
-
-
-def start_watchers(roots: list[str]) -> list[Observer]:
-    """Start one Observer per root path, watching recursively.
-
-    If a root fails to start (e.g. permission denied on a drive root),
-    the error is logged and that root is skipped — remaining roots still
-    get watchers.
-    """
-    global _observers
-    stop_watchers()
-
-    handler = FileChangeHandler()
-    new_observers: list[Observer] = []
-
-    for root in roots:
-        # Resolve and verify path components to guard against traversal
-        resolved_root = os.path.realpath(root)
-        parts = resolved_root.replace("\\", "/").split("/")
-        if any(part in EXCLUDE_DIRS for part in parts):
-            logger.warning("Watcher skipped — excluded path: %s", root)
-            continue
-        # Use pathlib for the existence check so the path object is clearly
-        # derived from the validated resolved_root, not raw user input
-        from pathlib import Path as _Path  # local import to keep top cleaner
-        root_path = _Path(resolved_root)
-        if not root_path.is_dir():
-            logger.warning("Watcher skipped — path does not exist: %s", root)
-            continue
-        obs = Observer()
-        try:
-            obs.schedule(handler, str(root_path), recursive=True)
-            obs.start()
-            new_observers.append(obs)
-            logger.info("Watching: %s", root)
-        except Exception as exc:
-            logger.warning("Could not start watcher for %s: %s", root, exc)
+    _service.stop()
+
 
-    _observers = new_observers
-    return new_observers
+def start_watchers(roots: list[str]) -> None:
+    """Watch every root recursively with a single observer."""
+    _service.start(roots)
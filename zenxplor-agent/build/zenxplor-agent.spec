@@ -8,6 +8,7 @@ a = Analysis(
     hiddenimports=[
         'watchdog.observers.winapi',
         'schedule',
+        'cheroot.ssl.builtin',
         'requests',
         'requests.adapters',
         'requests.auth',
@@ -25,7 +26,7 @@ a = Analysis(
     ],
     hookspath=[],
     runtime_hooks=[],
-    excludes=['tkinter', 'matplotlib', 'numpy', 'PIL'],
+    excludes=['tkinter', 'matplotlib', 'numpy'],   # PIL is needed by python-pptx
     noarchive=False,
 )
 
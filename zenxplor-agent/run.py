@@ -6,7 +6,11 @@ bundles it as __main__.  Relative imports inside `agent/` then work
 correctly because `agent` is treated as a proper package.
 """
 
+import multiprocessing
+
 from agent.main import main
 
 if __name__ == "__main__":
+    # Required for the text-extraction process pool in a frozen .exe.
+    multiprocessing.freeze_support()
     main()